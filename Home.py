@@ -1,6 +1,6 @@
 import streamlit as st
 import hashlib
-from supabase import create_client
+from utils.supabase_client import init_supabase
 
 # QUAN TRỌNG: set_page_config() phải là lệnh Streamlit đầu tiên
 st.set_page_config(page_title="Đăng nhập", layout="wide", page_icon="🔐")
@@ -26,29 +26,6 @@ div[data-testid="stForm"] {
 </style>
 """, unsafe_allow_html=True)
 
-# Hàm kết nối Supabase
-def init_supabase():
-    """Khởi tạo kết nối Supabase"""
-    try:
-        if "supabase" not in st.secrets:
-            st.error("🔑 Không tìm thấy cấu hình Supabase!")
-            return None
-            
-        url = st.secrets["supabase"]["url"]
-        key = st.secrets["supabase"]["key"]
-        
-        if not url or not key:
-            st.error("🔑 URL hoặc key Supabase không hợp lệ!")
-            return None
-            
-        # Kết nối
-        client = create_client(url, key)
-        return client
-            
-    except Exception as e:
-        st.error(f"❌ Không thể kết nối đến Supabase: {e}")
-        return None
-
 # Hàm mã hóa mật khẩu
 def hash_password(password):
     """Mã hóa mật khẩu với SHA-256"""
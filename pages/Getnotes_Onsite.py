@@ -4,17 +4,18 @@ import streamlit as st
 st.set_page_config(page_title="Nhập thông tin Khảo sát", layout="wide", page_icon="📋")
 
 # Tiếp theo mới là import các thư viện
-import os
-import io
 import json
-import base64
-import datetime
 import traceback
 import uuid
 from PIL import Image
-import pillow_heif
-import requests
-from supabase import create_client, Client
+from utils.supabase_client import init_supabase
+from utils.image_upload import normalize_options, thumbnail_url, upload_images_parallel
+from utils.export_image import export_image_from_bytes
+from utils.report_engine import report_file_name
+from utils.downloads import show_export_job
+from utils.report_jobs import get_export_jobs
+from utils.survey_store import SurveyPermissionError, fetch_survey, save_survey
+from utils.invalidation import notify_survey_changed
 
 # --- Kiểm tra đăng nhập ---
 if 'user' not in st.session_state or not st.session_state.user:
@@ -42,6 +43,8 @@ if 'uploaded_images' not in st.session_state:
     st.session_state.uploaded_images = {}
 if 'survey_data' not in st.session_state:
     st.session_state.survey_data = None
+if 'export_jobs' not in st.session_state:
+    st.session_state.export_jobs = {}
 if 'editing_survey_id' not in st.session_state:
     st.session_state.editing_survey_id = None
 if 'panel_notes' not in st.session_state:
@@ -111,171 +114,54 @@ def remove_panel_image(note_id, image_key):
     if note_id in st.session_state.panel_images and image_key in st.session_state.panel_images[note_id]:
         del st.session_state.panel_images[note_id][image_key]
 
-# --- Kết nối Supabase ---
-def init_supabase():
-    """Khởi tạo kết nối Supabase"""
-    try:
-        if "supabase" not in st.secrets:
-            st.error("🔑 Không tìm thấy cấu hình Supabase!")
-            return None
-            
-        url = st.secrets["supabase"]["url"]
-        key = st.secrets["supabase"]["key"]
-        
-        if not url or not key:
-            st.error("🔑 URL hoặc key Supabase không hợp lệ!")
-            return None
-            
-        # Kết nối
-        client = create_client(url, key)
-        
-        # Kiểm tra kết nối
-        try:
-            # Thử truy vấn đơn giản để xác minh kết nối
-            response = client.table('surveys').select('id').limit(1).execute()
-            return client
-        except Exception as e:
-            st.error(f"❌ Kết nối đến Supabase thất bại: {e}")
-            return None
-            
-    except Exception as e:
-        st.error(f"❌ Không thể kết nối đến Supabase: {e}")
-        return None
-
 # --- Hàm xử lý ảnh ---
-def convert_heic_to_jpeg(file_object):
-    """Chuyển đổi ảnh HEIC sang JPEG"""
-    try:
-        heif_file = pillow_heif.read_heif(file_object.read())
-        image = Image.frombytes(
-            heif_file.mode,
-            heif_file.size,
-            heif_file.data,
-            "raw"
-        )
-        output = io.BytesIO()
-        image.save(output, format="JPEG")
-        output.seek(0)
-        return output
-    except Exception as e:
-        st.error(f"❌ Không thể chuyển đổi .heic -> .jpg: {e}")
-        return None
-
-def upload_image_to_supabase(supabase, file_object):
-    """Tải ảnh lên Supabase Storage và trả về URL"""
-    if not supabase or not file_object:
-        return None
-        
-    try:
-        # Sửa tên bucket để khớp với tên hiện có trên Supabase
-        bucket_name = "serveyimages"  # Tên bucket đã tồn tại
-        
-        file_ext = file_object.name.lower().split('.')[-1]
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        # Thêm một mã UUID ngẫu nhiên vào tên file để đảm bảo tính duy nhất
-        random_id = str(uuid.uuid4())[:8]  # Lấy 8 ký tự đầu của UUID
-        unique_filename = f"{timestamp}_{random_id}_{file_object.name.replace(' ', '_')}"
-        
-        # Xử lý file
-        try:
-            # Reset con trỏ file
-            file_object.seek(0)
-            img = Image.open(file_object)
-            
-            # Xử lý HEIC/HEIF hoặc chuyển đổi RGBA sang RGB
-            if file_ext in ['heic', 'heif']:
-                file_object.seek(0)
-                converted_image = convert_heic_to_jpeg(file_object)
-                if not converted_image:
-                    return None
-                file_content = converted_image.getvalue()
-                unique_filename = unique_filename.rsplit('.', 1)[0] + '.jpg'
-            elif img.mode == 'RGBA':
-                # Chuyển đổi RGBA sang RGB với background trắng
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                background.paste(img, mask=img.split()[3])
-                # Lưu dưới dạng JPEG
-                output = io.BytesIO()
-                background.save(output, format='JPEG')
-                output.seek(0)
-                file_content = output.getvalue()
-                unique_filename = unique_filename.rsplit('.', 1)[0] + '.jpg'
-            else:
-                # Các định dạng khác, sử dụng nguyên bản
-                file_object.seek(0)
-                file_content = file_object.read()
-        except Exception as e:
-            # Nếu không thể xử lý ảnh, sử dụng file gốc
-            st.warning(f"Không thể xử lý ảnh. Sử dụng file gốc: {e}")
-            file_object.seek(0)
-            file_content = file_object.read()
-        
-        # Upload lên Supabase Storage
-        supabase.storage.from_(bucket_name).upload(
-            path=unique_filename,
-            file=file_content,
-            file_options={"content-type": f"image/{file_ext if file_ext != 'jpg' else 'jpeg'}"}
-        )
-        
-        # Lấy URL công khai
-        file_url = supabase.storage.from_(bucket_name).get_public_url(unique_filename)
-        return file_url
-        
-    except Exception as e:
-        st.error(f"Lỗi khi tải ảnh lên: {str(e)}")
-        st.error(traceback.format_exc())
-        return None
-
 def process_image_for_export(file):
     """Xử lý file ảnh để sử dụng trong export PDF và Word"""
     if file is None:
         return None
     
-    file_ext = file.name.lower().split('.')[-1]
-    
     try:
-        if file_ext in ['heic', 'heif']:
-            # Reset con trỏ file
-            file.seek(0)
-            converted_image = convert_heic_to_jpeg(file)
-            if converted_image:
-                return Image.open(converted_image)
-            return None
-        else:
-            # Reset con trỏ file
-            file.seek(0)
-            img = Image.open(file)
-            
-            # Chuyển đổi RGBA sang RGB nếu cần
-            if img.mode == 'RGBA':
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                background.paste(img, mask=img.split()[3])
-                return background
-            
-            return img
+        # Reset con trỏ file
+        file.seek(0)
+        # JPEG được dùng nguyên bản, HEIC/PNG/BMP/RGBA được chuyển sang JPEG
+        return export_image_from_bytes(file.read())
     except Exception as e:
         st.error(f"Lỗi xử lý ảnh: {e}")
         return None
 
-def load_image_from_url(url):
-    """Tải và xử lý ảnh từ URL để sử dụng trong export"""
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            img = Image.open(io.BytesIO(response.content))
-            
-            # Chuyển đổi RGBA sang RGB nếu cần
-            if img.mode == 'RGBA':
-                # Tạo background trắng
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                # Paste hình ảnh RGBA lên background
-                background.paste(img, mask=img.split()[3])  # Sử dụng kênh alpha làm mask
-                return background
-            return img
-        return None
-    except Exception as e:
-        st.error(f"Lỗi khi tải ảnh từ URL: {e}")
-        return None
+def start_export(survey_data, fmt):
+    """Gửi job tạo báo cáo chạy nền cho dữ liệu khảo sát vừa lưu"""
+    main_images = None
+    if "image_urls" not in survey_data:
+        # Sử dụng ảnh upload local (cách cũ)
+        main_images = []
+        for i in range(st.session_state.image_uploader_count):
+            if f"image_{i}" in st.session_state.uploaded_images:
+                file = st.session_state.uploaded_images[f"image_{i}"]
+                if file:
+                    # Lưu lại vị trí con trỏ đọc file
+                    current_pos = file.tell()
+                    # Đặt lại vị trí con trỏ file về đầu để đọc
+                    file.seek(0)
+                    img = process_image_for_export(file)
+                    # Khôi phục vị trí con trỏ ban đầu
+                    file.seek(current_pos)
+                    main_images.append(img)
+
+    # Ảnh từ URL (Supabase) được tải song song trong tiến trình tạo báo cáo
+    exported_by = st.session_state.user.get('full_name', '')
+    if fmt == "both":
+        # Tải ảnh và dựng báo cáo một lần cho cả PDF và Word
+        job_id = get_export_jobs().submit_formats(survey_data, ["pdf", "docx"], exported_by, main_images=main_images)
+    else:
+        job_id = get_export_jobs().submit(
+            survey_data,
+            fmt,
+            exported_by,
+            report_file_name(survey_data['header'], fmt),
+            main_images=main_images
+        )
+    st.session_state.export_jobs[fmt] = job_id
 
 # --- Hàm lưu dữ liệu và xuất báo cáo ---
 def save_survey_data_to_supabase(supabase, header_data, detail_data, image_urls=None, panel_notes=None, survey_id=None):
@@ -292,53 +178,28 @@ def save_survey_data_to_supabase(supabase, header_data, detail_data, image_urls=
             "survey_date": header_data["survey_date"],
             "participants": header_data["participants"],
             "surveyors": header_data["surveyors"],
-            "created_by": st.session_state.user["id"],
             "area": detail_data[0],
             "device": detail_data[1],
             "findings": detail_data[2],
             "images": image_urls if image_urls else []
         }
         
-        # Insert hoặc Update dữ liệu trong Supabase
-        if survey_id:
-            # Kiểm tra quyền nếu không phải admin
-            if st.session_state.user["role"] != "admin":
-                response = supabase.table('surveys').select('created_by').eq('id', survey_id).execute()
-                if not response.data or response.data[0]["created_by"] != st.session_state.user["id"]:
-                    st.error("Bạn không có quyền chỉnh sửa khảo sát này!")
-                    return None
-            
-            # Cập nhật khảo sát hiện có
-            response = supabase.table('surveys').update(survey_data).eq('id', survey_id).execute()
-            st.success(f"✅ Khảo sát đã được cập nhật thành công!")
-            
-            # Xóa các panel notes cũ
-            supabase.table('panel_notes').delete().eq('survey_id', survey_id).execute()
-        else:
-            # Tạo khảo sát mới
-            response = supabase.table('surveys').insert(survey_data).execute()
+        # Lưu khảo sát và panel notes trong một transaction (hàm RPC save_survey)
+        saved_id = save_survey(supabase, st.session_state.user, survey_data, panel_notes, survey_id)
         
-        if response.data:
-            survey_id = response.data[0].get('id')
-            
-            # Lưu các panel notes
-            if panel_notes:
-                for note in panel_notes:
-                    note_data = {
-                        "survey_id": survey_id,
-                        "area": note["area"],
-                        "device": note["device"],
-                        "findings": note["findings"],
-                        "images": note["images"],
-                        "created_by": st.session_state.user["id"]
-                    }
-                    supabase.table('panel_notes').insert(note_data).execute()
-            
-            return survey_id
+        if saved_id:
+            # Báo cáo đã tạo trước đó của khảo sát này không còn đúng
+            notify_survey_changed(saved_id)
+            if survey_id:
+                st.success(f"✅ Khảo sát đã được cập nhật thành công!")
+            return saved_id
         else:
             st.error("Không nhận được dữ liệu phản hồi từ Supabase")
             return None
             
+    except SurveyPermissionError as e:
+        st.error(str(e))
+        return None
     except Exception as e:
         st.error(f"Lỗi khi lưu dữ liệu vào Supabase: {str(e)}")
         st.error(traceback.format_exc())
@@ -359,433 +220,12 @@ def delete_survey_from_supabase(supabase, survey_id):
         
         # Xóa khảo sát (các panel_notes sẽ tự động bị xóa do có constraint ON DELETE CASCADE)
         response = supabase.table('surveys').delete().eq('id', survey_id).execute()
+        notify_survey_changed(survey_id)
         return True
     except Exception as e:
         st.error(f"Lỗi khi xóa khảo sát: {str(e)}")
         return False
 
-def get_download_link(file_content, file_name, display_text):
-    """Tạo link tải xuống cho các file được tạo."""
-    b64 = base64.b64encode(file_content).decode()
-    href = f'<a href="data:application/octet-stream;base64,{b64}" download="{file_name}" class="download-button">{display_text}</a>'
-    return href
-
-def export_to_pdf(survey_data, images, panel_notes=None):
-    """Tạo file PDF từ dữ liệu khảo sát."""
-    # Import các module cần thiết
-    from reportlab.lib.pagesizes import A4
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image as RLImage
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib import colors
-    from reportlab.pdfbase import pdfmetrics
-    from reportlab.pdfbase.ttfonts import TTFont
-    import os
-    
-    buffer = io.BytesIO()
-    
-    # Đăng ký font hỗ trợ tiếng Việt
-    try:
-        # Thiết lập các đường dẫn font có thể có
-        current_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in globals() else os.getcwd()
-        
-        # Danh sách font để thử
-        font_files = [
-            ('TimesTiengViet', 'times.ttf', 'Times New Roman'),
-            ('Arial', 'arial.ttf', 'Arial'),
-            ('DejaVuSans', 'DejaVuSans.ttf', 'DejaVuSans'),
-        ]
-        
-        # Các đường dẫn có thể chứa font
-        possible_paths = [
-            os.path.join(current_dir, 'assets', 'fonts'),
-            os.path.join(current_dir, 'assets'),
-            current_dir,
-            '/usr/share/fonts/truetype',
-            '/usr/share/fonts/truetype/dejavu',
-            '/usr/share/fonts/TTF',
-            'C:\\Windows\\Fonts',  # Đường dẫn Windows
-        ]
-        
-        # Thử đăng ký từng font
-        font_registered = False
-        font_name = 'Times-Roman'  # Font mặc định của ReportLab
-        
-        for font_key, font_file, display_name in font_files:
-            if font_registered:
-                break
-                
-            for path in possible_paths:
-                try:
-                    full_path = os.path.join(path, font_file)
-                    if os.path.exists(full_path):
-                        pdfmetrics.registerFont(TTFont(font_key, full_path))
-                        font_name = font_key
-                        font_registered = True
-                        st.success(f"Đã đăng ký font {display_name} từ {full_path}")
-                        break
-                except Exception as e:
-                    continue
-        
-        # Nếu không đăng ký được font tùy chỉnh, sử dụng font có sẵn trong ReportLab
-        if not font_registered:
-            font_name = 'Times-Roman'  # Times-Roman là font có sẵn trong ReportLab, tương tự Times New Roman
-            st.info(f"Sử dụng font mặc định: {font_name}")
-    except Exception as e:
-        st.write(f"Lỗi khi đăng ký font: {e}")
-        font_name = 'Times-Roman'  # Mặc định ở đây cũng là Times-Roman
-    
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    styles = getSampleStyleSheet()
-    
-    # Tạo style cho tiêu đề và nội dung
-    title_style = ParagraphStyle(
-        'Title',
-        parent=styles['Heading1'],
-        fontName=font_name,
-        fontSize=16,
-        alignment=1,
-        spaceAfter=12
-    )
-    
-    normal_style = ParagraphStyle(
-        'Normal',
-        parent=styles['Normal'],
-        fontName=font_name,
-        fontSize=10,
-        spaceAfter=6
-    )
-    
-    content = []
-    
-    # Tiêu đề báo cáo
-    content.append(Paragraph("BÁO CÁO KHẢO SÁT ISO 50001:2018", title_style))
-    content.append(Spacer(1, 20))
-    
-    # Thông tin công ty và khảo sát
-    header_data = [
-        ["Tên công ty:", survey_data['header']['company_name']],
-        ["Địa chỉ:", survey_data['header']['address']],
-        ["Số điện thoại:", survey_data['header']['phone']],
-        ["Ngày khảo sát:", survey_data['header']['survey_date']],
-    ]
-    
-    t = Table(header_data, colWidths=[120, 300])
-    t.setStyle(TableStyle([
-        ('FONT', (0, 0), (-1, -1), font_name, 10),
-        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-    ]))
-    content.append(t)
-    content.append(Spacer(1, 10))
-    
-    # Người tham gia
-    content.append(Paragraph("Thành viên tham gia:", ParagraphStyle('Heading2', parent=styles['Heading2'], fontName=font_name)))
-    participants = survey_data['header']['participants'].split('\n')
-    for p in participants:
-        if p.strip():
-            content.append(Paragraph(f"• {p}", normal_style))
-    content.append(Spacer(1, 10))
-    
-    # Người khảo sát
-    content.append(Paragraph("Người khảo sát:", ParagraphStyle('Heading2', parent=styles['Heading2'], fontName=font_name)))
-    surveyors = survey_data['header']['surveyors'].split('\n')
-    for s in surveyors:
-        if s.strip():
-            content.append(Paragraph(f"• {s}", normal_style))
-    content.append(Spacer(1, 20))
-    
-    # Panel Notes - Hiển thị ngay từ panel note đầu tiên
-    if panel_notes and len(panel_notes) > 0:
-        # Bắt đầu với Panel Note đầu tiên thay vì CHI TIẾT KHẢO SÁT
-        for note_idx, note in enumerate(panel_notes):
-            if note_idx == 0:
-                content.append(Paragraph(f"KHU VỰC KHẢO SÁT #{note_idx+1}", ParagraphStyle('Heading2', parent=styles['Heading2'], fontName=font_name, alignment=1)))
-            else:
-                content.append(Paragraph(f"KHU VỰC KHẢO SÁT #{note_idx+1}", ParagraphStyle('Heading2', parent=styles['Heading2'], fontName=font_name, alignment=1)))
-            
-            content.append(Spacer(1, 10))
-            
-            note_data = [
-                ["Khu vực:", note['area']],
-                ["Thiết bị:", note['device']],
-                ["Mô tả tổn thất/thông số kỹ thuật:", note['findings']],
-            ]
-            
-            t = Table(note_data, colWidths=[150, 270])
-            t.setStyle(TableStyle([
-                ('FONT', (0, 0), (-1, -1), font_name, 10),
-                ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-            ]))
-            content.append(t)
-            content.append(Spacer(1, 10))
-            
-            # Hình ảnh của panel note
-            if note.get('images') and len(note['images']) > 0:
-                content.append(Paragraph(f"ẢNH KHẢO SÁT KHU VỰC #{note_idx+1}", ParagraphStyle('Heading3', parent=styles['Heading3'], fontName=font_name, alignment=1)))
-                content.append(Spacer(1, 10))
-                
-                for img_idx, img_url in enumerate(note['images']):
-                    img = load_image_from_url(img_url)
-                    if img:
-                        # Chuyển đổi sang RGB nếu là RGBA
-                        if img.mode == 'RGBA':
-                            background = Image.new('RGB', img.size, (255, 255, 255))
-                            background.paste(img, mask=img.split()[3])
-                            img = background
-                        
-                        # Chuyển đổi PIL Image sang bytesIO để ReportLab có thể sử dụng
-                        img_byte_arr = io.BytesIO()
-                        img.save(img_byte_arr, format='JPEG')
-                        img_byte_arr.seek(0)
-                        
-                        # Thêm caption cho hình ảnh
-                        content.append(Paragraph(f"Hình {note_idx+1}.{img_idx+1}:", normal_style))
-                        
-                        # Tính toán kích thước ảnh phù hợp
-                        img_width, img_height = img.size
-                        ratio = min(400/img_width, 300/img_height) if img_width > 0 and img_height > 0 else 1
-                        new_width = img_width * ratio
-                        new_height = img_height * ratio
-                        
-                        # Thêm hình ảnh vào tài liệu PDF
-                        img_reportlab = RLImage(img_byte_arr, width=new_width, height=new_height)
-                        content.append(img_reportlab)
-                        content.append(Spacer(1, 10))
-            
-            content.append(Spacer(1, 10))
-    else:
-        # Nếu không có panel notes, hiển thị thông tin từ detail_data
-        content.append(Paragraph("KHU VỰC KHẢO SÁT #1", ParagraphStyle('Heading2', parent=styles['Heading2'], fontName=font_name, alignment=1)))
-        content.append(Spacer(1, 10))
-        
-        detail_data = [
-            ["Khu vực:", survey_data['detail'][0]],
-            ["Thiết bị:", survey_data['detail'][1]],
-            ["Mô tả tổn thất/thông số kỹ thuật:", survey_data['detail'][2]],
-        ]
-        
-        t = Table(detail_data, colWidths=[150, 270])
-        t.setStyle(TableStyle([
-            ('FONT', (0, 0), (-1, -1), font_name, 10),
-            ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ]))
-        content.append(t)
-        content.append(Spacer(1, 20))
-        
-        # Hình ảnh
-        if images:
-            content.append(Paragraph("ẢNH KHẢO SÁT KHU VỰC #1", ParagraphStyle('Heading2', parent=styles['Heading2'], fontName=font_name, alignment=1)))
-            content.append(Spacer(1, 10))
-            
-            for i, img in enumerate(images):
-                if img:
-                    # Chuyển đổi sang RGB nếu là RGBA
-                    if img.mode == 'RGBA':
-                        background = Image.new('RGB', img.size, (255, 255, 255))
-                        background.paste(img, mask=img.split()[3])
-                        img = background
-                    
-                    # Chuyển đổi PIL Image sang bytesIO để ReportLab có thể sử dụng
-                    img_byte_arr = io.BytesIO()
-                    img.save(img_byte_arr, format='JPEG')
-                    img_byte_arr.seek(0)
-                    
-                    # Thêm caption cho hình ảnh
-                    content.append(Paragraph(f"Hình 1.{i+1}:", normal_style))
-                    
-                    # Tính toán kích thước ảnh phù hợp (tối đa 400x300, giữ tỷ lệ)
-                    img_width, img_height = img.size
-                    ratio = min(400/img_width, 300/img_height) if img_width > 0 and img_height > 0 else 1
-                    new_width = img_width * ratio
-                    new_height = img_height * ratio
-                    
-                    # Thêm hình ảnh vào tài liệu PDF
-                    img_reportlab = RLImage(img_byte_arr, width=new_width, height=new_height)
-                    content.append(img_reportlab)
-                    content.append(Spacer(1, 10))
-    
-    # Thêm ngày xuất báo cáo
-    current_date = datetime.datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-    content.append(Spacer(1, 20))
-    content.append(Paragraph(f"Báo cáo được xuất ngày: {current_date}", normal_style))
-    content.append(Paragraph(f"Người xuất báo cáo: {st.session_state.user.get('full_name', '')}", normal_style))
-    
-    doc.build(content)
-    pdf = buffer.getvalue()
-    buffer.close()
-    return pdf
-
-def export_to_word(survey_data, images, panel_notes=None):
-    """Tạo file Word từ dữ liệu khảo sát."""
-    # Import các module cần thiết
-    from docx import Document
-    from docx.shared import Inches, Pt, RGBColor
-    from docx.enum.text import WD_ALIGN_PARAGRAPH
-    
-    doc = Document()
-    
-    # Thiết lập font và cỡ chữ mặc định
-    style = doc.styles['Normal']
-    style.font.name = 'Times New Roman'
-    style.font.size = Pt(12)
-    
-    # Tiêu đề
-    heading = doc.add_heading('BÁO CÁO KHẢO SÁT ISO 50001', level=1)
-    heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    
-    # Thông tin công ty và khảo sát
-    table = doc.add_table(rows=4, cols=2)
-    table.style = 'Table Grid'
-    
-    rows = table.rows
-    cells = rows[0].cells
-    cells[0].text = 'Tên công ty:'
-    cells[1].text = survey_data['header']['company_name']
-    
-    cells = rows[1].cells
-    cells[0].text = 'Địa chỉ:'
-    cells[1].text = survey_data['header']['address']
-    
-    cells = rows[2].cells
-    cells[0].text = 'Số điện thoại:'
-    cells[1].text = survey_data['header']['phone']
-    
-    cells = rows[3].cells
-    cells[0].text = 'Ngày khảo sát:'
-    cells[1].text = survey_data['header']['survey_date']
-    
-    doc.add_paragraph('')
-    
-    # Người tham gia
-    doc.add_heading('Thành viên tham gia:', level=2)
-    participants = survey_data['header']['participants'].split('\n')
-    for p in participants:
-        if p.strip():
-            doc.add_paragraph(f"• {p}", style='List Bullet')
-    
-    # Người khảo sát
-    doc.add_heading('Người khảo sát:', level=2)
-    surveyors = survey_data['header']['surveyors'].split('\n')
-    for s in surveyors:
-        if s.strip():
-            doc.add_paragraph(f"• {s}", style='List Bullet')
-    
-    doc.add_paragraph('')
-    
-    # Panel Notes - Hiển thị ngay từ panel note đầu tiên
-    if panel_notes and len(panel_notes) > 0:
-        # Bắt đầu với Panel Note đầu tiên thay vì CHI TIẾT KHẢO SÁT
-        for note_idx, note in enumerate(panel_notes):
-            heading = doc.add_heading(f'KHU VỰC KHẢO SÁT #{note_idx+1}', level=2)
-            heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
-            
-            table = doc.add_table(rows=3, cols=2)
-            table.style = 'Table Grid'
-            
-            rows = table.rows
-            cells = rows[0].cells
-            cells[0].text = 'Khu vực:'
-            cells[1].text = note['area']
-            
-            cells = rows[1].cells
-            cells[0].text = 'Thiết bị:'
-            cells[1].text = note['device']
-            
-            cells = rows[2].cells
-            cells[0].text = 'Mô tả tổn thất/thông số kỹ thuật:'
-            cells[1].text = note['findings']
-            
-            doc.add_paragraph('')
-            
-            # Hình ảnh của panel note
-            if note.get('images') and len(note['images']) > 0:
-                heading = doc.add_heading(f'ẢNH KHẢO SÁT KHU VỰC #{note_idx+1}', level=3)
-                heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                
-                for img_idx, img_url in enumerate(note['images']):
-                    img = load_image_from_url(img_url)
-                    if img:
-                        # Chuyển đổi sang RGB nếu là RGBA
-                        if img.mode == 'RGBA':
-                            background = Image.new('RGB', img.size, (255, 255, 255))
-                            background.paste(img, mask=img.split()[3])
-                            img = background
-                        
-                        # Lưu ảnh tạm thời để chèn vào Word
-                        img_byte_arr = io.BytesIO()
-                        img.save(img_byte_arr, format='JPEG')
-                        img_byte_arr.seek(0)
-                        
-                        # Thêm caption và hình ảnh
-                        doc.add_paragraph(f"Hình {note_idx+1}.{img_idx+1}:")
-                        doc.add_picture(img_byte_arr, width=Inches(6))
-                        doc.add_paragraph('')
-            
-            doc.add_paragraph('')
-    else:
-        # Nếu không có panel notes, hiển thị thông tin từ detail_data
-        heading = doc.add_heading('KHU VỰC KHẢO SÁT #1', level=2)
-        heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        
-        table = doc.add_table(rows=3, cols=2)
-        table.style = 'Table Grid'
-        
-        rows = table.rows
-        cells = rows[0].cells
-        cells[0].text = 'Khu vực:'
-        cells[1].text = survey_data['detail'][0]
-        
-        cells = rows[1].cells
-        cells[0].text = 'Thiết bị:'
-        cells[1].text = survey_data['detail'][1]
-        
-        cells = rows[2].cells
-        cells[0].text = 'Mô tả tổn thất/thông số kỹ thuật:'
-        cells[1].text = survey_data['detail'][2]
-        
-        doc.add_paragraph('')
-        
-        # Hình ảnh
-        if images:
-            heading = doc.add_heading('ẢNH KHẢO SÁT KHU VỰC #1', level=2)
-            heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
-            
-            for i, img in enumerate(images):
-                if img:
-                    # Chuyển đổi sang RGB nếu là RGBA
-                    if img.mode == 'RGBA':
-                        background = Image.new('RGB', img.size, (255, 255, 255))
-                        background.paste(img, mask=img.split()[3])
-                        img = background
-                    
-                    # Lưu ảnh tạm thời để chèn vào Word
-                    img_byte_arr = io.BytesIO()
-                    img.save(img_byte_arr, format='JPEG')
-                    img_byte_arr.seek(0)
-                    
-                    # Thêm caption và hình ảnh
-                    doc.add_paragraph(f"Hình 1.{i+1}:")
-                    doc.add_picture(img_byte_arr, width=Inches(6))
-                    doc.add_paragraph('')
-    
-    # Thêm ngày xuất báo cáo
-    current_date = datetime.datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-    doc.add_paragraph('')
-    doc.add_paragraph(f"Báo cáo được xuất ngày: {current_date}")
-    doc.add_paragraph(f"Người xuất báo cáo: {st.session_state.user.get('full_name', '')}")
-    
-    # Lưu vào memory buffer
-    buffer = io.BytesIO()
-    doc.save(buffer)
-    docx = buffer.getvalue()
-    buffer.close()
-    return docx
-
 # --- CSS cho giao diện ---
 st.markdown("""
 <style>
@@ -911,10 +351,9 @@ with tab_input:
             
             # Load dữ liệu hiện có nếu đang ở chế độ chỉnh sửa
             try:
-                response = supabase.table('surveys').select('*').eq('id', st.session_state.editing_survey_id).execute()
-                if response.data and len(response.data) > 0:
-                    survey_data = response.data[0]
-                    
+                # Khảo sát kèm panel notes trong một request, luôn đọc mới (không dùng bộ nhớ đệm khi sửa)
+                survey_data = fetch_survey(supabase, st.session_state.editing_survey_id)
+                if survey_data:
                     # Kiểm tra quyền nếu không phải admin
                     if st.session_state.user["role"] != "admin" and survey_data["created_by"] != st.session_state.user["id"]:
                         st.error("Bạn không có quyền chỉnh sửa khảo sát này!")
@@ -922,9 +361,8 @@ with tab_input:
                         st.stop()
                     
                     # Load panel notes
-                    panel_notes_response = supabase.table('panel_notes').select('*').eq('survey_id', st.session_state.editing_survey_id).execute()
-                    if panel_notes_response.data:
-                        st.session_state.panel_notes = panel_notes_response.data
+                    if survey_data["panel_notes"]:
+                        st.session_state.panel_notes = survey_data["panel_notes"]
                         
                         # Khởi tạo panel_images
                         for note in st.session_state.panel_notes:
@@ -1027,7 +465,7 @@ with tab_input:
                 image_cols = st.columns(min(3, len(existing_images)))
                 for img_idx, img_url in enumerate(existing_images):
                     with image_cols[img_idx % 3]:
-                        st.image(img_url, caption=f"Ảnh {img_idx+1}", width=200)
+                        st.image(thumbnail_url(img_url), caption=f"Ảnh {img_idx+1}", width=200)
                         if st.button(f"Xóa ảnh này", key=f"remove_note_img_{idx}_{img_idx}"):
                             existing_images.pop(img_idx)
                             st.rerun()
@@ -1093,47 +531,71 @@ with tab_input:
 
             detail_data = [area, device, findings]
             
-            # Upload ảnh lên Supabase
-            image_urls = []
-            
+            # Gom tất cả ảnh cần tải lên (ảnh chính + ảnh của panel notes) để tải song song
+            upload_jobs = []
+            upload_labels = []
+            upload_targets = []  # None = ảnh chính, ngược lại là vị trí panel note
+
             for i in range(st.session_state.image_uploader_count):
                 file_key = f"image_{i}"
                 if file_key in st.session_state.uploaded_images:
                     file = st.session_state.uploaded_images[file_key]
                     if file:
-                        with st.spinner(f"Đang tải lên ảnh {i+1}..."):
-                            image_url = upload_image_to_supabase(supabase, file)
-                            if image_url:
-                                image_urls.append(image_url)
-                                st.success(f"✅ Ảnh {i+1} đã được tải lên")
-                            else:
-                                st.error(f"❌ Không thể tải lên ảnh {i+1}")
-            
-            # Xử lý ảnh cho panel notes
+                        file.seek(0)
+                        upload_jobs.append((file.name, file.read()))
+                        upload_labels.append(f"ảnh {i+1}")
+                        upload_targets.append(None)
+
             panel_notes_data = []
             for idx, note in enumerate(st.session_state.panel_notes):
                 note_id = note["id"]
-                note_data = {
+                panel_notes_data.append({
                     "id": note_id,
                     "area": note["area"],
                     "device": note["device"],
                     "findings": note["findings"],
-                    "images": note.get("images", [])  # Giữ lại ảnh cũ nếu có
-                }
-                
-                # Upload ảnh mới cho panel note
+                    "images": list(note.get("images", []))  # Giữ lại ảnh cũ nếu có
+                })
+
                 if note_id in st.session_state.panel_images:
                     for img_key, file in st.session_state.panel_images[note_id].items():
                         if file:
-                            with st.spinner(f"Đang tải lên ảnh cho Khu vực khảo sát #{idx+1}..."):
-                                image_url = upload_image_to_supabase(supabase, file)
-                                if image_url:
-                                    note_data["images"].append(image_url)
-                                    st.success(f"✅ Ảnh cho Khu vực khảo sát #{idx+1} đã được tải lên")
-                                else:
-                                    st.error(f"❌ Không thể tải lên ảnh cho Khu vực khảo sát #{idx+1}")
-                
-                panel_notes_data.append(note_data)
+                            file.seek(0)
+                            upload_jobs.append((file.name, file.read()))
+                            upload_labels.append(f"ảnh {file.name} của Khu vực khảo sát #{idx+1}")
+                            upload_targets.append(idx)
+
+            # Upload ảnh lên Supabase (song song, một thanh tiến trình chung)
+            image_urls = []
+            if upload_jobs:
+                progress_bar = st.progress(0.0, text=f"Đang tải lên 0/{len(upload_jobs)} ảnh...")
+
+                def update_upload_progress(done, total, index, error):
+                    progress_bar.progress(done / total, text=f"Đang tải lên {done}/{total} ảnh...")
+
+                upload_results = upload_images_parallel(
+                    supabase,
+                    upload_jobs,
+                    normalize_options(st.secrets.get("images")),
+                    on_progress=update_upload_progress
+                )
+
+                # Ghép URL theo đúng thứ tự ban đầu của từng panel note
+                failed_labels = []
+                for (image_url, error), label, target in zip(upload_results, upload_labels, upload_targets):
+                    if not image_url:
+                        failed_labels.append(f"{label}: {error}")
+                    elif target is None:
+                        image_urls.append(image_url)
+                    else:
+                        panel_notes_data[target]["images"].append(image_url)
+
+                uploaded_count = len(upload_jobs) - len(failed_labels)
+                progress_bar.progress(1.0, text=f"Đã tải lên {uploaded_count}/{len(upload_jobs)} ảnh")
+                if uploaded_count:
+                    st.success(f"✅ Đã tải lên {uploaded_count} ảnh")
+                for failed in failed_labels:
+                    st.error(f"❌ Không thể tải lên {failed}")
 
             # Lưu dữ liệu vào Supabase
             with st.spinner("Đang lưu dữ liệu khảo sát..."):
@@ -1157,6 +619,8 @@ with tab_input:
                         "image_urls": image_urls,
                         "panel_notes": panel_notes_data
                     }
+                    # Báo cáo đã tạo trước đó không còn đúng với dữ liệu mới
+                    st.session_state.export_jobs = {}
                     
                     # Reset trạng thái chỉnh sửa
                     st.session_state.editing_survey_id = None
@@ -1172,67 +636,34 @@ with tab_export:
     if st.session_state.survey_data:
         st.info("Bạn có thể tải xuống báo cáo khảo sát dưới dạng PDF hoặc Word.")
         
-        # Xử lý hình ảnh để sẵn sàng xuất báo cáo
-        images = []
-        
-        if "image_urls" in st.session_state.survey_data:
-            # Tải ảnh từ URL (Supabase)
-            with st.spinner("Đang tải ảnh để chuẩn bị xuất báo cáo..."):
-                for url in st.session_state.survey_data["image_urls"]:
-                    img = load_image_from_url(url)
-                    if img:
-                        images.append(img)
-        else:
-            # Sử dụng ảnh upload local (cách cũ)
-            for i in range(st.session_state.image_uploader_count):
-                if f"image_{i}" in st.session_state.uploaded_images:
-                    file = st.session_state.uploaded_images[f"image_{i}"]
-                    if file:
-                        # Lưu lại vị trí con trỏ đọc file
-                        current_pos = file.tell()
-                        # Đặt lại vị trí con trỏ file về đầu để đọc
-                        file.seek(0)
-                        img = process_image_for_export(file)
-                        # Khôi phục vị trí con trỏ ban đầu
-                        file.seek(current_pos)
-                        images.append(img)
-        
         col1, col2 = st.columns(2)
         
         with col1:
             st.subheader("Tải xuống Báo cáo khảo sát pdf")
             if st.button("Tạo file PDF"):
-                with st.spinner("Đang tạo file PDF..."):
-                    pdf_data = export_to_pdf(
-                        st.session_state.survey_data, 
-                        images, 
-                        st.session_state.survey_data.get("panel_notes", [])
-                    )
-                    company_name_safe = st.session_state.survey_data['header']['company_name'].replace(' ', '_')
-                    date_str = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                    filename = f"bao_cao_khao_sat_{company_name_safe}_{date_str}.pdf"
-                    
-                    st.markdown(
-                        get_download_link(pdf_data, filename, "📥 Tải xuống Báo cáo file PDF"),
-                        unsafe_allow_html=True
-                    )
+                start_export(st.session_state.survey_data, "pdf")
+            
+            # Hiển thị tiến độ tạo file, sau đó là link tải xuống
+            if st.session_state.export_jobs.get("pdf"):
+                show_export_job(st.session_state.export_jobs["pdf"], "📥 Tải xuống Báo cáo file PDF")
         
         with col2:
             st.subheader("Tải xuống Báo cáo khảo sát file Word")
             if st.button("Tạo file Báo cáo khảo sát Word"):
-                with st.spinner("Đang tạo file Báo cáo Word..."):
-                    docx_data = export_to_word(
-                        st.session_state.survey_data, 
-                        images,
-                        st.session_state.survey_data.get("panel_notes", [])
-                    )
-                    company_name_safe = st.session_state.survey_data['header']['company_name'].replace(' ', '_')
-                    date_str = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                    filename = f"bao_cao_khao_sat_{company_name_safe}_{date_str}.docx"
-                    
-                    st.markdown(
-                        get_download_link(docx_data, filename, "📥 Tải xuống file Word"),
-                        unsafe_allow_html=True
-                    )
+                start_export(st.session_state.survey_data, "docx")
+            
+            # Hiển thị tiến độ tạo file, sau đó là link tải xuống
+            if st.session_state.export_jobs.get("docx"):
+                show_export_job(st.session_state.export_jobs["docx"], "📥 Tải xuống file Word")
+        
+        st.subheader("Tải xuống Báo cáo khảo sát cả PDF và Word")
+        if st.button("Tạo cả file PDF và Word"):
+            start_export(st.session_state.survey_data, "both")
+        
+        if st.session_state.export_jobs.get("both"):
+            show_export_job(st.session_state.export_jobs["both"], {
+                "pdf": "📥 Tải xuống Báo cáo file PDF",
+                "docx": "📥 Tải xuống file Word"
+            })
     else:
         st.warning("Chưa có dữ liệu để xuất báo cáo. Vui lòng nhập và gửi dữ liệu khảo sát trước.")
\ No newline at end of file
@@ -4,14 +4,21 @@ import streamlit as st
 st.set_page_config(page_title="Xem danh sách khảo sát", layout="wide", page_icon="📋")
 
 # Tiếp theo mới là import các thư viện
-import io
-import base64
 import datetime
 import traceback
 import os
-from PIL import Image
-import requests
-from supabase import create_client
+from utils.supabase_client import init_supabase
+from utils.image_upload import thumbnail_url
+from utils.report_engine import report_file_name
+from utils.downloads import show_export_job
+from utils.report_cache import report_cache_key
+from utils.report_jobs import get_export_jobs
+from utils.query_cache import get_query_cache
+from utils.pagination import DEFAULT_PAGE_SIZE, PAGE_SIZES, fetch_page, get_page_cursor, show_page_controls
+from utils.invalidation import notify_survey_changed
+from utils.survey_search import search_cursor, search_surveys
+from utils.survey_filters import apply_survey_filters, show_survey_filters
+from utils.survey_store import fetch_surveys, load_survey
 
 # --- Kiểm tra đăng nhập ---
 if 'user' not in st.session_state or not st.session_state.user:
@@ -86,442 +93,73 @@ if st.session_state.get('logout', False):
 # --- Khởi tạo Session State ---
 if 'editing_survey_id' not in st.session_state:
     st.session_state.editing_survey_id = None
+if 'export_jobs' not in st.session_state:
+    st.session_state.export_jobs = {}
 
-# --- Các hàm tiện ích ---
-def init_supabase():
-    """Khởi tạo kết nối Supabase"""
-    try:
-        if "supabase" not in st.secrets:
-            st.error("🔑 Không tìm thấy cấu hình Supabase!")
-            return None
-            
-        url = st.secrets["supabase"]["url"]
-        key = st.secrets["supabase"]["key"]
-        
-        if not url or not key:
-            st.error("🔑 URL hoặc key Supabase không hợp lệ!")
-            return None
-            
-        # Kết nối
-        client = create_client(url, key)
-        
-        # Kiểm tra kết nối
-        try:
-            # Thử truy vấn đơn giản để xác minh kết nối
-            response = client.table('surveys').select('id').limit(1).execute()
-            return client
-        except Exception as e:
-            st.error(f"❌ Kết nối đến Supabase thất bại: {e}")
-            return None
-            
-    except Exception as e:
-        st.error(f"❌ Không thể kết nối đến Supabase: {e}")
-        return None
+# Số khảo sát tối đa cho một lần xuất nhiều báo cáo
+BULK_EXPORT_LIMIT = 200
+# Các cột của view survey_summary dùng cho bảng danh sách và tìm kiếm
+SUMMARY_COLUMNS = 'id, company_name, survey_date, area, device, created_by, created_at, creator_name, note_count, image_count'
 
-def load_image_from_url(url):
-    """Tải và xử lý ảnh từ URL để sử dụng trong export"""
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            img = Image.open(io.BytesIO(response.content))
-            
-            # Chuyển đổi RGBA sang RGB nếu cần
-            if img.mode == 'RGBA':
-                # Tạo background trắng
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                # Paste hình ảnh RGBA lên background
-                background.paste(img, mask=img.split()[3])  # Sử dụng kênh alpha làm mask
-                return background
-            return img
-        return None
-    except Exception as e:
-        st.error(f"Lỗi khi tải ảnh từ URL: {e}")
-        return None
-
-def get_download_link(file_content, file_name, display_text):
-    """Tạo link tải xuống cho các file được tạo."""
-    b64 = base64.b64encode(file_content).decode()
-    href = f'<a href="data:application/octet-stream;base64,{b64}" download="{file_name}" class="download-button">{display_text}</a>'
-    return href
+# --- Các hàm tiện ích ---
+def start_survey_export(survey_id, survey_data, fmt):
+    """Gửi job tạo báo cáo chạy nền; báo cáo đã tạo được dùng lại cho đến khi khảo sát thay đổi"""
+    exported_by = st.session_state.user.get('full_name', '')
+    if fmt == "both":
+        # Tải ảnh và dựng báo cáo một lần cho cả PDF và Word
+        job_id = get_export_jobs().submit_formats(survey_data, ["pdf", "docx"], exported_by, survey_id=survey_id)
+    else:
+        job_id = get_export_jobs().submit(
+            survey_data,
+            fmt,
+            exported_by,
+            report_file_name(survey_data['header'], fmt),
+            survey_id=survey_id,
+            cache_key=report_cache_key(survey_data, fmt, exported_by)
+        )
+    st.session_state.export_jobs[f"{survey_id}:{fmt}"] = job_id
 
-def export_to_pdf(survey_data, images, panel_notes=None):
-    """Tạo file PDF từ dữ liệu khảo sát."""
-    # Import các module cần thiết
-    from reportlab.lib.pagesizes import A4
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image as RLImage
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib import colors
-    from reportlab.pdfbase import pdfmetrics
-    from reportlab.pdfbase.ttfonts import TTFont
-    
-    buffer = io.BytesIO()
-    
-    # Cố gắng đăng ký font hỗ trợ tiếng Việt
-    try:
-        # Tìm kiếm font ở nhiều vị trí
-        font_paths = [
-            'assets/DejaVuSans.ttf',
-            'assets/fonts/DejaVuSans.ttf',
-            'DejaVuSans.ttf',
-            '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'  # Linux path
-        ]
-        
-        font_registered = False
-        for path in font_paths:
-            try:
-                pdfmetrics.registerFont(TTFont('DejaVuSans', path))
-                font_registered = True
-                break
-            except:
-                continue
-                
-        font_name = 'DejaVuSans' if font_registered else 'Helvetica'
-    except:
-        font_name = 'Helvetica'
-    
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    styles = getSampleStyleSheet()
-    
-    # Tạo style cho tiêu đề và nội dung
-    title_style = ParagraphStyle(
-        'Title',
-        parent=styles['Heading1'],
-        fontName=font_name,
-        fontSize=16,
-        alignment=1,
-        spaceAfter=12
+def show_bulk_export(supabase, own_only, filters):
+    """Chọn nhiều khảo sát (theo bộ lọc của danh sách) và xuất báo cáo của chúng vào một file ZIP"""
+    # Lọc trên máy chủ, chỉ lấy các cột cần để chọn khảo sát
+    query = apply_survey_filters(supabase.table('survey_summary').select('id, company_name, survey_date'), filters)
+    if own_only:
+        query = query.eq('created_by', st.session_state.user["id"])
+    candidates = get_query_cache().get_or_load(
+        ("bulk", st.session_state.user["id"], own_only, filters),
+        lambda: query.order('created_at', desc=True).limit(BULK_EXPORT_LIMIT).execute().data or []
     )
     
-    normal_style = ParagraphStyle(
-        'Normal',
-        parent=styles['Normal'],
-        fontName=font_name,
-        fontSize=10,
-        spaceAfter=6
+    labels = {row['id']: f"{row['company_name']} ({row['survey_date']})" for row in candidates}
+    if len(candidates) == BULK_EXPORT_LIMIT:
+        st.caption(f"Chỉ hiển thị {BULK_EXPORT_LIMIT} khảo sát mới nhất, hãy thu hẹp bộ lọc.")
+    selected_ids = st.multiselect(
+        f"Chọn khảo sát ({len(candidates)} khảo sát phù hợp, để trống để xuất tất cả):",
+        list(labels),
+        format_func=lambda x: labels[x],
+        key="bulk_selected"
     )
+    format_options = {"PDF": ["pdf"], "Word": ["docx"], "PDF và Word": ["pdf", "docx"]}
+    selected_format = st.radio("Định dạng:", list(format_options), horizontal=True, key="bulk_format")
     
-    content = []
-    
-    # Tiêu đề báo cáo
-    content.append(Paragraph("BÁO CÁO KHẢO SÁT", title_style))
-    content.append(Spacer(1, 20))
-    
-    # Thông tin công ty và khảo sát
-    header_data = [
-        ["Tên công ty:", survey_data['header']['company_name']],
-        ["Địa chỉ:", survey_data['header']['address']],
-        ["Số điện thoại:", survey_data['header']['phone']],
-        ["Ngày khảo sát:", survey_data['header']['survey_date']],
-    ]
-    
-    t = Table(header_data, colWidths=[120, 300])
-    t.setStyle(TableStyle([
-        ('FONT', (0, 0), (-1, -1), font_name, 10),
-        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.white),
-    ]))
-    content.append(t)
-    content.append(Spacer(1, 10))
-    
-    # Người tham gia
-    content.append(Paragraph("Thành viên tham gia:", ParagraphStyle('Heading2', parent=styles['Heading2'], fontName=font_name)))
-    participants = survey_data['header']['participants'].split('\n')
-    for p in participants:
-        if p.strip():
-            content.append(Paragraph(f"• {p}", normal_style))
-    content.append(Spacer(1, 10))
-    
-    # Người khảo sát
-    content.append(Paragraph("Người khảo sát:", ParagraphStyle('Heading2', parent=styles['Heading2'], fontName=font_name)))
-    surveyors = survey_data['header']['surveyors'].split('\n')
-    for s in surveyors:
-        if s.strip():
-            content.append(Paragraph(f"• {s}", normal_style))
-    content.append(Spacer(1, 20))
-    
-    # Chi tiết khảo sát
-    content.append(Paragraph("CHI TIẾT KHẢO SÁT", ParagraphStyle('Heading2', parent=styles['Heading2'], fontName=font_name, alignment=1)))
-    content.append(Spacer(1, 10))
-    
-    detail_data = [
-        ["Khu vực:", survey_data['detail'][0]],
-        ["Thiết bị:", survey_data['detail'][1]],
-        ["Mô tả tổn thất/thông số kỹ thuật:", survey_data['detail'][2]],
-    ]
-    
-    t = Table(detail_data, colWidths=[150, 270])
-    t.setStyle(TableStyle([
-        ('FONT', (0, 0), (-1, -1), font_name, 10),
-        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.white),
-    ]))
-    content.append(t)
-    content.append(Spacer(1, 20))
-    
-    # Hình ảnh
-    if images:
-        content.append(Paragraph("HÌNH ẢNH KHẢO SÁT", ParagraphStyle('Heading2', parent=styles['Heading2'], fontName=font_name, alignment=1)))
-        content.append(Spacer(1, 10))
-        
-        for i, img in enumerate(images):
-            if img:
-                # Chuyển đổi sang RGB nếu là RGBA
-                if img.mode == 'RGBA':
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    background.paste(img, mask=img.split()[3])
-                    img = background
-                
-                # Chuyển đổi PIL Image sang bytesIO để ReportLab có thể sử dụng
-                img_byte_arr = io.BytesIO()
-                img.save(img_byte_arr, format='JPEG')
-                img_byte_arr.seek(0)
-                
-                # Thêm caption cho hình ảnh
-                content.append(Paragraph(f"Hình {i+1}:", normal_style))
-                
-                # Tính toán kích thước ảnh phù hợp (tối đa 400x300, giữ tỷ lệ)
-                img_width, img_height = img.size
-                ratio = min(400/img_width, 300/img_height) if img_width > 0 and img_height > 0 else 1
-                new_width = img_width * ratio
-                new_height = img_height * ratio
-                
-                # Thêm hình ảnh vào tài liệu PDF
-                img_reportlab = RLImage(img_byte_arr, width=new_width, height=new_height)
-                content.append(img_reportlab)
-                content.append(Spacer(1, 10))
-    
-    # Panel Notes
-    if panel_notes and len(panel_notes) > 0:
-        content.append(Paragraph("PANEL NOTES", ParagraphStyle('Heading2', parent=styles['Heading2'], fontName=font_name, alignment=1)))
-        content.append(Spacer(1, 10))
-        
-        for note_idx, note in enumerate(panel_notes):
-            content.append(Paragraph(f"Panel Note #{note_idx+1}", ParagraphStyle('Heading3', parent=styles['Heading3'], fontName=font_name)))
-            
-            note_data = [
-                ["Khu vực:", note['area']],
-                ["Thiết bị:", note['device']],
-                ["Mô tả tổn thất/thông số kỹ thuật:", note['findings']],
-            ]
-            
-            t = Table(note_data, colWidths=[150, 270])
-            t.setStyle(TableStyle([
-                ('FONT', (0, 0), (-1, -1), font_name, 10),
-                ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.white),
-            ]))
-            content.append(t)
-            content.append(Spacer(1, 10))
-            
-            # Hình ảnh của panel note
-            if note.get('images') and len(note['images']) > 0:
-                for img_idx, img_url in enumerate(note['images']):
-                    img = load_image_from_url(img_url)
-                    if img:
-                        # Chuyển đổi sang RGB nếu là RGBA
-                        if img.mode == 'RGBA':
-                            background = Image.new('RGB', img.size, (255, 255, 255))
-                            background.paste(img, mask=img.split()[3])
-                            img = background
-                        
-                        # Chuyển đổi PIL Image sang bytesIO để ReportLab có thể sử dụng
-                        img_byte_arr = io.BytesIO()
-                        img.save(img_byte_arr, format='JPEG')
-                        img_byte_arr.seek(0)
-                        
-                        # Thêm caption cho hình ảnh
-                        content.append(Paragraph(f"Hình {note_idx+1}.{img_idx+1}:", normal_style))
-                        
-                        # Tính toán kích thước ảnh phù hợp
-                        img_width, img_height = img.size
-                        ratio = min(400/img_width, 300/img_height) if img_width > 0 and img_height > 0 else 1
-                        new_width = img_width * ratio
-                        new_height = img_height * ratio
-                        
-                        # Thêm hình ảnh vào tài liệu PDF
-                        img_reportlab = RLImage(img_byte_arr, width=new_width, height=new_height)
-                        content.append(img_reportlab)
-                        content.append(Spacer(1, 10))
-            
-            content.append(Spacer(1, 10))
-    
-    # Thêm ngày xuất báo cáo
-    current_date = datetime.datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-    content.append(Spacer(1, 20))
-    content.append(Paragraph(f"Báo cáo được xuất ngày: {current_date}", normal_style))
-    content.append(Paragraph(f"Người xuất báo cáo: {st.session_state.user.get('full_name', '')}", normal_style))
-    
-    doc.build(content)
-    pdf = buffer.getvalue()
-    buffer.close()
-    return pdf
-
-def export_to_word(survey_data, images, panel_notes=None):
-    """Tạo file Word từ dữ liệu khảo sát."""
-    # Import các module cần thiết
-    from docx import Document
-    from docx.shared import Inches, Pt, RGBColor
-    from docx.enum.text import WD_ALIGN_PARAGRAPH
-    
-    doc = Document()
-    
-    # Thiết lập font và cỡ chữ mặc định
-    style = doc.styles['Normal']
-    style.font.name = 'Times New Roman'
-    style.font.size = Pt(12)
-    
-    # Tiêu đề
-    heading = doc.add_heading('BÁO CÁO KHẢO SÁT', level=1)
-    heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    
-    # Thông tin công ty và khảo sát
-    table = doc.add_table(rows=4, cols=2)
-    table.style = 'Table Grid'
-    
-    rows = table.rows
-    cells = rows[0].cells
-    cells[0].text = 'Tên công ty:'
-    cells[1].text = survey_data['header']['company_name']
-    
-    cells = rows[1].cells
-    cells[0].text = 'Địa chỉ:'
-    cells[1].text = survey_data['header']['address']
-    
-    cells = rows[2].cells
-    cells[0].text = 'Số điện thoại:'
-    cells[1].text = survey_data['header']['phone']
-    
-    cells = rows[3].cells
-    cells[0].text = 'Ngày khảo sát:'
-    cells[1].text = survey_data['header']['survey_date']
-    
-    doc.add_paragraph('')
-    
-    # Người tham gia
-    doc.add_heading('Thành viên tham gia:', level=2)
-    participants = survey_data['header']['participants'].split('\n')
-    for p in participants:
-        if p.strip():
-            doc.add_paragraph(f"• {p}", style='List Bullet')
-    
-    # Người khảo sát
-    doc.add_heading('Người khảo sát:', level=2)
-    surveyors = survey_data['header']['surveyors'].split('\n')
-    for s in surveyors:
-        if s.strip():
-            doc.add_paragraph(f"• {s}", style='List Bullet')
-    
-    doc.add_paragraph('')
-    
-    # Chi tiết khảo sát
-    heading = doc.add_heading('CHI TIẾT KHẢO SÁT', level=2)
-    heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    
-    table = doc.add_table(rows=3, cols=2)
-    table.style = 'Table Grid'
-    
-    rows = table.rows
-    cells = rows[0].cells
-    cells[0].text = 'Khu vực:'
-    cells[1].text = survey_data['detail'][0]
-    
-    cells = rows[1].cells
-    cells[0].text = 'Thiết bị:'
-    cells[1].text = survey_data['detail'][1]
-    
-    cells = rows[2].cells
-    cells[0].text = 'Mô tả tổn thất/thông số kỹ thuật:'
-    cells[1].text = survey_data['detail'][2]
-    
-    doc.add_paragraph('')
-    
-    # Hình ảnh
-    if images:
-        heading = doc.add_heading('HÌNH ẢNH KHẢO SÁT', level=2)
-        heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        
-        for i, img in enumerate(images):
-            if img:
-                # Chuyển đổi sang RGB nếu là RGBA
-                if img.mode == 'RGBA':
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    background.paste(img, mask=img.split()[3])
-                    img = background
-                
-                # Lưu ảnh tạm thời để chèn vào Word
-                img_byte_arr = io.BytesIO()
-                img.save(img_byte_arr, format='JPEG')
-                img_byte_arr.seek(0)
-                
-                # Thêm caption và hình ảnh
-                doc.add_paragraph(f"Hình {i+1}:")
-                doc.add_picture(img_byte_arr, width=Inches(6))
-                doc.add_paragraph('')
-    
-    # Panel Notes
-    if panel_notes and len(panel_notes) > 0:
-        heading = doc.add_heading('PANEL NOTES', level=2)
-        heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        
-        for note_idx, note in enumerate(panel_notes):
-            doc.add_heading(f"Panel Note #{note_idx+1}", level=3)
-            
-            table = doc.add_table(rows=3, cols=2)
-            table.style = 'Table Grid'
-            
-            rows = table.rows
-            cells = rows[0].cells
-            cells[0].text = 'Khu vực:'
-            cells[1].text = note['area']
-            
-            cells = rows[1].cells
-            cells[0].text = 'Thiết bị:'
-            cells[1].text = note['device']
-            
-            cells = rows[2].cells
-            cells[0].text = 'Mô tả tổn thất/thông số kỹ thuật:'
-            cells[1].text = note['findings']
-            
-            doc.add_paragraph('')
-            
-            # Hình ảnh của panel note
-            if note.get('images') and len(note['images']) > 0:
-                for img_idx, img_url in enumerate(note['images']):
-                    img = load_image_from_url(img_url)
-                    if img:
-                        # Chuyển đổi sang RGB nếu là RGBA
-                        if img.mode == 'RGBA':
-                            background = Image.new('RGB', img.size, (255, 255, 255))
-                            background.paste(img, mask=img.split()[3])
-                            img = background
-                        
-                        # Lưu ảnh tạm thời để chèn vào Word
-                        img_byte_arr = io.BytesIO()
-                        img.save(img_byte_arr, format='JPEG')
-                        img_byte_arr.seek(0)
-                        
-                        # Thêm caption và hình ảnh
-                        doc.add_paragraph(f"Hình {note_idx+1}.{img_idx+1}:")
-                        doc.add_picture(img_byte_arr, width=Inches(6))
-                        doc.add_paragraph('')
-            
-            doc.add_paragraph('')
-    
-    # Thêm ngày xuất báo cáo
-    current_date = datetime.datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-    doc.add_paragraph('')
-    doc.add_paragraph(f"Báo cáo được xuất ngày: {current_date}")
-    doc.add_paragraph(f"Người xuất báo cáo: {st.session_state.user.get('full_name', '')}")
-    
-    # Lưu vào memory buffer
-    buffer = io.BytesIO()
-    doc.save(buffer)
-    docx = buffer.getvalue()
-    buffer.close()
-    return docx
+    if st.button("📦 Xuất báo cáo", key="bulk_export_btn"):
+        survey_ids = selected_ids or list(labels)
+        if not survey_ids:
+            st.warning("Không có khảo sát nào để xuất.")
+        else:
+            surveys = get_surveys_for_export(supabase, survey_ids)
+            if surveys:
+                date_str = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+                st.session_state.export_jobs["bulk"] = get_export_jobs().submit_bulk(
+                    surveys,
+                    format_options[selected_format],
+                    st.session_state.user.get('full_name', ''),
+                    f"bao_cao_khao_sat_{date_str}.zip"
+                )
+    
+    # Hiển thị tiến độ, sau đó là link tải xuống file ZIP
+    if st.session_state.export_jobs.get("bulk"):
+        show_export_job(st.session_state.export_jobs["bulk"], "📥 Tải xuống file ZIP")
 
 # --- Hàm xóa khảo sát ---
 def delete_survey_from_supabase(supabase, survey_id):
@@ -539,55 +177,68 @@ def delete_survey_from_supabase(supabase, survey_id):
         
         # Xóa khảo sát (các panel_notes sẽ tự động bị xóa do có constraint ON DELETE CASCADE)
         response = supabase.table('surveys').delete().eq('id', survey_id).execute()
+        notify_survey_changed(survey_id)
         return True
     except Exception as e:
         st.error(f"Lỗi khi xóa khảo sát: {str(e)}")
         return False
 
 # --- Hàm lấy chi tiết khảo sát ---
+def build_survey_data(survey, panel_notes):
+    """Chuyển bản ghi khảo sát và panel notes sang dạng dữ liệu dùng để hiển thị và xuất báo cáo"""
+    return {
+        'header': {
+            'company_name': survey['company_name'],
+            'address': survey['address'],
+            'phone': survey['phone'],
+            'survey_date': survey['survey_date'],
+            'participants': survey['participants'],
+            'surveyors': survey['surveyors']
+        },
+        'detail': [
+            survey['area'],
+            survey['device'],
+            survey['findings']
+        ],
+        'image_urls': survey['images'] if survey['images'] else [],
+        'panel_notes': panel_notes
+    }
+
 def get_survey_detail(supabase, survey_id):
-    """Lấy chi tiết khảo sát từ Supabase"""
+    """Lấy chi tiết khảo sát từ Supabase (một request, dùng lại trong thời gian ngắn)"""
     if not supabase or not survey_id:
         return None
         
     try:
-        # Lấy thông tin khảo sát
-        response = supabase.table('surveys').select('*').eq('id', survey_id).execute()
-        if not response.data or len(response.data) == 0:
+        survey = load_survey(supabase, survey_id, st.session_state.user["id"])
+        if not survey:
             st.error(f"Không tìm thấy khảo sát ID: {survey_id}")
             return None
-            
-        survey = response.data[0]
-        
-        # Lấy danh sách panel notes
-        panel_notes_response = supabase.table('panel_notes').select('*').eq('survey_id', survey_id).execute()
-        panel_notes = panel_notes_response.data if panel_notes_response.data else []
         
         # Tạo đối tượng dữ liệu đầy đủ
-        survey_data = {
-            'header': {
-                'company_name': survey['company_name'],
-                'address': survey['address'],
-                'phone': survey['phone'],
-                'survey_date': survey['survey_date'],
-                'participants': survey['participants'],
-                'surveyors': survey['surveyors']
-            },
-            'detail': [
-                survey['area'],
-                survey['device'],
-                survey['findings']
-            ],
-            'image_urls': survey['images'] if survey['images'] else [],
-            'panel_notes': panel_notes
-        }
-        
-        return survey_data
+        return build_survey_data(survey, survey['panel_notes'] or [])
     except Exception as e:
         st.error(f"Lỗi khi lấy chi tiết khảo sát: {str(e)}")
         st.error(traceback.format_exc())
         return None
 
+def get_surveys_for_export(supabase, survey_ids):
+    """Lấy dữ liệu của nhiều khảo sát (một request), trả về danh sách (survey_id, survey_data)"""
+    if not supabase or not survey_ids:
+        return []
+        
+    try:
+        surveys = fetch_surveys(supabase, survey_ids)
+        
+        # Giữ thứ tự khảo sát như đã chọn
+        return [
+            (survey_id, build_survey_data(surveys[survey_id], surveys[survey_id]['panel_notes'] or []))
+            for survey_id in survey_ids if survey_id in surveys
+        ]
+    except Exception as e:
+        st.error(f"Lỗi khi lấy dữ liệu khảo sát: {str(e)}")
+        return []
+
 # Giao diện chính
 st.title("📋 Xem danh sách khảo sát")
 
@@ -625,22 +276,31 @@ with tab1:
         selected_view = st.radio("Hiển thị:", view_options)
     else:
         selected_view = "Khảo sát của tôi"
+    own_only = not (selected_view == "Tất cả khảo sát" and st.session_state.user["role"] == "admin")
+    
+    # Lọc theo người tạo chỉ có ý nghĩa khi admin xem tất cả khảo sát
+    filters = show_survey_filters(supabase, "list", can_filter_creator=not own_only)
+    
+    page_size = st.selectbox("Số khảo sát mỗi trang:", PAGE_SIZES, index=PAGE_SIZES.index(DEFAULT_PAGE_SIZE), key="list_page_size")
+    cursor = get_page_cursor("list", (selected_view, filters, page_size))
     
-    # Lấy danh sách khảo sát từ Supabase
+    # Lấy một trang danh sách khảo sát từ Supabase (mọi bộ lọc trong cùng một truy vấn)
     try:
-        if selected_view == "Tất cả khảo sát" and st.session_state.user["role"] == "admin":
-            # Admin xem tất cả các khảo sát
-            response = supabase.table('surveys').select('*, users!inner(full_name)').order('created_at', desc=True).execute()
-        else:
+        query = apply_survey_filters(supabase.table('survey_summary').select(SUMMARY_COLUMNS), filters)
+        if own_only:
             # Người dùng thông thường chỉ xem các khảo sát của mình
-            response = supabase.table('surveys').select('*, users!inner(full_name)').eq('created_by', st.session_state.user["id"]).order('created_at', desc=True).execute()
+            query = query.eq('created_by', st.session_state.user["id"])
+        # Dùng lại kết quả gần đây cho đến khi hết hạn hoặc có khảo sát được lưu/xóa
+        rows, has_next = get_query_cache().get_or_load(
+            ("list", st.session_state.user["id"], own_only, filters, cursor, page_size),
+            lambda: fetch_page(query, cursor, page_size)
+        )
         
-        if response.data and len(response.data) > 0:
-            st.write(f"Tìm thấy {len(response.data)} khảo sát")
+        if rows:
             
             # Hiển thị dưới dạng bảng
             surveys = []
-            for survey in response.data:
+            for survey in rows:
                 created_at = datetime.datetime.fromisoformat(survey['created_at'].replace('Z', '+00:00'))
                 formatted_date = created_at.strftime("%d/%m/%Y %H:%M")
                 
@@ -648,16 +308,23 @@ with tab1:
                     "ID": survey['id'],
                     "Công ty": survey['company_name'],
                     "Ngày khảo sát": survey['survey_date'],
-                    "Người tạo": survey['users']['full_name'],
+                    "Người tạo": survey['creator_name'],
+                    "Panel notes": survey['note_count'],
+                    "Số ảnh": survey['image_count'],
                     "Thời gian tạo": formatted_date
                 })
             
             # Hiển thị bảng khảo sát
             st.dataframe(surveys, use_container_width=True)
+            show_page_controls("list", rows, has_next)
+            
+            # Xuất nhiều báo cáo cùng lúc vào một file ZIP
+            with st.expander("📦 Xuất nhiều báo cáo (ZIP)"):
+                show_bulk_export(supabase, own_only, filters)
             
             # Chọn khảo sát để xem chi tiết
-            survey_ids = [s['id'] for s in response.data]
-            survey_names = [f"{s['company_name']} ({s['survey_date']})" for s in response.data]
+            survey_ids = [s['id'] for s in rows]
+            survey_names = [f"{s['company_name']} ({s['survey_date']})" for s in rows]
             options = dict(zip(survey_ids, survey_names))
             
             selected_survey = st.selectbox("Chọn khảo sát để xem chi tiết:", survey_ids, format_func=lambda x: options[x])
@@ -675,7 +342,7 @@ with tab1:
                     if st.button("✏️ Chỉnh sửa", key="edit_btn"):
                         # Kiểm tra quyền nếu không phải admin
                         if st.session_state.user["role"] != "admin":
-                            selected_survey_data = [s for s in response.data if s['id'] == selected_survey][0]
+                            selected_survey_data = [s for s in rows if s['id'] == selected_survey][0]
                             if selected_survey_data["created_by"] != st.session_state.user["id"]:
                                 st.error("Bạn không có quyền chỉnh sửa khảo sát này!")
                                 st.stop()
@@ -754,7 +421,7 @@ with tab1:
                             img_cols = st.columns(min(3, len(survey_data['image_urls'])))
                             for idx, img_url in enumerate(survey_data['image_urls']):
                                 with img_cols[idx % 3]:
-                                    st.image(img_url, caption=f"Hình {idx+1}", width=200)
+                                    st.image(thumbnail_url(img_url), caption=f"Hình {idx+1}", width=200)
                         
                         # Hiển thị panel notes
                         if survey_data['panel_notes'] and len(survey_data['panel_notes']) > 0:
@@ -772,7 +439,7 @@ with tab1:
                                         note_img_cols = st.columns(min(3, len(note['images'])))
                                         for img_idx, img_url in enumerate(note['images']):
                                             with note_img_cols[img_idx % 3]:
-                                                st.image(img_url, caption=f"Hình {img_idx+1}", width=200)
+                                                st.image(thumbnail_url(img_url), caption=f"Hình {img_idx+1}", width=200)
                         
                         # Nút xuất báo cáo
                         st.subheader("Xuất báo cáo")
@@ -781,55 +448,40 @@ with tab1:
                         
                         with col1:
                             if st.button("📄 Xuất file PDF"):
-                                with st.spinner("Đang tạo file PDF..."):
-                                    # Tải hình ảnh từ URL
-                                    images = []
-                                    for url in survey_data['image_urls']:
-                                        img = load_image_from_url(url)
-                                        if img:
-                                            images.append(img)
-                                    
-                                    # Tạo file PDF
-                                    pdf_data = export_to_pdf(survey_data, images, survey_data['panel_notes'])
-                                    
-                                    # Tạo tên file
-                                    company_name_safe = survey_data['header']['company_name'].replace(' ', '_')
-                                    date_str = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                                    filename = f"bao_cao_khao_sat_{company_name_safe}_{date_str}.pdf"
-                                    
-                                    # Hiển thị link tải xuống
-                                    st.markdown(
-                                        get_download_link(pdf_data, filename, "📥 Tải xuống file PDF"),
-                                        unsafe_allow_html=True
-                                    )
+                                # Tạo file PDF ở tiến trình nền (dùng lại bản đã tạo nếu khảo sát không thay đổi)
+                                start_survey_export(st.session_state.selected_survey_id, survey_data, "pdf")
+                            
+                            # Hiển thị tiến độ, sau đó là link tải xuống
+                            job_id = st.session_state.export_jobs.get(f"{st.session_state.selected_survey_id}:pdf")
+                            if job_id:
+                                show_export_job(job_id, "📥 Tải xuống file PDF")
                         
                         with col2:
                             if st.button("📄 Xuất file Word"):
-                                with st.spinner("Đang tạo file Word..."):
-                                    # Tải hình ảnh từ URL
-                                    images = []
-                                    for url in survey_data['image_urls']:
-                                        img = load_image_from_url(url)
-                                        if img:
-                                            images.append(img)
-                                    
-                                    # Tạo file Word
-                                    docx_data = export_to_word(survey_data, images, survey_data['panel_notes'])
-                                    
-                                    # Tạo tên file
-                                    company_name_safe = survey_data['header']['company_name'].replace(' ', '_')
-                                    date_str = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                                    filename = f"bao_cao_khao_sat_{company_name_safe}_{date_str}.docx"
-                                    
-                                    # Hiển thị link tải xuống
-                                    st.markdown(
-                                        get_download_link(docx_data, filename, "📥 Tải xuống file Word"),
-                                        unsafe_allow_html=True
-                                    )
+                                # Tạo file Word ở tiến trình nền (dùng lại bản đã tạo nếu khảo sát không thay đổi)
+                                start_survey_export(st.session_state.selected_survey_id, survey_data, "docx")
+                            
+                            # Hiển thị tiến độ, sau đó là link tải xuống
+                            job_id = st.session_state.export_jobs.get(f"{st.session_state.selected_survey_id}:docx")
+                            if job_id:
+                                show_export_job(job_id, "📥 Tải xuống file Word")
+                        
+                        if st.button("📄 Xuất cả PDF và Word"):
+                            # Tải ảnh một lần rồi tạo lần lượt hai file từ cùng báo cáo
+                            start_survey_export(st.session_state.selected_survey_id, survey_data, "both")
+                        
+                        job_id = st.session_state.export_jobs.get(f"{st.session_state.selected_survey_id}:both")
+                        if job_id:
+                            show_export_job(job_id, {"pdf": "📥 Tải xuống file PDF", "docx": "📥 Tải xuống file Word"})
                     else:
                         st.error("Không thể tải dữ liệu khảo sát")
         else:
-            st.info("Không có khảo sát nào. Nhấn nút 'Tạo khảo sát mới' để bắt đầu.")
+            if any(value is not None for value in filters):
+                st.info("Không có khảo sát nào khớp với bộ lọc.")
+            else:
+                st.info("Không có khảo sát nào. Nhấn nút 'Tạo khảo sát mới' để bắt đầu.")
+            if cursor:
+                show_page_controls("list", rows, has_next)
     except Exception as e:
         st.error(f"Lỗi khi tải danh sách khảo sát: {str(e)}")
         st.error(traceback.format_exc())
@@ -837,64 +489,69 @@ with tab1:
 with tab2:
     st.subheader("Tìm kiếm khảo sát")
     
-    search_term = st.text_input("Nhập từ khóa tìm kiếm:")
-    search_type = st.radio("Tìm kiếm theo:", ["Tên công ty", "Khu vực", "Thiết bị", "Mô tả"])
+    search_term = st.text_input(
+        "Nhập từ khóa tìm kiếm:",
+        help="Tìm trong tên công ty, khu vực, thiết bị, mô tả và panel notes; không phân biệt dấu (\"may nen\" khớp \"máy nén\")"
+    )
+    
+    page_size = st.selectbox("Số kết quả mỗi trang:", PAGE_SIZES, index=PAGE_SIZES.index(DEFAULT_PAGE_SIZE), key="search_page_size")
     
     if st.button("🔍 Tìm kiếm"):
-        if search_term:
-            try:
-                # Xác định trường tìm kiếm
-                search_field = "company_name"
-                if search_type == "Khu vực":
-                    search_field = "area"
-                elif search_type == "Thiết bị":
-                    search_field = "device"
-                elif search_type == "Mô tả":
-                    search_field = "findings"
+        # Giữ điều kiện tìm kiếm để chuyển trang không làm mất kết quả
+        st.session_state.search_params = search_term.strip() or None
+    
+    if st.session_state.get('search_params'):
+        search_term = st.session_state.search_params
+        cursor = get_page_cursor("search", (search_term, page_size))
+        try:
+            # Người dùng thông thường chỉ tìm kiếm trong các khảo sát của mình
+            created_by = None if st.session_state.user["role"] == "admin" else st.session_state.user["id"]
+            
+            # Thực hiện tìm kiếm (một trang kết quả, liên quan nhất trước)
+            rows, has_next = get_query_cache().get_or_load(
+                ("search", st.session_state.user["id"], search_term, cursor, page_size),
+                lambda: search_surveys(supabase, search_term, SUMMARY_COLUMNS, created_by, cursor, page_size)
+            )
+            
+            if rows:
+                # Hiển thị dưới dạng bảng
+                search_results = []
+                for survey in rows:
+                    created_at = datetime.datetime.fromisoformat(survey['created_at'].replace('Z', '+00:00'))
+                    formatted_date = created_at.strftime("%d/%m/%Y %H:%M")
+                    
+                    search_results.append({
+                        "ID": survey['id'],
+                        "Công ty": survey['company_name'],
+                        "Khu vực": survey['area'],
+                        "Thiết bị": survey['device'],
+                        "Ngày khảo sát": survey['survey_date'],
+                        "Người tạo": survey['creator_name'],
+                        "Panel notes": survey['note_count'],
+                        "Số ảnh": survey['image_count'],
+                        "Nội dung khớp": survey.get('headline') or "",
+                        "Thời gian tạo": formatted_date
+                    })
                 
-                # Thực hiện tìm kiếm
-                if st.session_state.user["role"] == "admin":
-                    # Admin có thể tìm kiếm tất cả các khảo sát
-                    response = supabase.table('surveys').select('*, users!inner(full_name)').ilike(search_field, f"%{search_term}%").order('created_at', desc=True).execute()
-                else:
-                    # Người dùng thông thường chỉ tìm kiếm trong các khảo sát của mình
-                    response = supabase.table('surveys').select('*, users!inner(full_name)').eq('created_by', st.session_state.user["id"]).ilike(search_field, f"%{search_term}%").order('created_at', desc=True).execute()
+                # Hiển thị bảng kết quả tìm kiếm
+                st.dataframe(search_results, use_container_width=True)
+                show_page_controls("search", rows, has_next, search_cursor)
                 
-                if response.data and len(response.data) > 0:
-                    st.write(f"Tìm thấy {len(response.data)} kết quả")
-                    
-                    # Hiển thị dưới dạng bảng
-                    search_results = []
-                    for survey in response.data:
-                        created_at = datetime.datetime.fromisoformat(survey['created_at'].replace('Z', '+00:00'))
-                        formatted_date = created_at.strftime("%d/%m/%Y %H:%M")
-                        
-                        search_results.append({
-                            "ID": survey['id'],
-                            "Công ty": survey['company_name'],
-                            "Khu vực": survey['area'],
-                            "Thiết bị": survey['device'],
-                            "Ngày khảo sát": survey['survey_date'],
-                            "Người tạo": survey['users']['full_name'],
-                            "Thời gian tạo": formatted_date
-                        })
-                    
-                    # Hiển thị bảng kết quả tìm kiếm
-                    st.dataframe(search_results, use_container_width=True)
-                    
-                    # Chọn khảo sát để xem chi tiết
-                    survey_ids = [s['id'] for s in response.data]
-                    survey_names = [f"{s['company_name']} ({s['survey_date']})" for s in response.data]
-                    options = dict(zip(survey_ids, survey_names))
-                    
-                    selected_survey = st.selectbox("Chọn khảo sát để xem chi tiết:", survey_ids, format_func=lambda x: options[x], key="search_select")
-                    
-                    if selected_survey:
-                        if st.button("📄 Xem chi tiết", key="search_view_btn"):
-                            st.session_state.selected_survey_id = selected_survey
-                            st.rerun()
-                else:
-                    st.info(f"Không tìm thấy kết quả nào cho từ khóa '{search_term}'")
-            except Exception as e:
-                st.error(f"Lỗi khi tìm kiếm: {str(e)}")
-                st.error(traceback.format_exc())
\ No newline at end of file
+                # Chọn khảo sát để xem chi tiết
+                survey_ids = [s['id'] for s in rows]
+                survey_names = [f"{s['company_name']} ({s['survey_date']})" for s in rows]
+                options = dict(zip(survey_ids, survey_names))
+                
+                selected_survey = st.selectbox("Chọn khảo sát để xem chi tiết:", survey_ids, format_func=lambda x: options[x], key="search_select")
+                
+                if selected_survey:
+                    if st.button("📄 Xem chi tiết", key="search_view_btn"):
+                        st.session_state.selected_survey_id = selected_survey
+                        st.rerun()
+            else:
+                st.info(f"Không tìm thấy kết quả nào cho từ khóa '{search_term}'")
+                if cursor:
+                    show_page_controls("search", rows, has_next, search_cursor)
+        except Exception as e:
+            st.error(f"Lỗi khi tìm kiếm: {str(e)}")
+            st.error(traceback.format_exc())
@@ -0,0 +1,61 @@
+-- Lược đồ gốc của ứng dụng (users, surveys, panel_notes) mà các migration sau dựa vào.
+--
+-- Trên dự án Supabase đang chạy các bảng đã có sẵn: mọi lệnh đều "if not exists" nên
+-- migration này không đổi gì. Trên một Postgres trống (CSDL test cục bộ, xem tests/conftest.py)
+-- nó tạo các bảng cùng schema extensions và các role anon/authenticated/service_role
+-- mà Supabase vẫn cung cấp, để chạy được toàn bộ chuỗi migration.
+
+do $$
+declare
+    v_role text;
+begin
+    foreach v_role in array array['anon', 'authenticated', 'service_role'] loop
+        if not exists (select 1 from pg_roles where rolname = v_role) then
+            execute format('create role %I nologin', v_role);
+        end if;
+    end loop;
+end
+$$;
+
+create schema if not exists extensions;
+
+create table if not exists public.users (
+    id         bigint generated by default as identity primary key,
+    email      text not null unique,
+    password   text not null,
+    full_name  text,
+    role       text not null default 'member',
+    created_at timestamptz not null default now()
+);
+
+create table if not exists public.surveys (
+    id           bigint generated by default as identity primary key,
+    company_name text,
+    address      text,
+    phone        text,
+    survey_date  date,
+    participants text,
+    surveyors    text,
+    area         text,
+    device       text,
+    findings     text,
+    images       text[] not null default '{}',
+    created_by   bigint not null references public.users (id),
+    created_at   timestamptz not null default now()
+);
+
+-- Xóa khảo sát thì xóa luôn panel notes (ứng dụng dựa vào on delete cascade)
+create table if not exists public.panel_notes (
+    id         uuid primary key default gen_random_uuid(),
+    survey_id  bigint not null references public.surveys (id) on delete cascade,
+    area       text,
+    device     text,
+    findings   text,
+    images     text[] not null default '{}',
+    created_by bigint not null references public.users (id),
+    created_at timestamptz not null default now()
+);
+
+-- Quyền mặc định của Supabase cho service_role (máy chủ Streamlit dùng service key)
+grant usage on schema public, extensions to service_role;
+grant all on public.users, public.surveys, public.panel_notes to service_role;
@@ -0,0 +1,37 @@
+-- panel_notes.id là uuid do ứng dụng tạo (uuid4 khi thêm note trên form).
+--
+-- Các migration sau (save_survey: jsonb_populate_recordset(null::panel_notes), on conflict (id))
+-- và cách lưu nhiều request đều gửi id của note mới. Bảng cũ có thể dùng id số tự tăng:
+-- đổi sang uuid (không bảng nào tham chiếu tới panel_notes.id nên id cũ được cấp lại),
+-- và luôn có giá trị mặc định gen_random_uuid() cho các bản ghi không gửi id.
+
+do $$
+declare
+    v_type text;
+begin
+    select data_type into v_type
+    from information_schema.columns
+    where table_schema = 'public' and table_name = 'panel_notes' and column_name = 'id';
+
+    if v_type is null then
+        raise exception 'Không tìm thấy cột public.panel_notes.id';
+    end if;
+
+    if v_type in ('smallint', 'integer', 'bigint') then
+        if exists (
+            select 1 from pg_constraint
+            where contype = 'f' and confrelid = 'public.panel_notes'::regclass
+        ) then
+            raise exception 'panel_notes.id đang được khóa ngoại tham chiếu, không thể đổi sang uuid';
+        end if;
+        alter table public.panel_notes alter column id drop default;
+        alter table public.panel_notes alter column id drop identity if exists;
+        alter table public.panel_notes alter column id type uuid using gen_random_uuid();
+    elsif v_type <> 'uuid' then
+        raise exception 'panel_notes.id có kiểu %, cần uuid', v_type;
+    end if;
+end
+$$;
+
+alter table public.panel_notes
+    alter column id set default gen_random_uuid();
@@ -0,0 +1,101 @@
+-- Lưu khảo sát (thông tin chung, chi tiết, panel notes) trong một transaction.
+--
+-- payload:
+-- {
+--   "survey_id":   id khảo sát cần cập nhật, null khi tạo mới,
+--   "user_id":     id người lưu (bảng users),
+--   "survey":      {company_name, address, phone, survey_date, participants,
+--                   surveyors, area, device, findings, images},
+--   "panel_notes": [{id, area, device, findings, images}, ...]
+-- }
+--
+-- Trả về {"id": <id khảo sát>}. Panel notes không còn trong payload bị xóa,
+-- note mới được thêm, note thay đổi được cập nhật theo id. Người tạo (created_by)
+-- của khảo sát/note đã có không đổi khi người khác (admin) chỉnh sửa.
+--
+-- Bảo mật: ứng dụng tự đăng nhập người dùng bằng bảng users (không dùng Supabase Auth,
+-- auth.uid() luôn null) nên "user_id" trong payload không thể kiểm chứng trong CSDL.
+-- Vì vậy chỉ service_role được gọi hàm này: máy chủ Streamlit gọi bằng service key
+-- trong st.secrets (không bao giờ gửi xuống trình duyệt), anon/authenticated không gọi được.
+
+create or replace function public.save_survey(payload jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_user_id   public.users.id%type := payload->>'user_id';
+    v_survey_id public.surveys.id%type := payload->>'survey_id';
+    v_role      text;
+    v_owner     public.surveys.created_by%type;
+    v_survey    public.surveys;
+    v_notes     jsonb := coalesce(payload->'panel_notes', '[]'::jsonb);
+begin
+    select role into v_role from public.users where id = v_user_id;
+    if not found then
+        raise exception 'Không tìm thấy người dùng %', v_user_id using errcode = '42501';
+    end if;
+
+    -- Chuyển JSON sang kiểu cột thực tế của bảng surveys
+    v_survey := jsonb_populate_record(null::public.surveys, payload->'survey');
+
+    if v_survey_id is null then
+        insert into public.surveys (
+            company_name, address, phone, survey_date, participants, surveyors,
+            created_by, area, device, findings, images
+        )
+        values (
+            v_survey.company_name, v_survey.address, v_survey.phone, v_survey.survey_date,
+            v_survey.participants, v_survey.surveyors, v_user_id,
+            v_survey.area, v_survey.device, v_survey.findings, v_survey.images
+        )
+        returning id into v_survey_id;
+    else
+        select created_by into v_owner from public.surveys where id = v_survey_id for update;
+        if not found then
+            raise exception 'Không tìm thấy khảo sát ID: %', v_survey_id using errcode = 'P0002';
+        end if;
+        if v_role is distinct from 'admin' and v_owner is distinct from v_user_id then
+            raise exception 'Bạn không có quyền chỉnh sửa khảo sát này!' using errcode = '42501';
+        end if;
+
+        update public.surveys set
+            company_name = v_survey.company_name,
+            address      = v_survey.address,
+            phone        = v_survey.phone,
+            survey_date  = v_survey.survey_date,
+            participants = v_survey.participants,
+            surveyors    = v_survey.surveyors,
+            area         = v_survey.area,
+            device       = v_survey.device,
+            findings     = v_survey.findings,
+            images       = v_survey.images
+        where id = v_survey_id;
+
+        -- Xóa các panel notes không còn trong payload
+        delete from public.panel_notes n
+        where n.survey_id = v_survey_id
+          and not exists (
+              select 1 from jsonb_array_elements(v_notes) e
+              where e->>'id' = n.id::text
+          );
+    end if;
+
+    -- Thêm note mới, chỉ cập nhật note có nội dung thay đổi
+    insert into public.panel_notes as p (id, survey_id, area, device, findings, images, created_by)
+    select n.id, v_survey_id, n.area, n.device, n.findings, n.images, v_user_id
+    from jsonb_populate_recordset(null::public.panel_notes, v_notes) n
+    on conflict (id) do update set
+        area       = excluded.area,
+        device     = excluded.device,
+        findings   = excluded.findings,
+        images     = excluded.images
+    where p.survey_id = excluded.survey_id
+      and (p.area, p.device, p.findings, p.images)
+          is distinct from (excluded.area, excluded.device, excluded.findings, excluded.images);
+
+    return jsonb_build_object('id', v_survey_id);
+end;
+$$;
+
+revoke execute on function public.save_survey(jsonb) from public, anon, authenticated;
+grant execute on function public.save_survey(jsonb) to service_role;
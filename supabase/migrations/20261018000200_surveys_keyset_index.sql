@@ -0,0 +1,5 @@
+-- Chỉ mục cho phân trang keyset của danh sách khảo sát:
+-- order by created_at desc, id desc, trang sau lọc theo (created_at, id) < (trang trước).
+
+create index if not exists surveys_created_at_id_idx
+    on public.surveys (created_at desc, id desc);
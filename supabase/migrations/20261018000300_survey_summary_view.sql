@@ -0,0 +1,37 @@
+-- Danh sách khảo sát gọn cho trang xem danh sách và tìm kiếm: chỉ các cột hiển thị,
+-- tên người tạo và số panel note/số ảnh tính sẵn. Cột findings có trong view để
+-- lọc (tìm kiếm theo mô tả), trang danh sách không lấy cột này.
+-- Dữ liệu đầy đủ (participants, surveyors, images, ...) chỉ lấy khi mở một khảo sát.
+
+create index if not exists panel_notes_survey_id_idx
+    on public.panel_notes (survey_id);
+
+create or replace view public.survey_summary
+with (security_invoker = true)
+as
+select
+    s.id,
+    s.company_name,
+    s.survey_date,
+    s.area,
+    s.device,
+    s.findings,
+    s.created_by,
+    s.created_at,
+    u.full_name as creator_name,
+    coalesce(n.note_count, 0) as note_count,
+    case when jsonb_typeof(to_jsonb(s.images)) = 'array' then jsonb_array_length(to_jsonb(s.images)) else 0 end
+        + coalesce(n.image_count, 0) as image_count
+from public.surveys s
+join public.users u on u.id = s.created_by
+left join lateral (
+    select
+        count(*) as note_count,
+        sum(case when jsonb_typeof(to_jsonb(p.images)) = 'array' then jsonb_array_length(to_jsonb(p.images)) else 0 end) as image_count
+    from public.panel_notes p
+    where p.survey_id = s.id
+) n on true;
+
+-- Như save_survey: chỉ máy chủ Streamlit (service_role) đọc được, không lộ qua khóa anon công khai
+revoke all on public.survey_summary from public, anon, authenticated;
+grant select on public.survey_summary to service_role;
@@ -0,0 +1,172 @@
+-- Tìm kiếm toàn văn không phân biệt dấu trên khảo sát và panel notes.
+--
+-- Cấu hình public.vn_unaccent bỏ dấu từng từ trước khi đưa vào tsvector/tsquery
+-- ("máy nén" và "may nen" cho cùng lexeme), nhưng ts_headline vẫn hiển thị văn bản gốc.
+-- Cột search_vector được tính sẵn (generated) và đánh chỉ mục GIN; tên công ty
+-- có thêm chỉ mục trigram để tìm theo một phần tên.
+
+create extension if not exists unaccent with schema extensions;
+create extension if not exists pg_trgm with schema extensions;
+
+-- unaccent() không immutable nên không dùng trực tiếp trong chỉ mục được
+create or replace function public.f_unaccent(value text)
+returns text
+language sql
+immutable parallel safe strict
+as $$
+    select extensions.unaccent('extensions.unaccent'::regdictionary, value)
+$$;
+
+do $$
+begin
+    if not exists (select 1 from pg_ts_config where cfgname = 'vn_unaccent' and cfgnamespace = 'public'::regnamespace) then
+        create text search configuration public.vn_unaccent (copy = pg_catalog.simple);
+        alter text search configuration public.vn_unaccent
+            alter mapping for hword, hword_part, word with extensions.unaccent, simple;
+    end if;
+end
+$$;
+
+alter table public.surveys
+    add column if not exists search_vector tsvector generated always as (
+        setweight(to_tsvector('public.vn_unaccent'::regconfig, coalesce(company_name, '')), 'A') ||
+        setweight(to_tsvector('public.vn_unaccent'::regconfig, coalesce(area, '') || ' ' || coalesce(device, '')), 'B') ||
+        setweight(to_tsvector('public.vn_unaccent'::regconfig, coalesce(findings, '')), 'C')
+    ) stored;
+
+alter table public.panel_notes
+    add column if not exists search_vector tsvector generated always as (
+        setweight(to_tsvector('public.vn_unaccent'::regconfig, coalesce(area, '') || ' ' || coalesce(device, '')), 'B') ||
+        setweight(to_tsvector('public.vn_unaccent'::regconfig, coalesce(findings, '')), 'C')
+    ) stored;
+
+create index if not exists surveys_search_vector_idx
+    on public.surveys using gin (search_vector);
+create index if not exists panel_notes_search_vector_idx
+    on public.panel_notes using gin (search_vector);
+create index if not exists surveys_company_name_trgm_idx
+    on public.surveys using gin (public.f_unaccent(company_name) extensions.gin_trgm_ops);
+
+
+-- Chuyển chuỗi người dùng nhập thành tsquery: mọi từ đều phải có, cho phép khớp tiền tố
+-- ("may ne" khớp "máy nén"). Trả về null khi không còn từ nào.
+create or replace function public.survey_search_query(p_query text)
+returns tsquery
+language sql
+stable
+as $$
+    select to_tsquery('public.vn_unaccent', string_agg(quote_literal(word) || ':*', ' & '))
+    from regexp_split_to_table(lower(coalesce(p_query, '')), '\s+') as raw(word_raw),
+         lateral (select regexp_replace(word_raw, '[&|!():*<>''\\]', '', 'g') as word) w
+    where word <> ''
+$$;
+
+
+-- Tìm khảo sát theo nội dung khảo sát và panel notes, xếp theo độ liên quan.
+--
+-- p_created_by: chỉ tìm trong khảo sát của người này (null = tất cả).
+-- Phân trang keyset theo (rank, id) giảm dần: truyền rank và id của dòng cuối trang trước.
+-- rank là numeric làm tròn 6 chữ số, được so sánh đúng như giá trị trả về (không sai số float
+-- khi đi qua JSON), nên các trang không bỏ sót hay lặp lại dòng.
+-- Mỗi dòng có các cột của survey_summary, rank, note khớp nhất (matched_note_id)
+-- và đoạn trích có từ khóa được đánh dấu «…» (headline).
+create or replace function public.search_surveys(
+    p_query      text,
+    p_created_by public.surveys.created_by%type default null,
+    p_limit      integer default 20,
+    p_after_rank numeric default null,
+    p_after_id   public.surveys.id%type default null
+)
+returns table (
+    id              public.surveys.id%type,
+    company_name    text,
+    survey_date     public.surveys.survey_date%type,
+    area            text,
+    device          text,
+    created_by      public.surveys.created_by%type,
+    created_at      public.surveys.created_at%type,
+    creator_name    text,
+    note_count      bigint,
+    image_count     bigint,
+    rank            numeric,
+    matched_note_id public.panel_notes.id%type,
+    headline        text
+)
+language sql
+stable
+as $$
+    with q as (
+        select public.survey_search_query(p_query) as query,
+               -- Ký tự đại diện của LIKE trong chuỗi người dùng nhập được hiểu theo nghĩa đen
+               '%' || replace(replace(replace(
+                   public.f_unaccent(trim(coalesce(p_query, ''))), '\', '\\'), '%', '\%'), '_', '\_'
+               ) || '%' as pattern
+    ),
+    -- Note khớp nhất của mỗi khảo sát
+    note_hits as (
+        select distinct on (p.survey_id)
+               p.survey_id, p.id as note_id, ts_rank(p.search_vector, q.query) as rank
+        from public.panel_notes p, q
+        where p.search_vector @@ q.query
+        order by p.survey_id, ts_rank(p.search_vector, q.query) desc
+    ),
+    survey_hits as (
+        select s.id,
+               round(greatest(
+                   case when s.search_vector @@ q.query then ts_rank(s.search_vector, q.query) else 0 end,
+                   coalesce(n.rank, 0),
+                   -- Chỉ khớp một phần tên công ty: xếp sau các kết quả khớp từ
+                   0.0001
+               )::numeric, 6) as rank,
+               n.note_id
+        from public.surveys s
+        cross join q
+        left join note_hits n on n.survey_id = s.id
+        where s.id in (
+                  select s2.id from public.surveys s2
+                  where s2.search_vector @@ q.query
+                     or public.f_unaccent(s2.company_name) ilike q.pattern
+                  union
+                  select survey_id from note_hits
+              )
+          and (p_created_by is null or s.created_by = p_created_by)
+          -- Chuỗi tìm kiếm rỗng: không trả về gì (thay vì mọi khảo sát qua ilike '%%')
+          and q.query is not null
+    ),
+    page as (
+        select *
+        from survey_hits h
+        where p_after_rank is null or (h.rank, h.id) < (p_after_rank, p_after_id)
+        order by h.rank desc, h.id desc
+        limit p_limit
+    )
+    select sm.id, sm.company_name, sm.survey_date, sm.area, sm.device, sm.created_by, sm.created_at,
+           sm.creator_name, sm.note_count, sm.image_count, page.rank, page.note_id,
+           case
+               when pn.id is not null then ts_headline(
+                   'public.vn_unaccent',
+                   concat_ws(' | ', pn.area, pn.device, pn.findings),
+                   q.query,
+                   'StartSel=«, StopSel=», MaxWords=30, MinWords=10, MaxFragments=2'
+               )
+               else ts_headline(
+                   'public.vn_unaccent',
+                   concat_ws(' | ', s.company_name, s.area, s.device, s.findings),
+                   q.query,
+                   'StartSel=«, StopSel=», MaxWords=30, MinWords=10, MaxFragments=2'
+               )
+           end as headline
+    from page
+    cross join q
+    join public.survey_summary sm on sm.id = page.id
+    join public.surveys s on s.id = page.id
+    left join public.panel_notes pn on pn.id = page.note_id
+    order by page.rank desc, page.id desc
+$$;
+
+-- p_created_by do người gọi chọn (null = mọi khảo sát): chỉ máy chủ Streamlit (service_role),
+-- nơi p_created_by được đặt theo người dùng đã đăng nhập, được gọi hàm này
+revoke execute on function public.search_surveys(text, public.surveys.created_by%type, integer, numeric, public.surveys.id%type)
+    from public, anon, authenticated;
+grant execute on function public.search_surveys(text, public.surveys.created_by%type, integer, numeric, public.surveys.id%type)
+    to service_role;
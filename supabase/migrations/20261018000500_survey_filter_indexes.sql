@@ -0,0 +1,52 @@
+-- Chỉ mục cho bộ lọc kết hợp của danh sách khảo sát (ngày khảo sát, người tạo, công ty).
+--
+-- Danh sách luôn sắp xếp theo (created_at desc, id desc) nên chỉ mục theo người tạo
+-- có thêm hai cột này: lọc "khảo sát của tôi"/theo người tạo đọc thẳng từng trang trên chỉ mục.
+-- (created_by, survey_date) và survey_date phục vụ khi lọc theo khoảng ngày khảo sát.
+--
+-- Lọc theo công ty là ilike '%...%' trên cột company_name_unaccent của survey_summary
+-- (= f_unaccent(company_name)): biểu thức này đã có chỉ mục trigram
+-- surveys_company_name_trgm_idx (migration tìm kiếm toàn văn), nên không cần chỉ mục riêng.
+--
+-- Đo trên 100.000 khảo sát: tests/test_survey_filters_db.py (mỗi trang lọc < 100 ms).
+
+create index if not exists surveys_created_by_created_at_id_idx
+    on public.surveys (created_by, created_at desc, id desc);
+
+create index if not exists surveys_created_by_survey_date_idx
+    on public.surveys (created_by, survey_date);
+
+create index if not exists surveys_survey_date_idx
+    on public.surveys (survey_date);
+
+-- Các bản trước của migration này tạo hai chỉ mục không dùng được/trùng lặp
+drop index if exists public.surveys_company_name_survey_date_idx;
+drop index if exists public.surveys_company_name_plain_trgm_idx;
+
+-- Thêm cột company_name_unaccent vào cuối view (create or replace view chỉ cho thêm cột ở cuối)
+create or replace view public.survey_summary
+with (security_invoker = true)
+as
+select
+    s.id,
+    s.company_name,
+    s.survey_date,
+    s.area,
+    s.device,
+    s.findings,
+    s.created_by,
+    s.created_at,
+    u.full_name as creator_name,
+    coalesce(n.note_count, 0) as note_count,
+    case when jsonb_typeof(to_jsonb(s.images)) = 'array' then jsonb_array_length(to_jsonb(s.images)) else 0 end
+        + coalesce(n.image_count, 0) as image_count,
+    public.f_unaccent(s.company_name) as company_name_unaccent
+from public.surveys s
+join public.users u on u.id = s.created_by
+left join lateral (
+    select
+        count(*) as note_count,
+        sum(case when jsonb_typeof(to_jsonb(p.images)) = 'array' then jsonb_array_length(to_jsonb(p.images)) else 0 end) as image_count
+    from public.panel_notes p
+    where p.survey_id = s.id
+) n on true;
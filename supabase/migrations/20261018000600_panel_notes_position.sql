@@ -0,0 +1,108 @@
+-- Thứ tự ổn định cho panel notes: cột position (0, 1, 2, ... trong mỗi khảo sát).
+--
+-- Chi tiết khảo sát được tải bằng một request kèm panel_notes(*) sắp xếp theo position.
+-- Dữ liệu cũ chưa có thứ tự được đánh số theo thứ tự vật lý (ctid) của dòng trong bảng,
+-- gần đúng với thứ tự được thêm vào. Hàm save_survey được định nghĩa lại để ghi position.
+
+alter table public.panel_notes
+    add column if not exists position integer;
+
+update public.panel_notes p
+set position = numbered.position
+from (
+    select id, (row_number() over (partition by survey_id order by ctid) - 1)::integer as position
+    from public.panel_notes
+) numbered
+where numbered.id = p.id
+  and p.position is null;
+
+alter table public.panel_notes
+    alter column position set default 0,
+    alter column position set not null;
+
+create index if not exists panel_notes_survey_id_position_idx
+    on public.panel_notes (survey_id, position);
+
+
+-- save_survey: như 20261018000100_save_survey_rpc.sql, thêm ghi position cho panel notes.
+create or replace function public.save_survey(payload jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_user_id   public.users.id%type := payload->>'user_id';
+    v_survey_id public.surveys.id%type := payload->>'survey_id';
+    v_role      text;
+    v_owner     public.surveys.created_by%type;
+    v_survey    public.surveys;
+    v_notes     jsonb := coalesce(payload->'panel_notes', '[]'::jsonb);
+begin
+    select role into v_role from public.users where id = v_user_id;
+    if not found then
+        raise exception 'Không tìm thấy người dùng %', v_user_id using errcode = '42501';
+    end if;
+
+    -- Chuyển JSON sang kiểu cột thực tế của bảng surveys
+    v_survey := jsonb_populate_record(null::public.surveys, payload->'survey');
+
+    if v_survey_id is null then
+        insert into public.surveys (
+            company_name, address, phone, survey_date, participants, surveyors,
+            created_by, area, device, findings, images
+        )
+        values (
+            v_survey.company_name, v_survey.address, v_survey.phone, v_survey.survey_date,
+            v_survey.participants, v_survey.surveyors, v_user_id,
+            v_survey.area, v_survey.device, v_survey.findings, v_survey.images
+        )
+        returning id into v_survey_id;
+    else
+        select created_by into v_owner from public.surveys where id = v_survey_id for update;
+        if not found then
+            raise exception 'Không tìm thấy khảo sát ID: %', v_survey_id using errcode = 'P0002';
+        end if;
+        if v_role is distinct from 'admin' and v_owner is distinct from v_user_id then
+            raise exception 'Bạn không có quyền chỉnh sửa khảo sát này!' using errcode = '42501';
+        end if;
+
+        update public.surveys set
+            company_name = v_survey.company_name,
+            address      = v_survey.address,
+            phone        = v_survey.phone,
+            survey_date  = v_survey.survey_date,
+            participants = v_survey.participants,
+            surveyors    = v_survey.surveyors,
+            area         = v_survey.area,
+            device       = v_survey.device,
+            findings     = v_survey.findings,
+            images       = v_survey.images
+        where id = v_survey_id;
+
+        -- Xóa các panel notes không còn trong payload
+        delete from public.panel_notes n
+        where n.survey_id = v_survey_id
+          and not exists (
+              select 1 from jsonb_array_elements(v_notes) e
+              where e->>'id' = n.id::text
+          );
+    end if;
+
+    -- Thêm note mới, chỉ cập nhật note có nội dung hoặc vị trí thay đổi.
+    -- Vị trí của note là thứ tự của nó trong payload (bắt đầu từ 0).
+    insert into public.panel_notes as p (id, survey_id, area, device, findings, images, position, created_by)
+    select n.id, v_survey_id, n.area, n.device, n.findings, n.images, (e.ord - 1)::integer, v_user_id
+    from jsonb_array_elements(v_notes) with ordinality as e(note, ord)
+    cross join lateral jsonb_populate_record(null::public.panel_notes, e.note) n
+    on conflict (id) do update set
+        area       = excluded.area,
+        device     = excluded.device,
+        findings   = excluded.findings,
+        images     = excluded.images,
+        position   = excluded.position
+    where p.survey_id = excluded.survey_id
+      and (p.area, p.device, p.findings, p.images, p.position)
+          is distinct from (excluded.area, excluded.device, excluded.findings, excluded.images, excluded.position);
+
+    return jsonb_build_object('id', v_survey_id);
+end;
+$$;
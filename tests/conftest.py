@@ -0,0 +1,208 @@
+# --- Dùng chung cho các test: Supabase giả lập trong bộ nhớ ---
+import itertools
+import os
+import sys
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeQuery:
+    """Một phần nhỏ của query builder postgrest-py: đủ cho các hàm truy cập dữ liệu của ứng dụng"""
+
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.action = "select"
+        self.payload = None
+        self.filters = []
+        self.calls = []
+        self.limit_count = None
+        # Tham số thêm trực tiếp qua pagination.add_param (or, order)
+        self.params = httpx.QueryParams()
+
+    def _record(self, name, *args, **kwargs):
+        self.calls.append((name, args, kwargs))
+        return self
+
+    def select(self, columns="*"):
+        return self._record("select", columns)
+
+    def insert(self, rows):
+        self.action, self.payload = "insert", rows
+        return self._record("insert", rows)
+
+    def upsert(self, rows):
+        self.action, self.payload = "upsert", rows
+        return self._record("upsert", rows)
+
+    def update(self, values):
+        self.action, self.payload = "update", values
+        return self._record("update", values)
+
+    def delete(self):
+        self.action = "delete"
+        return self._record("delete")
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self._record("eq", column, value)
+
+    def in_(self, column, values):
+        values = list(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self._record("in_", column, values)
+
+    def gte(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) >= value)
+        return self._record("gte", column, value)
+
+    def lte(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) <= value)
+        return self._record("lte", column, value)
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) > value)
+        return self._record("gt", column, value)
+
+    def ilike(self, column, pattern):
+        return self._record("ilike", column, pattern)
+
+    def order(self, column, **kwargs):
+        return self._record("order", column, **kwargs)
+
+    def limit(self, count):
+        self.limit_count = count
+        return self._record("limit", count)
+
+    def execute(self):
+        self.db.executed.append(self)
+        if self.db.fail_on and self.db.fail_on(self):
+            raise RuntimeError(f"Lỗi giả lập khi {self.action} {self.table}")
+        rows = self.db.tables.setdefault(self.table, [])
+        if self.action == "insert":
+            inserted = []
+            for row in self.payload if isinstance(self.payload, list) else [self.payload]:
+                row = dict(row)
+                row.setdefault("id", next(self.db.ids))
+                rows.append(row)
+                inserted.append(dict(row))
+            return FakeResponse(inserted)
+        if self.action == "upsert":
+            by_id = {row["id"]: row for row in rows}
+            for row in self.payload:
+                if row["id"] in by_id:
+                    by_id[row["id"]].update(row)
+                else:
+                    rows.append(dict(row))
+            return FakeResponse([dict(row) for row in self.payload])
+        matched = [row for row in rows if all(f(row) for f in self.filters)]
+        if self.action == "update":
+            for row in matched:
+                row.update(self.payload)
+        elif self.action == "delete":
+            self.db.tables[self.table] = [row for row in rows if row not in matched]
+        if self.limit_count is not None:
+            matched = matched[:self.limit_count]
+        return FakeResponse([dict(row) for row in matched])
+
+
+class FakeRpc:
+    def __init__(self, db, name, params):
+        self.db = db
+        self.name = name
+        self.params = params
+
+    def execute(self):
+        self.db.rpc_calls.append((self.name, self.params))
+        handler = self.db.rpc_handlers.get(self.name)
+        if handler is None:
+            raise KeyError(self.name)
+        return FakeResponse(handler(self.params))
+
+
+class FakeSupabase:
+    """Supabase client giả: bảng là list dict trong bộ nhớ, RPC do test khai báo"""
+
+    def __init__(self, tables=None):
+        self.tables = {name: [dict(row) for row in rows] for name, rows in (tables or {}).items()}
+        self.ids = itertools.count(1000)
+        self.executed = []
+        self.rpc_calls = []
+        self.rpc_handlers = {}
+        self.fail_on = None
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def from_(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params):
+        return FakeRpc(self, name, params)
+
+
+@pytest.fixture
+def fake_supabase():
+    return FakeSupabase()
+
+
+@pytest.fixture
+def make_supabase():
+    """FakeSupabase với dữ liệu ban đầu: make_supabase({"surveys": [...]})"""
+    return FakeSupabase
+
+
+# --- Test trên CSDL thật, bỏ qua nếu không cấu hình ---
+# GETNOTES_TEST_DATABASE_URL trỏ tới một Postgres cục bộ (người dùng có quyền tạo role/extension).
+# CSDL trống được dựng bằng toàn bộ supabase/migrations (kể cả lược đồ gốc) ở lần chạy đầu.
+TEST_DATABASE_URL = os.environ.get("GETNOTES_TEST_DATABASE_URL")
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "supabase", "migrations")
+
+
+@pytest.fixture(scope="session")
+def database_url():
+    """URL của CSDL test đã chạy các migration"""
+    if not TEST_DATABASE_URL:
+        pytest.skip("Chưa đặt GETNOTES_TEST_DATABASE_URL")
+    psycopg = pytest.importorskip("psycopg")
+    with psycopg.connect(TEST_DATABASE_URL, autocommit=True) as conn:
+        # Migration cuối cùng đã chạy thì không chạy lại (các migration không chạy lại được nhiều lần)
+        if conn.execute("select to_regclass('public.survey_summary')").fetchone()[0] is None:
+            for name in sorted(os.listdir(MIGRATIONS_DIR)):
+                if name.endswith(".sql"):
+                    with open(os.path.join(MIGRATIONS_DIR, name), encoding="utf-8") as f:
+                        conn.execute(f.read())
+    return TEST_DATABASE_URL
+
+
+@pytest.fixture
+def db(database_url):
+    """Kết nối tới CSDL test trong một transaction, luôn rollback sau mỗi test"""
+    psycopg = pytest.importorskip("psycopg")
+    with psycopg.connect(database_url) as conn:
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+
+
+@pytest.fixture
+def db_users(db):
+    """Ba người dùng test: admin, member và một member khác; trả về dict tên -> id"""
+    ids = {}
+    with db.cursor() as cur:
+        for name, role in (("admin", "admin"), ("member", "member"), ("other", "member")):
+            cur.execute(
+                "insert into public.users (email, password, full_name, role) values (%s, 'x', %s, %s) returning id",
+                (f"test-{name}@getnotes.invalid", f"Test {name}", role)
+            )
+            ids[name] = cur.fetchone()[0]
+    return ids
@@ -0,0 +1,58 @@
+import os
+import tempfile
+from urllib.parse import unquote
+
+import tornado.web
+from tornado.testing import AsyncHTTPTestCase
+
+from utils import download_route
+from utils.download_route import download_url_path, make_token, read_token, register_download_route
+
+ACTIVE_SESSIONS = {"phien-1"}
+
+
+class DownloadRouteTest(AsyncHTTPTestCase):
+    def get_app(self):
+        self.root = tempfile.mkdtemp()
+        self.report = os.path.join(self.root, "job", "report.pdf")
+        os.makedirs(os.path.dirname(self.report))
+        with open(self.report, "wb") as f:
+            f.write(b"%PDF" + b"x" * (3 * download_route.DOWNLOAD_CHUNK_SIZE))
+        app = tornado.web.Application([(r"/.*", NotFoundHandler)])
+        register_download_route(app, "/app/", self.root, ACTIVE_SESSIONS.__contains__)
+        return app
+
+    def download(self, token):
+        return self.fetch(download_url_path("/app/", token))
+
+    def test_streams_file_for_active_session(self):
+        response = self.download(make_token(self.report, "Báo cáo.pdf", "application/pdf", "phien-1"))
+
+        assert response.code == 200
+        assert response.body == open(self.report, "rb").read()
+        assert response.headers["Content-Type"] == "application/pdf"
+        assert unquote(response.headers["Content-Disposition"]).endswith("Báo cáo.pdf")
+
+    def test_rejects_forged_expired_or_foreign_tokens(self):
+        token = make_token(self.report, "a.pdf", "application/pdf", "phien-1")
+        assert self.download(token[:-1] + ("0" if token[-1] != "0" else "1")).code == 403
+        assert self.download(make_token(self.report, "a.pdf", "application/pdf", "phien-1", ttl=-1)).code == 403
+        # Phiên đã đóng (đăng xuất/đóng tab)
+        assert self.download(make_token(self.report, "a.pdf", "application/pdf", "phien-2")).code == 403
+
+    def test_only_serves_files_under_job_directory(self):
+        outside = make_token(os.path.abspath(__file__), "a.py", "text/plain", "phien-1")
+        assert self.download(outside).code == 404
+
+
+class NotFoundHandler(tornado.web.RequestHandler):
+    # Thay cho route "bắt tất cả" của Streamlit: route tải xuống phải được chọn trước
+    def get(self):
+        raise tornado.web.HTTPError(418)
+
+
+def test_read_token_roundtrip():
+    claims = read_token(make_token("/tmp/x.zip", "x.zip", "application/zip", "s"))
+    assert (claims["path"], claims["name"], claims["session"]) == ("/tmp/x.zip", "x.zip", "s")
+    assert read_token("") is None
+    assert read_token("khong.hop.le") is None
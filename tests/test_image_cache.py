@@ -0,0 +1,82 @@
+import os
+
+from utils.image_cache import RAW_EXT, DiskImageCache
+
+
+def fill(cache, url, size):
+    key = cache._key(url)
+    cache._write(cache._path(key, RAW_EXT), b"x" * size)
+    cache._write_meta(key, {"url": url, "validated_at": 0})
+    return key
+
+
+def test_eviction_sees_entries_written_by_other_processes(tmp_path):
+    # Hai đối tượng cùng thư mục thay cho tiến trình Streamlit và tiến trình xuất báo cáo
+    main = DiskImageCache(str(tmp_path), max_bytes=2500)
+    worker = DiskImageCache(str(tmp_path), max_bytes=2500)
+
+    old = fill(worker, "https://x/old.jpg", 1000)
+    os.utime(main._path(old, RAW_EXT), (1, 1))
+    os.utime(main._path(old, ".json"), (1, 1))
+    recent = fill(worker, "https://x/recent.jpg", 1000)
+    newest = fill(main, "https://x/new.jpg", 1000)
+    main._evict()
+
+    assert not os.path.exists(main._path(old, RAW_EXT))
+    assert os.path.exists(main._path(recent, RAW_EXT))
+    assert os.path.exists(main._path(newest, RAW_EXT))
+    total = sum(entry.stat().st_size for entry in os.scandir(tmp_path))
+    assert total <= 2500
+
+
+def test_touch_protects_recently_used_entry(tmp_path):
+    cache = DiskImageCache(str(tmp_path), max_bytes=2500)
+    first = fill(cache, "https://x/1.jpg", 1000)
+    second = fill(cache, "https://x/2.jpg", 1000)
+    for key in (first, second):
+        for ext in (RAW_EXT, ".json"):
+            os.utime(cache._path(key, ext), (1 if key == first else 2,) * 2)
+    cache._touch(first)
+    fill(cache, "https://x/3.jpg", 1000)
+    cache._evict()
+
+    assert os.path.exists(cache._path(first, RAW_EXT))
+    assert not os.path.exists(cache._path(second, RAW_EXT))
+
+
+def test_download_images_keeps_no_content(monkeypatch):
+    from utils import image_cache
+
+    fetched = []
+
+    class Cache:
+        def fetch(self, url):
+            if "bad" in url:
+                raise IOError("404")
+            fetched.append(url)
+            return b"x" * 1000
+
+    monkeypatch.setattr(image_cache, "get_image_cache", lambda: Cache())
+    failed = image_cache.download_images(["https://x/1.jpg", "https://x/1.jpg", "https://x/bad.jpg"])
+
+    assert fetched == ["https://x/1.jpg"]
+    assert list(failed) == ["https://x/bad.jpg"]
+
+
+def test_evict_scans_directory_only_when_over_budget(tmp_path, monkeypatch):
+    cache = DiskImageCache(str(tmp_path), max_bytes=2500)
+    scans = []
+    scan = cache._scan
+    monkeypatch.setattr(cache, "_scan", lambda: scans.append(1) or scan())
+
+    fill(cache, "https://x/1.jpg", 1000)
+    cache._evict()  # Lần đầu: quét để biết dung lượng hiện có
+    fill(cache, "https://x/2.jpg", 1000)
+    cache._evict()
+    assert len(scans) == 1
+
+    fill(cache, "https://x/3.jpg", 1000)
+    cache._evict()  # Vượt giới hạn: quét lại và dọn
+    assert len(scans) == 2
+    total = sum(entry.stat().st_size for entry in os.scandir(tmp_path))
+    assert cache._total == total <= 2500
@@ -0,0 +1,120 @@
+import io
+
+import pytest
+from PIL import Image
+from storage3.utils import StorageException
+
+from utils import image_upload
+from utils.image_upload import normalize_options, thumbnail_url, upload_image_bytes, upload_object
+
+
+class FakeBucket:
+    def __init__(self):
+        self.objects = {}
+        self.list_calls = 0
+
+    def list(self, folder, options):
+        self.list_calls += 1
+        return [{"name": path.rsplit('/', 1)[1]} for path in self.objects if path.rsplit('/', 1)[0] == folder]
+
+    def upload(self, path, file, file_options):
+        self.objects[path] = file
+
+    def get_public_url(self, path):
+        return f"https://example.supabase.co/storage/v1/object/public/{image_upload.BUCKET_NAME}/{path}"
+
+
+class FakeStorage:
+    def __init__(self):
+        self.bucket = FakeBucket()
+
+    def from_(self, name):
+        return self.bucket
+
+
+class FakeClient:
+    def __init__(self):
+        self.storage = FakeStorage()
+
+
+@pytest.fixture(autouse=True)
+def forget_known_paths():
+    image_upload._known_paths.clear()
+    yield
+    image_upload._known_paths.clear()
+
+
+def object_path(url):
+    return url.split(f"/{image_upload.BUCKET_NAME}/", 1)[1]
+
+
+def jpeg_bytes(size=(800, 600)):
+    output = io.BytesIO()
+    Image.new("RGB", size, (200, 30, 30)).save(output, format="JPEG")
+    return output.getvalue()
+
+
+def test_normalized_upload_has_thumbnail_derivative():
+    client = FakeClient()
+    url = upload_image_bytes(client, "anh.jpg", jpeg_bytes())
+
+    thumb = thumbnail_url(url)
+    assert thumb != url
+    assert object_path(thumb) in client.storage.bucket.objects
+
+
+def test_unprocessable_upload_keeps_original_url_for_thumbnail():
+    client = FakeClient()
+    url = upload_image_bytes(client, "hong.jpg", b"khong phai anh")
+
+    assert object_path(url).startswith(image_upload.UNPROCESSED_PREFIX + "/")
+    # Không có ảnh phái sinh: gallery dùng URL gốc thay vì URL thumbs/ không tồn tại
+    assert thumbnail_url(url) == url
+    assert object_path(url) in client.storage.bucket.objects
+
+
+def test_new_image_checks_bucket_once():
+    client = FakeClient()
+    upload_image_bytes(client, "anh.jpg", jpeg_bytes((640, 480)))
+
+    bucket = client.storage.bucket
+    assert bucket.list_calls == 1
+    assert len(bucket.objects) == 1 + len(image_upload.DERIVATIVE_SIZES)
+
+    # Ảnh trùng: đã biết trong tiến trình, không hỏi lại bucket
+    upload_image_bytes(client, "anh-2.jpg", jpeg_bytes((640, 480)))
+    assert bucket.list_calls == 1
+
+
+class RaisingBucket(FakeBucket):
+    def __init__(self, error):
+        super().__init__()
+        self.error = error
+
+    def upload(self, path, file, file_options):
+        raise self.error
+
+
+def test_duplicate_upload_is_treated_as_existing():
+    bucket = RaisingBucket(StorageException({"statusCode": 409, "error": "Duplicate", "message": "exists"}))
+    upload_object(bucket, "ab/abc.jpg", b"x", "image/jpeg", check_exists=False)
+    assert image_upload.object_exists(bucket, "ab/abc.jpg")
+
+    # Lỗi khác (kể cả có chữ 409 trong thông báo) vẫn được báo lên
+    bucket = RaisingBucket(StorageException({"statusCode": 400, "error": "Bad", "message": "409 bytes"}))
+    with pytest.raises(StorageException):
+        upload_object(bucket, "ab/def.jpg", b"x", "image/jpeg", check_exists=False)
+
+
+def test_known_paths_are_bounded(monkeypatch):
+    monkeypatch.setattr(image_upload, "KNOWN_PATHS_MAX_ENTRIES", 2)
+    bucket = FakeBucket()
+    for name in ("a", "b", "c"):
+        upload_object(bucket, f"ab/{name}.jpg", b"x", "image/jpeg", check_exists=False)
+    assert list(image_upload._known_paths) == ["ab/b.jpg", "ab/c.jpg"]
+
+
+def test_normalize_options_coerces_secret_strings():
+    options = normalize_options({"keep_original": "false", "max_edge": "1600", "quality": "70", "format": "webp"})
+    assert options == {"keep_original": False, "max_edge": 1600, "quality": 70, "format": "WEBP"}
+    assert normalize_options({"keep_original": "true"})["keep_original"] is True
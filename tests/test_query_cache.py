@@ -0,0 +1,24 @@
+from utils.query_cache import QueryCache
+
+
+def test_results_are_reused_until_cleared():
+    cache = QueryCache(ttl=60)
+    loads = []
+
+    assert cache.get_or_load("k", lambda: loads.append(1) or "a") == "a"
+    assert cache.get_or_load("k", lambda: loads.append(1) or "b") == "a"
+    cache.clear(5)
+    assert cache.get_or_load("k", lambda: loads.append(1) or "c") == "c"
+    assert len(loads) == 2
+
+
+def test_result_loaded_during_clear_is_not_stored():
+    cache = QueryCache(ttl=60)
+
+    def load_while_saved():
+        # Một khảo sát được lưu trong lúc truy vấn này đang chạy
+        cache.clear(5)
+        return "cũ"
+
+    assert cache.get_or_load("k", load_while_saved) == "cũ"
+    assert cache.get_or_load("k", lambda: "mới") == "mới"
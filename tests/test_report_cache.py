@@ -0,0 +1,18 @@
+import uuid
+
+from utils.report_cache import ReportCache
+
+
+def test_invalidate_matches_ids_of_any_type():
+    cache = ReportCache(max_entries=10, max_bytes=1000)
+    survey_uuid = uuid.uuid4()
+    cache.put(5, "a", b"pdf")
+    cache.put(str(survey_uuid), "b", b"docx")
+    cache.put(6, "c", b"pdf")
+
+    cache.invalidate("5")
+    cache.invalidate(survey_uuid)
+
+    assert cache.get("a") is None
+    assert cache.get("b") is None
+    assert cache.get("c") == b"pdf"
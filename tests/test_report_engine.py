@@ -0,0 +1,76 @@
+import io
+import re
+
+from docx import Document
+from PIL import Image
+
+from utils.export_image import export_image_from_bytes
+from utils.report_engine import SurveyReport, render_report
+
+HEADER = {
+    "company_name": "Công ty A",
+    "address": "Hà Nội",
+    "phone": "0123",
+    "survey_date": "2026-10-18",
+    "participants": "Anh B",
+    "surveyors": "Chị C"
+}
+
+
+def jpeg(color, size=(120, 90)):
+    output = io.BytesIO()
+    Image.new("RGB", size, color).save(output, format="JPEG")
+    return export_image_from_bytes(output.getvalue())
+
+
+def survey_with_notes():
+    image_map = {"main.jpg": jpeg((255, 0, 0)), "note.jpg": jpeg((0, 0, 255))}
+    survey_data = {
+        "header": HEADER,
+        "detail": ["Xưởng chính", "Máy nén khí", "Rò rỉ khí nén ở đường ống chính"],
+        "image_urls": ["main.jpg"],
+        "panel_notes": [
+            {"area": "Khu phụ", "device": "Bơm", "findings": "Bơm chạy non tải", "images": ["note.jpg"]}
+        ]
+    }
+    return SurveyReport.from_survey_data(survey_data, image_map, exported_by="Tester")
+
+
+def test_areas_keep_main_section_before_panel_notes():
+    areas = list(survey_with_notes().areas())
+
+    assert [area[:3] for area in areas] == [
+        ("Xưởng chính", "Máy nén khí", "Rò rỉ khí nén ở đường ống chính"),
+        ("Khu phụ", "Bơm", "Bơm chạy non tải"),
+    ]
+    assert len(areas[0][3]) == 1
+    assert len(areas[1][3]) == 1
+
+
+def test_docx_with_notes_contains_main_findings_and_images():
+    data = render_report(survey_with_notes(), "docx")
+    doc = Document(io.BytesIO(data))
+    text = "\n".join(cell.text for table in doc.tables for row in table.rows for cell in row.cells)
+
+    assert "Rò rỉ khí nén ở đường ống chính" in text
+    assert "Bơm chạy non tải" in text
+    assert len(doc.inline_shapes) == 2
+
+
+def test_pdf_with_notes_contains_main_and_note_images():
+    data = render_report(survey_with_notes(), "pdf")
+
+    assert data.startswith(b"%PDF")
+    assert len(re.findall(rb"/Subtype\s*/Image", data)) == 2
+
+
+def test_notes_only_survey_skips_empty_main_section():
+    survey_data = {
+        "header": HEADER,
+        "detail": ["", "", ""],
+        "image_urls": [],
+        "panel_notes": [{"area": "Khu phụ", "device": "Bơm", "findings": "Rung", "images": []}]
+    }
+    areas = list(SurveyReport.from_survey_data(survey_data).areas())
+
+    assert [area[0] for area in areas] == ["Khu phụ"]
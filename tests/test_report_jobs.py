@@ -0,0 +1,87 @@
+import io
+import os
+
+from PIL import Image
+
+from utils import report_jobs
+from utils.export_image import export_image_from_bytes
+from utils.report_engine import SurveyReport
+
+SURVEY = {
+    "header": {
+        "company_name": "Công ty A", "address": "", "phone": "", "survey_date": "2026-10-18",
+        "participants": "", "surveyors": ""
+    },
+    "detail": ["Xưởng", "Máy nén", "Rò khí"],
+    "panel_notes": []
+}
+
+
+def big_jpeg():
+    output = io.BytesIO()
+    Image.new("RGB", (3000, 2000), (10, 120, 10)).save(output, format="JPEG")
+    return export_image_from_bytes(output.getvalue())
+
+
+def test_multi_format_job_builds_report_once(monkeypatch, tmp_path):
+    built = []
+    original = SurveyReport.from_survey_data.__func__
+
+    def counting(cls, *args, **kwargs):
+        report = original(cls, *args, **kwargs)
+        built.append(report)
+        return report
+
+    monkeypatch.setattr(SurveyReport, "from_survey_data", classmethod(counting))
+    result = report_jobs.run_export_job(str(tmp_path), SURVEY, ["pdf", "docx"], "Tester", main_images=[big_jpeg()])
+
+    assert len(built) == 1
+    assert set(result["paths"]) == {"pdf", "docx"}
+    assert all(os.path.getsize(path) > 0 for path in result["paths"].values())
+
+
+def test_report_resamples_each_image_once_per_box():
+    image = big_jpeg()
+    report = SurveyReport(SURVEY["header"], SURVEY["detail"], [image])
+
+    first = report.resampled(image, 400, 300)
+    assert first.width < image.width
+    assert report.resampled(image, 400, 300) is first
+
+
+class InlineExecutor:
+    """Chạy task ngay trên luồng gọi thay cho process pool, ghi lại các hàm được gửi"""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        from concurrent.futures import Future
+
+        self.submitted.append(fn)
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+def test_single_survey_export_skips_separate_prefetch(tmp_path):
+    manager = report_jobs.ExportJobManager(jobs_dir=str(tmp_path))
+    manager._executor = InlineExecutor()
+
+    job_id = manager.submit_formats(SURVEY, ["pdf", "docx"], "Tester", main_images=[big_jpeg()])
+    manager._jobs[job_id].future.result(timeout=60)
+
+    assert manager._executor.submitted == [report_jobs.run_export_job]
+    status = manager.status(job_id)
+    assert status["status"] == "done"
+    assert [os.path.dirname(file["path"]) for file in status["files"]] == [manager._jobs[job_id].directory] * 2
+
+
+def test_bulk_export_prefetches_images_once(tmp_path):
+    manager = report_jobs.ExportJobManager(jobs_dir=str(tmp_path))
+    manager._executor = InlineExecutor()
+
+    job_id = manager.submit_bulk([(None, SURVEY), (None, SURVEY)], ["pdf"], "Tester", "bao_cao.zip")
+    manager._jobs[job_id].future.result(timeout=60)
+
+    assert manager._executor.submitted == [report_jobs.run_prefetch_job] + [report_jobs.run_export_job] * 2
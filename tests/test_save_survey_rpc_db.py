@@ -0,0 +1,104 @@
+# Hàm save_survey trên CSDL thật: chạy khi đặt GETNOTES_TEST_DATABASE_URL (xem tests/conftest.py)
+import json
+import uuid
+
+import pytest
+
+SURVEY = {"company_name": "Công ty A", "area": "Xưởng 1", "device": "Máy nén", "findings": "Rò khí", "images": []}
+
+
+def note(area):
+    return {"id": str(uuid.uuid4()), "area": area, "device": "Bơm", "findings": "Rung", "images": []}
+
+
+def call_save(db, user_id, notes, survey_id=None, survey=SURVEY):
+    payload = {"survey_id": survey_id, "user_id": user_id, "survey": survey, "panel_notes": notes}
+    with db.cursor() as cur:
+        cur.execute("select public.save_survey(%s::jsonb)", (json.dumps(payload),))
+        return cur.fetchone()[0]["id"]
+
+
+def notes_of(db, survey_id):
+    with db.cursor() as cur:
+        cur.execute(
+            "select area, position, created_by from public.panel_notes where survey_id = %s order by position",
+            (survey_id,)
+        )
+        return cur.fetchall()
+
+
+def test_save_writes_survey_and_note_positions(db, db_users):
+    survey_id = call_save(db, db_users["member"], [note("A"), note("B"), note("C")])
+    assert [(area, position) for area, position, _ in notes_of(db, survey_id)] == [("A", 0), ("B", 1), ("C", 2)]
+
+
+def test_reorder_and_delete_rewrites_positions(db, db_users):
+    a, b, c = note("A"), note("B"), note("C")
+    survey_id = call_save(db, db_users["member"], [a, b, c])
+    call_save(db, db_users["member"], [c, a], survey_id)
+    assert [(area, position) for area, position, _ in notes_of(db, survey_id)] == [("C", 0), ("A", 1)]
+
+
+def test_failed_note_rolls_back_whole_save(db, db_users):
+    import psycopg
+
+    with db.cursor() as cur:
+        cur.execute("select count(*) from public.surveys")
+        before = cur.fetchone()[0]
+    bad = dict(note("B"), images="không phải mảng")
+    with pytest.raises(psycopg.Error):
+        with db.transaction():
+            call_save(db, db_users["member"], [note("A"), bad])
+    with db.cursor() as cur:
+        cur.execute("select count(*) from public.surveys")
+        assert cur.fetchone()[0] == before
+
+
+def test_member_cannot_edit_others_survey(db, db_users):
+    import psycopg
+
+    survey_id = call_save(db, db_users["member"], [note("A")])
+    with pytest.raises(psycopg.errors.InsufficientPrivilege):
+        with db.transaction():
+            call_save(db, db_users["other"], [], survey_id, dict(SURVEY, findings="Sửa"))
+
+
+def test_admin_edit_keeps_owner(db, db_users):
+    a = note("A")
+    survey_id = call_save(db, db_users["member"], [a])
+    call_save(db, db_users["admin"], [dict(a, findings="Admin sửa")], survey_id, dict(SURVEY, findings="Sửa"))
+    with db.cursor() as cur:
+        cur.execute("select created_by, findings from public.surveys where id = %s", (survey_id,))
+        assert cur.fetchone() == (db_users["member"], "Sửa")
+    assert [created_by for _, _, created_by in notes_of(db, survey_id)] == [db_users["member"]]
+
+
+@pytest.mark.parametrize("role", ["anon", "authenticated"])
+def test_only_service_role_can_execute(db, db_users, role):
+    import psycopg
+
+    with pytest.raises(psycopg.errors.InsufficientPrivilege):
+        with db.transaction():
+            with db.cursor() as cur:
+                cur.execute(f"set local role {role}")
+            call_save(db, db_users["member"], [note("A")])
+
+
+def test_position_column_is_required_and_indexed(db):
+    with db.cursor() as cur:
+        cur.execute(
+            "select is_nullable, column_default from information_schema.columns"
+            " where table_schema = 'public' and table_name = 'panel_notes' and column_name = 'position'"
+        )
+        assert cur.fetchone() == ("NO", "0")
+        cur.execute("select indexdef from pg_indexes where indexname = 'panel_notes_survey_id_position_idx'")
+        assert "(survey_id, \"position\")" in cur.fetchone()[0]
+
+
+def test_note_ids_are_uuid_with_database_default(db):
+    with db.cursor() as cur:
+        cur.execute(
+            "select data_type, column_default from information_schema.columns"
+            " where table_schema = 'public' and table_name = 'panel_notes' and column_name = 'id'"
+        )
+        assert cur.fetchone() == ("uuid", "gen_random_uuid()")
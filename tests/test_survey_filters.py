@@ -0,0 +1,41 @@
+import pytest
+
+# Cần streamlit (ô nhập bộ lọc); bỏ qua khi không import được, kể cả do phụ thuộc lệch phiên bản
+pytest.importorskip("streamlit", exc_type=ImportError)
+
+from utils.survey_filters import apply_survey_filters, unaccent  # noqa: E402
+
+ROWS = [
+    {"id": 1, "company_name": "Công ty A", "survey_date": "2026-01-05", "created_by": 1, "image_count": 0},
+    {"id": 2, "company_name": "Đà Nẵng", "survey_date": "2026-02-10", "created_by": 2, "image_count": 3},
+    {"id": 3, "company_name": "Công ty B", "survey_date": "2026-03-15", "created_by": 1, "image_count": 1},
+]
+
+
+def run(make_supabase, filters):
+    supabase = make_supabase({"survey_summary": ROWS})
+    query = apply_survey_filters(supabase.table("survey_summary").select("id"), filters)
+    return query, [row["id"] for row in query.execute().data]
+
+
+def test_no_filter_adds_no_condition(make_supabase):
+    query, ids = run(make_supabase, (None, None, None, None, None))
+    assert query.calls == [("select", ("id",), {})]
+    assert ids == [1, 2, 3]
+
+
+def test_date_creator_and_images_are_combined(make_supabase):
+    _, ids = run(make_supabase, ("2026-01-01", "2026-03-31", 1, None, True))
+    assert ids == [3]
+    _, ids = run(make_supabase, ("2026-02-10", "2026-02-10", None, None, False))
+    assert ids == []
+
+
+def test_company_filter_uses_unaccented_indexed_column(make_supabase):
+    query, _ = run(make_supabase, (None, None, None, "Đà nẵng 100%_", None))
+    assert ("ilike", ("company_name_unaccent", r"%Da nang 100\%\_%"), {}) in query.calls
+
+
+def test_unaccent_matches_vietnamese_diacritics():
+    assert unaccent("Công ty Điện lực Thủ Đức") == "Cong ty Dien luc Thu Duc"
+    assert unaccent("máy nén khí") == "may nen khi"
@@ -0,0 +1,66 @@
+# Bộ lọc danh sách khảo sát trên 100.000 dòng: chạy khi đặt GETNOTES_TEST_DATABASE_URL (xem tests/conftest.py)
+import time
+
+import pytest
+
+ROW_COUNT = 100_000
+# Mục tiêu cho một trang danh sách đã lọc
+MAX_PAGE_MS = 100
+
+# Cùng truy vấn PostgREST tạo ra cho một trang danh sách (pages/view_surveys.py + apply_survey_filters)
+PAGE_SQL = """
+    select id, company_name, survey_date, creator_name, note_count, image_count
+    from public.survey_summary
+    where {where}
+    order by created_at desc, id desc
+    limit 21
+"""
+
+FILTERS = {
+    "công ty": ("company_name_unaccent ilike %s", ["%cong ty 4242%"]),
+    "người tạo + ngày": ("created_by = %s and survey_date between %s and %s", ["member", "2026-01-01", "2026-01-31"]),
+    "ngày + có ảnh": ("survey_date between %s and %s and image_count > 0", ["2026-03-01", "2026-03-07"]),
+    "công ty + người tạo": ("company_name_unaccent ilike %s and created_by = %s", ["%da nang%", "other"]),
+}
+
+
+@pytest.fixture
+def many_surveys(db, db_users):
+    with db.cursor() as cur:
+        cur.execute(
+            """
+            insert into public.surveys (company_name, survey_date, area, device, findings, images, created_by)
+            select case when i %% 10 = 0 then 'Đà Nẵng ' || i else 'Công ty ' || i end,
+                   date '2026-01-01' + (i %% 365),
+                   'Khu ' || (i %% 50), 'Thiết bị', 'Mô tả',
+                   case when i %% 4 = 0 then array['https://example.invalid/' || i || '.jpg'] else '{}' end,
+                   case when i %% 3 = 0 then %s when i %% 3 = 1 then %s else %s end
+            from generate_series(1, %s) as i
+            """,
+            (db_users["admin"], db_users["member"], db_users["other"], ROW_COUNT)
+        )
+        cur.execute("analyze public.surveys")
+    return db_users
+
+
+@pytest.mark.parametrize("name", list(FILTERS))
+def test_filtered_page_is_fast_on_100k_rows(db, many_surveys, name):
+    where, params = FILTERS[name]
+    params = [many_surveys.get(value, value) for value in params]
+    sql = PAGE_SQL.format(where=where)
+    with db.cursor() as cur:
+        cur.execute(sql, params)  # làm nóng bộ đệm
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            cur.execute(sql, params)
+            cur.fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+    assert min(timings) < MAX_PAGE_MS, f"{name}: {min(timings):.1f} ms"
+
+
+def test_company_filter_uses_trigram_index(db, many_surveys):
+    with db.cursor() as cur:
+        cur.execute("explain " + PAGE_SQL.format(where="company_name_unaccent ilike %s"), ["%cong ty 4242%"])
+        plan = "\n".join(row[0] for row in cur.fetchall())
+    assert "surveys_company_name_trgm_idx" in plan
@@ -0,0 +1,44 @@
+import pytest
+from postgrest.exceptions import APIError
+
+# Cần streamlit (utils.pagination); bỏ qua khi không import được, kể cả do phụ thuộc lệch phiên bản
+pytest.importorskip("streamlit", exc_type=ImportError)
+
+from utils.pagination import escape_like  # noqa: E402
+from utils.survey_search import search_cursor, search_surveys, search_surveys_ilike  # noqa: E402
+
+
+def test_escape_like_makes_wildcards_literal():
+    assert escape_like(r"50%_a\b") == r"50\%\_a\\b"
+
+
+def test_cursor_rank_is_sent_as_the_rounded_decimal(fake_supabase):
+    rows = [{"id": 7, "rank": 0.060793}, {"id": 3, "rank": 0.0001}]
+    fake_supabase.rpc_handlers["search_surveys"] = lambda params: rows
+
+    page, has_next = search_surveys(fake_supabase, "máy nén", "*", page_size=1)
+    assert (page, has_next) == (rows[:1], True)
+
+    search_surveys(fake_supabase, "máy nén", "*", cursor=search_cursor(page[-1]), page_size=1)
+    params = fake_supabase.rpc_calls[-1][1]
+    assert params["p_after_rank"] == "0.060793"
+    assert params["p_after_id"] == 7
+
+
+def test_ilike_fallback_escapes_wildcards_and_quotes(fake_supabase):
+    fake_supabase.rpc_handlers["search_surveys"] = lambda params: (_ for _ in ()).throw(
+        APIError({"code": "PGRST202", "message": "không có hàm"})
+    )
+
+    search_surveys(fake_supabase, '100% "A"', "*")
+
+    query, = fake_supabase.executed
+    assert query.table == "survey_summary"
+    # Ký tự đại diện được escape cho LIKE, rồi dấu gạch chéo/ngoặc kép được escape cho PostgREST
+    assert r'company_name.ilike."*100\\% \"A\"*"' in query.params["or"]
+
+
+def test_ilike_fallback_filters_by_creator(fake_supabase):
+    search_surveys_ilike(fake_supabase, "bơm", "*", created_by=4)
+    query, = fake_supabase.executed
+    assert ("eq", ("created_by", 4), {}) in query.calls
@@ -0,0 +1,27 @@
+# Quyền trên tìm kiếm/danh sách khảo sát: chạy khi đặt GETNOTES_TEST_DATABASE_URL (xem tests/conftest.py)
+import pytest
+
+QUERIES = {
+    "search_surveys": "select * from public.search_surveys('may nen')",
+    "survey_summary": "select * from public.survey_summary limit 1",
+}
+
+
+@pytest.mark.parametrize("role", ["anon", "authenticated"])
+@pytest.mark.parametrize("name", list(QUERIES))
+def test_public_roles_cannot_read_surveys(db, role, name):
+    import psycopg
+
+    with pytest.raises(psycopg.errors.InsufficientPrivilege):
+        with db.transaction():
+            with db.cursor() as cur:
+                cur.execute(f"set local role {role}")
+                cur.execute(QUERIES[name])
+
+
+@pytest.mark.parametrize("name", list(QUERIES))
+def test_service_role_can_read_surveys(db, name):
+    with db.cursor() as cur:
+        cur.execute("set local role service_role")
+        cur.execute(QUERIES[name])
+        cur.fetchall()
@@ -0,0 +1,168 @@
+import pytest
+from postgrest.exceptions import APIError
+
+from utils import survey_store
+from utils.survey_store import SurveyDetailCache, SurveyPermissionError, fetch_survey, save_survey
+
+USER = {"id": 1, "role": "member"}
+ADMIN = {"id": 9, "role": "admin"}
+SURVEY = {"company_name": "Công ty A", "area": "Xưởng 1", "device": "Máy nén", "findings": "Rò khí", "images": []}
+NOTES = [
+    {"id": "n1", "area": "Khu A", "device": "Bơm", "findings": "Rung", "images": []},
+    {"id": "n2", "area": "Khu B", "device": "Quạt", "findings": "Ồn", "images": ["u1"]},
+]
+
+
+def rpc_error(code, message="lỗi"):
+    def handler(params):
+        raise APIError({"code": code, "message": message})
+    return handler
+
+
+def test_save_survey_sends_one_rpc_with_note_positions(fake_supabase):
+    fake_supabase.rpc_handlers["save_survey"] = lambda params: {"id": 42}
+
+    assert save_survey(fake_supabase, USER, SURVEY, NOTES) == 42
+
+    (name, params), = fake_supabase.rpc_calls
+    payload = params["payload"]
+    assert name == "save_survey"
+    assert payload["user_id"] == 1
+    assert [row["position"] for row in payload["panel_notes"]] == [0, 1]
+    # Không có request bảng nào ngoài lời gọi RPC
+    assert fake_supabase.executed == []
+
+
+def test_insufficient_privilege_becomes_permission_error(fake_supabase):
+    fake_supabase.rpc_handlers["save_survey"] = rpc_error(survey_store.INSUFFICIENT_PRIVILEGE_CODE, "Bạn không có quyền")
+
+    with pytest.raises(SurveyPermissionError, match="Bạn không có quyền"):
+        save_survey(fake_supabase, USER, SURVEY, NOTES, survey_id=5)
+    assert fake_supabase.executed == []
+
+
+def test_other_rpc_errors_are_raised(fake_supabase):
+    fake_supabase.rpc_handlers["save_survey"] = rpc_error("23502")
+
+    with pytest.raises(APIError):
+        save_survey(fake_supabase, USER, SURVEY, NOTES)
+    assert fake_supabase.executed == []
+
+
+def test_missing_rpc_falls_back_to_multi_request_insert(fake_supabase):
+    fake_supabase.rpc_handlers["save_survey"] = rpc_error(survey_store.RPC_NOT_FOUND_CODE)
+
+    survey_id = save_survey(fake_supabase, USER, SURVEY, NOTES)
+
+    survey, = fake_supabase.tables["surveys"]
+    assert survey["id"] == survey_id
+    assert survey["created_by"] == 1
+    notes = fake_supabase.tables["panel_notes"]
+    assert [(note["id"], note["survey_id"], note["position"]) for note in notes] == [
+        ("n1", survey_id, 0), ("n2", survey_id, 1)
+    ]
+
+
+def test_fallback_update_keeps_owner_and_checks_permission(make_supabase):
+    supabase = make_supabase({"surveys": [dict(SURVEY, id=5, created_by=1)], "panel_notes": []})
+    supabase.rpc_handlers["save_survey"] = rpc_error(survey_store.RPC_NOT_FOUND_CODE)
+
+    with pytest.raises(SurveyPermissionError):
+        save_survey(supabase, {"id": 2, "role": "member"}, dict(SURVEY, findings="Sửa"), NOTES, survey_id=5)
+    assert supabase.tables["surveys"][0]["findings"] == "Rò khí"
+
+    # Admin sửa khảo sát của người khác: người tạo không đổi
+    save_survey(supabase, ADMIN, dict(SURVEY, findings="Sửa"), NOTES, survey_id=5)
+    survey, = supabase.tables["surveys"]
+    assert survey["findings"] == "Sửa"
+    assert survey["created_by"] == 1
+
+
+def test_fallback_admin_edit_keeps_note_owners(make_supabase):
+    notes = [dict(NOTES[0], survey_id=5, position=0, created_by=1)]
+    supabase = make_supabase({"surveys": [dict(SURVEY, id=5, created_by=1)], "panel_notes": notes})
+    supabase.rpc_handlers["save_survey"] = rpc_error(survey_store.RPC_NOT_FOUND_CODE)
+
+    edited = [dict(NOTES[0], findings="Admin sửa"), NOTES[1]]
+    save_survey(supabase, ADMIN, SURVEY, edited, survey_id=5)
+
+    owners = {note["id"]: (note["findings"], note["created_by"]) for note in supabase.tables["panel_notes"]}
+    # Note cũ được sửa vẫn thuộc người tạo; note admin thêm mới thuộc admin
+    assert owners == {"n1": ("Admin sửa", 1), "n2": ("Ồn", ADMIN["id"])}
+
+
+def test_fetch_surveys_embeds_notes_ordered_by_position(make_supabase):
+    supabase = make_supabase({"surveys": [dict(SURVEY, id=5, created_by=1)]})
+
+    assert fetch_survey(supabase, 5)["id"] == 5
+    assert fetch_survey(supabase, 6) is None
+    query = supabase.executed[0]
+    assert ("select", (survey_store.SURVEY_DETAIL_SELECT,), {}) in query.calls
+    assert ("order", ("position",), {"foreign_table": "panel_notes"}) in query.calls
+
+
+class Loader:
+    """Hàm tải giả: đếm số lần gọi, mỗi lần trả về một bản mới"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return {"id": 5, "findings": f"lần {self.calls}", "panel_notes": [{"area": "A"}]}
+
+
+def test_detail_cache_returns_copies_until_invalidated():
+    cache, load = SurveyDetailCache(ttl=60), Loader()
+
+    first = cache.get_or_load(1, 5, load)
+    first["panel_notes"].append({"area": "sửa trong form"})
+    assert cache.get_or_load(1, "5", load) == {"id": 5, "findings": "lần 1", "panel_notes": [{"area": "A"}]}
+    assert load.calls == 1
+
+    cache.invalidate(5)
+    assert cache.get_or_load(1, 5, load)["findings"] == "lần 2"
+
+
+def test_detail_cache_is_per_user():
+    cache, load = SurveyDetailCache(ttl=60), Loader()
+
+    cache.get_or_load(1, 5, load)
+    cache.get_or_load(2, 5, load)
+    assert load.calls == 2
+
+
+def test_detail_cache_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(survey_store.time, "monotonic", lambda: now[0])
+    cache, load = SurveyDetailCache(ttl=30), Loader()
+
+    cache.get_or_load(1, 5, load)
+    now[0] += 29
+    cache.get_or_load(1, 5, load)
+    assert load.calls == 1
+    # Sửa ở tiến trình khác không gọi invalidate ở đây: hết TTL thì đọc lại
+    now[0] += 2
+    assert cache.get_or_load(1, 5, load)["findings"] == "lần 2"
+
+
+def test_detail_cache_drops_result_loaded_during_a_save():
+    cache = SurveyDetailCache(ttl=60)
+
+    def load_while_saved():
+        cache.invalidate(5)
+        return {"id": 5}
+
+    cache.get_or_load(1, 5, load_while_saved)
+    load = Loader()
+    cache.get_or_load(1, 5, load)
+    assert load.calls == 1
+
+
+def test_detail_cache_keeps_max_entries():
+    cache, load = SurveyDetailCache(ttl=60, max_entries=2), Loader()
+
+    for survey_id in (1, 2, 3):
+        cache.get_or_load(1, survey_id, load)
+    cache.get_or_load(1, 1, load)
+    assert load.calls == 4
@@ -0,0 +1 @@
+# Các module dùng chung cho Home.py và các trang trong thư mục pages/
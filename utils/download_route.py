@@ -0,0 +1,89 @@
+# --- Route Tornado tải file báo cáo theo từng khối (không nạp cả file vào bộ nhớ) ---
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+from urllib.parse import quote
+
+import tornado.web
+
+# Đường dẫn của route (sau server.baseUrlPath của Streamlit)
+DOWNLOAD_PATH = "getnotes-download"
+# Thời gian hiệu lực của một liên kết tải xuống (giây)
+DOWNLOAD_TOKEN_TTL = int(os.environ.get("GETNOTES_DOWNLOAD_TOKEN_TTL", 600))
+# Kích thước mỗi khối gửi đi
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+# Khóa ký token: sinh ngẫu nhiên cho mỗi tiến trình (route và nơi cấp token cùng tiến trình Streamlit)
+_SECRET = secrets.token_bytes(32)
+
+
+def _sign(body):
+    return hmac.new(_SECRET, body.encode("ascii"), hashlib.sha256).hexdigest()
+
+
+def make_token(path, file_name, mime_type, session_id, ttl=DOWNLOAD_TOKEN_TTL):
+    """Token ký HMAC cho phép phiên `session_id` tải file `path` trong `ttl` giây"""
+    claims = {"path": path, "name": file_name, "mime": mime_type, "session": session_id, "exp": time.time() + ttl}
+    body = base64.urlsafe_b64encode(json.dumps(claims).encode("utf-8")).decode("ascii")
+    return f"{body}.{_sign(body)}"
+
+
+def read_token(token):
+    """Nội dung của token nếu chữ ký đúng và còn hạn, ngược lại None"""
+    body, _, signature = (token or "").partition(".")
+    if not body or not hmac.compare_digest(_sign(body), signature):
+        return None
+    try:
+        claims = json.loads(base64.urlsafe_b64decode(body.encode("ascii")))
+    except ValueError:
+        return None
+    if claims.get("exp", 0) < time.time():
+        return None
+    return claims
+
+
+def download_url_path(base_url_path, token):
+    """Đường dẫn (tương đối với máy chủ) của liên kết tải xuống"""
+    prefix = "/".join(part for part in (base_url_path.strip("/"), DOWNLOAD_PATH) if part)
+    return f"/{prefix}?token={quote(token)}"
+
+
+class DownloadHandler(tornado.web.RequestHandler):
+    """Gửi file báo cáo theo token: chỉ file trong thư mục job, khi phiên cấp token còn mở"""
+
+    def initialize(self, root, is_active_session):
+        self.root = os.path.realpath(root)
+        self.is_active_session = is_active_session
+
+    async def get(self):
+        claims = read_token(self.get_argument("token", ""))
+        if claims is None or not self.is_active_session(claims["session"]):
+            raise tornado.web.HTTPError(403)
+        path = os.path.realpath(claims["path"])
+        if os.path.commonpath([self.root, path]) != self.root or not os.path.isfile(path):
+            raise tornado.web.HTTPError(404)
+
+        self.set_header("Content-Type", claims["mime"])
+        self.set_header("Content-Length", os.path.getsize(path))
+        self.set_header("Content-Disposition", f"attachment; filename*=UTF-8''{quote(claims['name'])}")
+        self.set_header("Cache-Control", "no-store")
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(DOWNLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                self.write(chunk)
+                # Chờ gửi xong khối này rồi mới đọc khối sau: bộ nhớ dùng không phụ thuộc kích thước file
+                await self.flush()
+
+
+def register_download_route(app, base_url_path, root, is_active_session):
+    """Thêm route tải xuống vào ứng dụng Tornado của Streamlit (trước các route mặc định)"""
+    prefix = "/".join(part for part in (base_url_path.strip("/"), DOWNLOAD_PATH) if part)
+    app.add_handlers(r".*$", [
+        (rf"/{prefix}", DownloadHandler, {"root": root, "is_active_session": is_active_session})
+    ])
@@ -0,0 +1,130 @@
+# --- Tải xuống file báo cáo đã tạo (nút tải xuống và tiến độ job xuất báo cáo) ---
+import gc
+import logging
+import os
+import threading
+
+import streamlit as st
+import tornado.web
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from utils.download_route import download_url_path, make_token, register_download_route
+from utils.report_jobs import get_export_jobs
+
+logger = logging.getLogger(__name__)
+
+# Chu kỳ kiểm tra lại trạng thái job xuất báo cáo (giây)
+POLL_INTERVAL = 1.0
+# Khi không dùng được route tải xuống: file lớn hơn mức này không gửi qua st.download_button
+# (nút này đọc cả file vào bộ nhớ của máy chủ)
+MAX_INLINE_DOWNLOAD_BYTES = int(os.environ.get("GETNOTES_MAX_INLINE_DOWNLOAD_BYTES", 50 * 1024 * 1024))
+
+_route_ready = None  # True/False sau lần đăng ký route đầu tiên
+_route_lock = threading.Lock()
+
+
+def _download_route_ready():
+    """Đăng ký route tải xuống vào máy chủ Tornado của Streamlit (một lần mỗi tiến trình)"""
+    global _route_ready
+    with _route_lock:
+        if _route_ready is None:
+            _route_ready = False
+            try:
+                # Streamlit không công khai đối tượng Application: tìm qua các tham chiếu tới lớp
+                apps = [obj for obj in gc.get_referrers(tornado.web.Application)
+                        if isinstance(obj, tornado.web.Application)]
+                if len(apps) == 1:
+                    register_download_route(
+                        apps[0],
+                        st.get_option("server.baseUrlPath"),
+                        get_export_jobs().jobs_dir,
+                        Runtime.instance().is_active_session
+                    )
+                    _route_ready = True
+                else:
+                    logger.warning("Không tìm thấy máy chủ Tornado của Streamlit, dùng st.download_button")
+            except Exception as e:
+                logger.warning("Không thể đăng ký route tải xuống: %s", e)
+        return _route_ready
+
+
+def show_download(source, file_name, label, mime="application/octet-stream"):
+    """Hiển thị nút tải xuống cho file báo cáo (`source` là bytes hoặc đường dẫn file của job).
+
+    File của job được gửi theo từng khối qua route tải xuống, với liên kết ký riêng cho
+    phiên hiện tại và hết hạn sau ít phút; máy chủ không nạp cả file vào bộ nhớ.
+    """
+    if not isinstance(source, str):
+        st.download_button(label, data=source, file_name=file_name, mime=mime, key=f"download_{file_name}")
+        return
+
+    if _download_route_ready():
+        token = make_token(source, file_name, mime, get_script_run_ctx().session_id)
+        st.link_button(label, download_url_path(st.get_option("server.baseUrlPath"), token))
+        return
+
+    # Không có route: st.download_button đọc cả file vào bộ nhớ mỗi lần trang chạy lại khi nút
+    # còn hiển thị, nên chỉ hiện nút sau khi người dùng yêu cầu và chỉ với file không quá lớn
+    size = os.path.getsize(source)
+    if size > MAX_INLINE_DOWNLOAD_BYTES:
+        st.error(
+            f"File {file_name} quá lớn để tải xuống ({size / 1024 / 1024:.0f} MB, "
+            f"tối đa {MAX_INLINE_DOWNLOAD_BYTES / 1024 / 1024:.0f} MB). Vui lòng xuất ít khảo sát hơn."
+        )
+        return
+    prepare_key = f"prepare_download_{source}"
+    if not st.session_state.get(prepare_key):
+        if not st.button(f"📦 Chuẩn bị tải xuống {file_name}", key=f"prepare_{file_name}"):
+            return
+        st.session_state[prepare_key] = True
+    with open(source, 'rb') as f:
+        st.download_button(
+            label, data=f, file_name=file_name, mime=mime, key=f"download_{file_name}",
+            # Đã tải: bỏ nút để các lần chạy lại sau không đọc lại file
+            on_click=lambda: st.session_state.pop(prepare_key, None)
+        )
+
+
+@st.fragment(run_every=POLL_INTERVAL)
+def _poll_job_progress(job_id):
+    status = get_export_jobs().status(job_id)
+    if status is None or status["status"] not in ("queued", "running"):
+        # Job kết thúc: chạy lại cả trang một lần để hiển thị kết quả
+        st.rerun()
+    st.progress(status["progress"], text=status["message"])
+
+
+def show_job_progress(job_id):
+    """Thanh tiến độ của job đang chạy, tự cập nhật mỗi POLL_INTERVAL giây.
+
+    Chỉ fragment này được chạy lại, không chạy lại cả trang (và các truy vấn của trang).
+    """
+    _poll_job_progress(job_id)
+
+
+def show_export_job(job_id, label):
+    """Hiển thị tiến độ job xuất báo cáo cho đến khi job kết thúc, sau đó là nút tải xuống (hoặc lỗi).
+
+    `label` là nhãn nút tải xuống, hoặc dict phần mở rộng file -> nhãn khi job tạo nhiều file.
+    """
+    status = get_export_jobs().status(job_id)
+    if status is None:
+        st.warning("Không tìm thấy yêu cầu xuất báo cáo, vui lòng tạo lại.")
+        return
+
+    if status["status"] in ("queued", "running"):
+        show_job_progress(job_id)
+        return
+
+    if status["status"] == "failed":
+        st.error(f"Lỗi khi tạo báo cáo: {status['error']}")
+        return
+
+    for warning in status["warnings"]:
+        st.warning(warning)
+    for file in status["files"]:
+        file_label = label
+        if isinstance(label, dict):
+            file_label = label.get(os.path.splitext(file["file_name"])[1].lstrip('.'), file["file_name"])
+        show_download(file["path"], file["file_name"], file_label, file["mime_type"])
@@ -0,0 +1,103 @@
+# --- Ảnh sẵn sàng để nhúng vào báo cáo PDF/Word ---
+import io
+import os
+
+from PIL import Image, ImageOps
+import pillow_heif
+
+# Cho phép Image.open đọc trực tiếp ảnh HEIC/HEIF
+pillow_heif.register_heif_opener()
+
+# Thẻ EXIF Orientation
+EXIF_ORIENTATION = 0x0112
+# Chất lượng JPEG khi buộc phải chuyển đổi ảnh
+EXPORT_JPEG_QUALITY = 90
+# Độ phân giải mục tiêu của ảnh trong báo cáo theo kích thước đặt ảnh (có thể đổi bằng biến môi trường)
+EXPORT_DPI = int(os.environ.get("GETNOTES_EXPORT_DPI", 150))
+# Chỉ lấy mẫu lại khi ảnh lớn hơn mức cần thiết theo tỷ lệ này
+RESAMPLE_THRESHOLD = 1.25
+
+
+class ExportImage:
+    """Nội dung JPEG của một ảnh cùng kích thước (pixel), dùng trực tiếp cho ReportLab và python-docx"""
+
+    __slots__ = ("data", "width", "height")
+
+    def __init__(self, data, width, height):
+        self.data = data
+        self.width = width
+        self.height = height
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    def stream(self):
+        """File-like mới cho mỗi lần nhúng ảnh"""
+        return io.BytesIO(self.data)
+
+
+def is_passthrough_jpeg(img):
+    """Ảnh JPEG RGB/xám không cần xoay: nhúng nguyên bản, không cần giải mã"""
+    if img.format != 'JPEG' or img.mode not in ('RGB', 'L'):
+        return False
+    return img.getexif().get(EXIF_ORIENTATION, 1) == 1
+
+
+def export_image_from_pil(img):
+    """Chuyển ảnh PIL (đã giải mã) sang JPEG RGB để xuất báo cáo"""
+    img = ImageOps.exif_transpose(img)
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[3])
+        img = background
+    elif img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+
+    output = io.BytesIO()
+    img.save(output, format='JPEG', quality=EXPORT_JPEG_QUALITY)
+    return ExportImage(output.getvalue(), img.width, img.height)
+
+
+def export_image_from_bytes(data):
+    """Tạo ExportImage từ nội dung file ảnh.
+
+    JPEG không cần biến đổi được dùng nguyên bản (chỉ đọc header để lấy kích
+    thước); HEIC, PNG, BMP, ảnh RGBA/CMYK hoặc cần xoay mới được chuyển đổi.
+    """
+    img = Image.open(io.BytesIO(data))
+    if is_passthrough_jpeg(img):
+        return ExportImage(data, img.width, img.height)
+    return export_image_from_pil(img)
+
+
+def resample_for_box(image, box_width, box_height=None, dpi=EXPORT_DPI):
+    """Giảm độ phân giải ảnh theo DPI mục tiêu cho khung đặt ảnh (đơn vị point, 1/72 inch).
+
+    Ảnh được đặt vừa khung `box_width` x `box_height` (giữ tỷ lệ). Ảnh đã đủ
+    nhỏ được giữ nguyên; với JPEG, ảnh lớn được giải mã ở tỷ lệ thu nhỏ
+    (draft mode) nên không phải giải mã toàn bộ điểm ảnh.
+    """
+    if image is None or image.width <= 0 or image.height <= 0:
+        return image
+
+    ratio = box_width / image.width
+    if box_height:
+        ratio = min(ratio, box_height / image.height)
+    target_width = max(1, round(image.width * ratio / 72 * dpi))
+    target_height = max(1, round(image.height * ratio / 72 * dpi))
+
+    # Chỉ lấy mẫu lại khi ảnh lớn hơn đáng kể so với mức cần thiết
+    if image.width <= target_width * RESAMPLE_THRESHOLD:
+        return image
+
+    img = Image.open(image.stream())
+    img.draft('RGB', (target_width, target_height))
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    img = img.resize((target_width, target_height), Image.LANCZOS)
+
+    output = io.BytesIO()
+    img.save(output, format='JPEG', quality=EXPORT_JPEG_QUALITY, optimize=True)
+    return ExportImage(output.getvalue(), img.width, img.height)
@@ -0,0 +1,129 @@
+# --- Tìm và đăng ký font hỗ trợ tiếng Việt cho ReportLab (một lần cho mỗi tiến trình) ---
+import collections
+import logging
+import os
+import threading
+
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.lib.fonts import addMapping
+
+logger = logging.getLogger(__name__)
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets')
+
+# Các thư mục có thể chứa font, theo thứ tự ưu tiên
+FONT_DIRS = [
+    os.path.join(ASSETS_DIR, 'fonts'),
+    ASSETS_DIR,
+    '/usr/share/fonts/truetype/msttcorefonts',
+    '/usr/share/fonts/truetype/dejavu',
+    '/usr/share/fonts/truetype',
+    '/usr/share/fonts/TTF',
+    'C:\\Windows\\Fonts',  # Đường dẫn Windows
+]
+
+# Các họ font để thử: tên đăng ký -> tên file có thể có cho từng kiểu chữ
+FONT_FAMILIES = [
+    ('TimesTiengViet', {
+        'normal': ['Times New Roman.ttf', 'times.ttf'],
+        'bold': ['Times New Roman Bold.ttf', 'timesbd.ttf'],
+        'italic': ['Times New Roman Italic.ttf', 'timesi.ttf'],
+        'boldItalic': ['Times New Roman Bold Italic.ttf', 'timesbi.ttf'],
+    }),
+    ('Arial', {
+        'normal': ['Arial.ttf', 'arial.ttf'],
+        'bold': ['Arial Bold.ttf', 'arialbd.ttf'],
+        'italic': ['Arial Italic.ttf', 'ariali.ttf'],
+        'boldItalic': ['Arial Bold Italic.ttf', 'arialbi.ttf'],
+    }),
+    ('RomanD', {
+        'normal': ['RomanD.ttf', 'romand.ttf'],
+        'bold': [],
+        'italic': [],
+        'boldItalic': [],
+    }),
+    ('DejaVuSans', {
+        'normal': ['DejaVuSans.ttf'],
+        'bold': ['DejaVuSans-Bold.ttf'],
+        'italic': ['DejaVuSans-Oblique.ttf'],
+        'boldItalic': ['DejaVuSans-BoldOblique.ttf'],
+    }),
+]
+
+# Các ký tự tiếng Việt font bắt buộc phải có
+VIETNAMESE_PROBE = "ăâđêôơưạảấầẩẫậắằẳẵặẹẻẽếềểễệỉịọỏốồổỗộớờởỡợụủứừửữựỳỵỷỹ"
+
+# Font có sẵn của ReportLab khi không tìm được font tiếng Việt
+FALLBACK_FONTS = ('Times-Roman', 'Times-Roman', 'Times-Bold', 'Times-Italic', 'Times-BoldItalic')
+
+ReportFonts = collections.namedtuple('ReportFonts', ['family', 'normal', 'bold', 'italic', 'bold_italic'])
+
+_lock = threading.Lock()
+_resolved = None
+
+
+def find_font_file(file_names):
+    """Đường dẫn đầu tiên tồn tại (và không rỗng) của một trong các tên file font"""
+    for directory in FONT_DIRS:
+        for file_name in file_names:
+            path = os.path.join(directory, file_name)
+            if os.path.isfile(path) and os.path.getsize(path) > 0:
+                return path
+    return None
+
+
+def supports_vietnamese(font):
+    char_map = font.face.charToGlyph
+    return all(ord(char) in char_map for char in VIETNAMESE_PROBE)
+
+
+def register_family(family, files):
+    """Đăng ký một họ font (thường/đậm/nghiêng), trả về ReportFonts hoặc None nếu không dùng được"""
+    path = find_font_file(files['normal'])
+    if not path:
+        return None
+    font = TTFont(family, path)
+    if not supports_vietnamese(font):
+        logger.info("Font %s (%s) không hỗ trợ đầy đủ tiếng Việt", family, path)
+        return None
+    pdfmetrics.registerFont(font)
+
+    names = {'normal': family}
+    for style, suffix in (('bold', '-Bold'), ('italic', '-Italic'), ('boldItalic', '-BoldItalic')):
+        names[style] = family  # Không có file riêng thì dùng kiểu thường
+        style_path = find_font_file(files[style])
+        if style_path:
+            try:
+                pdfmetrics.registerFont(TTFont(family + suffix, style_path))
+                names[style] = family + suffix
+            except Exception as e:
+                logger.warning("Không thể đăng ký font %s từ %s: %s", family + suffix, style_path, e)
+
+    # Cho phép dùng <b>/<i> trong Paragraph
+    addMapping(family, 0, 0, names['normal'])
+    addMapping(family, 1, 0, names['bold'])
+    addMapping(family, 0, 1, names['italic'])
+    addMapping(family, 1, 1, names['boldItalic'])
+    logger.info("Đã đăng ký font %s từ %s", family, path)
+    return ReportFonts(family, names['normal'], names['bold'], names['italic'], names['boldItalic'])
+
+
+def get_report_fonts():
+    """Font dùng cho báo cáo PDF; chỉ tìm và đăng ký lần đầu tiên được gọi trong tiến trình"""
+    global _resolved
+    with _lock:
+        if _resolved is None:
+            for family, files in FONT_FAMILIES:
+                try:
+                    fonts = register_family(family, files)
+                except Exception as e:
+                    logger.warning("Lỗi khi đăng ký font %s: %s", family, e)
+                    fonts = None
+                if fonts:
+                    _resolved = fonts
+                    break
+            else:
+                logger.warning("Không tìm thấy font hỗ trợ tiếng Việt, dùng font mặc định %s", FALLBACK_FONTS[0])
+                _resolved = ReportFonts(*FALLBACK_FONTS)
+        return _resolved
@@ -0,0 +1,121 @@
+# --- HTTP session dùng chung cho việc tải ảnh (giữ kết nối, timeout, thử lại) ---
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Số kết nối giữ lại cho mỗi host (nên >= số luồng tải ảnh song song)
+POOL_SIZE = 16
+# Timeout kết nối và timeout đọc (giây)
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+# Thử lại khi lỗi tạm thời: mã 5xx, mất kết nối, timeout
+MAX_RETRIES = 3
+RETRY_STATUSES = {500, 502, 503, 504}
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8
+
+
+class HttpStats:
+    """Bộ đếm số request, số lần thử lại và độ trễ của session dùng chung"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, latency, failed=False, retried=False):
+        with self._lock:
+            self.requests += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            if failed:
+                self.failures += 1
+            if retried:
+                self.retries += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "failures": self.failures,
+                "avg_latency": self.total_latency / self.requests if self.requests else 0.0,
+                "max_latency": self.max_latency
+            }
+
+
+_session = None
+_adapter = None
+_session_lock = threading.Lock()
+_stats = HttpStats()
+
+
+def get_http_session():
+    """Session requests dùng chung của tiến trình, với pool kết nối giữ sẵn"""
+    global _session, _adapter
+    with _session_lock:
+        if _session is None:
+            _adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE, max_retries=0)
+            _session = requests.Session()
+            _session.mount("https://", _adapter)
+            _session.mount("http://", _adapter)
+        return _session
+
+
+def backoff_delay(attempt):
+    """Thời gian chờ trước lần thử lại thứ `attempt` (full jitter)"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def http_get(url, headers=None, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)):
+    """GET qua session dùng chung, tự thử lại khi gặp lỗi tạm thời"""
+    session = get_http_session()
+    for attempt in range(MAX_RETRIES + 1):
+        start = time.perf_counter()
+        try:
+            response = session.get(url, headers=headers, timeout=timeout)
+        except (requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+                requests.exceptions.ChunkedEncodingError) as e:
+            will_retry = attempt < MAX_RETRIES
+            _stats.record(time.perf_counter() - start, failed=True, retried=will_retry)
+            if not will_retry:
+                raise
+            logger.info("Lỗi khi tải %s (lần %d): %s, thử lại", url, attempt + 1, e)
+            time.sleep(backoff_delay(attempt))
+            continue
+
+        will_retry = response.status_code in RETRY_STATUSES and attempt < MAX_RETRIES
+        _stats.record(time.perf_counter() - start, failed=response.status_code >= 500, retried=will_retry)
+        if not will_retry:
+            return response
+        logger.info("Máy chủ trả về %s cho %s (lần %d), thử lại", response.status_code, url, attempt + 1)
+        response.close()
+        time.sleep(backoff_delay(attempt))
+
+
+def get_http_stats():
+    """Số liệu của session dùng chung: request, thử lại, độ trễ và số lần dùng lại kết nối"""
+    stats = _stats.snapshot()
+    connections = 0
+    pooled_requests = 0
+    with _session_lock:
+        if _adapter is not None:
+            pools = _adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    connections += pool.num_connections
+                    pooled_requests += pool.num_requests
+    stats["connections_opened"] = connections
+    stats["connections_reused"] = max(0, pooled_requests - connections)
+    return stats
@@ -0,0 +1,303 @@
+# --- Bộ nhớ đệm ảnh trên đĩa (LRU, giới hạn dung lượng) cho việc xuất báo cáo ---
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from utils.export_image import ExportImage, export_image_from_bytes
+from utils.http_client import http_get
+
+logger = logging.getLogger(__name__)
+
+# Thư mục và dung lượng tối đa của bộ nhớ đệm (có thể đổi bằng biến môi trường)
+CACHE_DIR = os.environ.get(
+    "GETNOTES_IMAGE_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "getnotes_image_cache")
+)
+CACHE_MAX_BYTES = int(os.environ.get("GETNOTES_IMAGE_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+# Trong khoảng thời gian này (giây) sau lần kiểm tra gần nhất, dùng bản đệm mà không hỏi lại máy chủ
+REVALIDATE_AFTER = 300
+# Số ảnh được tải/giải mã cùng lúc khi chuẩn bị xuất báo cáo
+PREFETCH_WORKERS = 8
+
+# Phần mở rộng của các file thuộc một mục trong bộ nhớ đệm
+RAW_EXT = ".raw"      # Nội dung tải về nguyên bản
+READY_EXT = ".ready"  # JPEG đã chuyển đổi để xuất báo cáo (khi không dùng được bản gốc)
+META_EXT = ".json"    # URL, ETag, Last-Modified, kích thước ảnh
+
+
+class DiskImageCache:
+    """Bộ nhớ đệm ảnh theo URL trên đĩa, loại bỏ mục ít dùng nhất khi vượt dung lượng"""
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, revalidate_after=REVALIDATE_AFTER):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+        self._lock = threading.RLock()
+        # Tổng dung lượng ước tính của thư mục; None khi chưa quét (tính lần đầu ở _evict)
+        self._total = None
+
+    # --- Đọc/ghi file ---
+    def _key(self, url):
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _path(self, key, ext):
+        return os.path.join(self.directory, key + ext)
+
+    def _write(self, path, data):
+        # Ghi ra file tạm rồi đổi tên để các tiến trình khác không đọc phải file ghi dở
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        old_size = self._size_of(path)
+        os.replace(tmp_path, path)
+        self._grow(len(data) - old_size)
+
+    def _size_of(self, path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    def _grow(self, delta):
+        with self._lock:
+            if self._total is not None:
+                self._total += delta
+
+    def _read(self, path):
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _read_meta(self, key):
+        data = self._read(self._path(key, META_EXT))
+        if data is None:
+            return None
+        try:
+            return json.loads(data)
+        except ValueError:
+            return None
+
+    def _write_meta(self, key, meta):
+        self._write(self._path(key, META_EXT), json.dumps(meta).encode("utf-8"))
+
+    # --- LRU theo thời gian sửa file ---
+    # Thư mục được dùng chung bởi tiến trình Streamlit và các tiến trình xuất báo cáo, nên
+    # không giữ chỉ mục trong bộ nhớ: lần truy cập cuối là mtime của file (được `_touch`
+    # cập nhật). Mỗi tiến trình chỉ cộng dồn dung lượng các file nó ghi/xóa (`_total`);
+    # thư mục chỉ được quét lại lần đầu và khi tổng này vượt giới hạn, lúc đó mới thấy
+    # đúng dung lượng do các tiến trình khác ghi/xóa.
+    def _scan(self):
+        """key -> [dung lượng, lần truy cập cuối] của mọi mục hiện có trên đĩa"""
+        os.makedirs(self.directory, exist_ok=True)
+        index = {}
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".tmp"):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue  # Tiến trình khác vừa xóa
+            key = entry.name.split(".", 1)[0]
+            size, last_access = index.get(key, [0, 0])
+            index[key] = [size + stat.st_size, max(last_access, stat.st_mtime)]
+        return index
+
+    def _touch(self, key):
+        now = time.time()
+        try:
+            os.utime(self._path(key, META_EXT), (now, now))
+        except OSError:
+            pass
+
+    def _remove(self, key):
+        for ext in (RAW_EXT, READY_EXT, META_EXT):
+            path = self._path(key, ext)
+            size = self._size_of(path)
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._grow(-size)
+
+    def _evict(self):
+        with self._lock:
+            if self._total is not None and self._total <= self.max_bytes:
+                return
+            index = self._scan()
+            total = sum(size for size, _ in index.values())
+            if total > self.max_bytes:
+                for key, (size, _) in sorted(index.items(), key=lambda item: item[1][1]):
+                    if total <= self.max_bytes:
+                        break
+                    self._remove(key)
+                    total -= size
+            self._total = total
+
+    # --- API ---
+    def fetch(self, url):
+        """Trả về nội dung ảnh tại `url`, dùng bản đệm và kiểm tra lại bằng ETag/Last-Modified"""
+        key = self._key(url)
+        meta = self._read_meta(key)
+        raw = self._read(self._path(key, RAW_EXT)) if meta else None
+
+        if raw is not None and time.time() - meta.get("validated_at", 0) < self.revalidate_after:
+            self._touch(key)
+            return raw
+
+        headers = {}
+        if raw is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        response = http_get(url, headers=headers)
+        if response.status_code == 304 and raw is not None:
+            meta["validated_at"] = time.time()
+            self._write_meta(key, meta)
+            self._touch(key)
+            return raw
+        response.raise_for_status()
+
+        raw = response.content
+        with self._lock:
+            # Nội dung mới: bỏ bản chuyển đổi cũ nếu có
+            ready_path = self._path(key, READY_EXT)
+            ready_size = self._size_of(ready_path)
+            try:
+                os.remove(ready_path)
+                self._grow(-ready_size)
+            except OSError:
+                pass
+            self._write(self._path(key, RAW_EXT), raw)
+            self._write_meta(key, {
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "validated_at": time.time()
+            })
+            self._touch(key)
+        self._evict()
+        return raw
+
+    def get_export(self, url, raw):
+        """ExportImage của `url` nếu đã chuẩn bị trước đó (`raw` là nội dung tải về hiện tại)"""
+        key = self._key(url)
+        meta = self._read_meta(key)
+        export = (meta or {}).get("export")
+        if not export:
+            return None
+        if export["passthrough"]:
+            # Ảnh JPEG dùng nguyên bản: không lưu thêm bản sao
+            data = raw
+        else:
+            data = self._read(self._path(key, READY_EXT))
+            if data is None:
+                return None
+        self._touch(key)
+        return ExportImage(data, *export["size"])
+
+    def put_export(self, url, raw, image):
+        """Ghi nhớ ExportImage của `url` để lần xuất sau không phải giải mã/chuyển đổi lại"""
+        key = self._key(url)
+        passthrough = image.data is raw
+        with self._lock:
+            meta = self._read_meta(key)
+            if not meta:
+                return
+            if not passthrough:
+                self._write(self._path(key, READY_EXT), image.data)
+            meta["export"] = {"passthrough": passthrough, "size": list(image.size)}
+            self._write_meta(key, meta)
+            self._touch(key)
+        self._evict()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_image_cache():
+    """Bộ nhớ đệm ảnh dùng chung của tiến trình"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DiskImageCache()
+        return _cache
+
+
+def fetch_export_image(url):
+    """Tải ảnh từ URL (qua bộ nhớ đệm) và trả về ExportImage để xuất báo cáo"""
+    cache = get_image_cache()
+    # fetch() kiểm tra lại nội dung với máy chủ khi cần; bản chuyển đổi bị xóa nếu ảnh đã đổi
+    raw = cache.fetch(url)
+    image = cache.get_export(url, raw)
+    if image is not None:
+        return image
+
+    image = export_image_from_bytes(raw)
+    cache.put_export(url, raw, image)
+    return image
+
+
+def run_parallel(fn, urls, max_workers=PREFETCH_WORKERS, on_progress=None):
+    """Gọi `fn(url)` song song cho từng URL (URL trùng chỉ một lần).
+
+    Trả về dict url -> (kết quả hoặc None, lỗi hoặc None); `on_progress(done, total)`
+    được gọi sau mỗi URL.
+    """
+    unique_urls = list(dict.fromkeys(url for url in urls if url))
+    results = {}
+    if not unique_urls:
+        return results
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unique_urls)))) as executor:
+        futures = {executor.submit(fn, url): url for url in unique_urls}
+        for future in as_completed(futures):
+            url = futures[future]
+            try:
+                results[url] = (future.result(), None)
+            except Exception as e:
+                logger.warning("Lỗi khi tải ảnh %s: %s", url, e)
+                results[url] = (None, e)
+            if on_progress:
+                on_progress(len(results), len(unique_urls))
+    return results
+
+
+def prefetch_export_images(urls, max_workers=PREFETCH_WORKERS, on_progress=None):
+    """Tải và chuẩn bị song song các ảnh của báo cáo.
+
+    Trả về dict url -> (ExportImage hoặc None, lỗi hoặc None); URL trùng chỉ tải một lần.
+    `on_progress(done, total)` được gọi sau mỗi ảnh.
+    """
+    return run_parallel(fetch_export_image, urls, max_workers, on_progress)
+
+
+def download_images(urls, max_workers=PREFETCH_WORKERS, on_progress=None):
+    """Chỉ tải ảnh vào bộ nhớ đệm trên đĩa, không giữ nội dung trong bộ nhớ.
+
+    Dùng trước khi xuất nhiều báo cáo: bộ nhớ chỉ giữ ảnh đang tải (tối đa `max_workers`).
+    Trả về dict url -> lỗi của các URL tải lỗi.
+    """
+    def download(url):
+        get_image_cache().fetch(url)
+
+    results = run_parallel(download, urls, max_workers, on_progress)
+    return {url: error for url, (_, error) in results.items() if error}
+
+
+def report_image_urls(image_urls, panel_notes):
+    """Tất cả URL ảnh của một báo cáo: ảnh chính rồi đến ảnh của từng panel note"""
+    urls = list(image_urls or [])
+    for note in panel_notes or []:
+        urls.extend(note.get('images') or [])
+    return urls
@@ -0,0 +1,270 @@
+# --- Xử lý và tải ảnh lên Supabase Storage (song song) ---
+import io
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from PIL import Image, ImageOps
+import pillow_heif
+from storage3.utils import StorageException
+
+logger = logging.getLogger(__name__)
+
+# Tên bucket đã tồn tại trên Supabase
+BUCKET_NAME = "serveyimages"
+# Số ảnh được xử lý/tải lên cùng lúc
+MAX_UPLOAD_WORKERS = 4
+# Số đường dẫn đã biết là có trên bucket được ghi nhớ trong tiến trình
+KNOWN_PATHS_MAX_ENTRIES = 10000
+
+# Cấu hình chuẩn hóa ảnh mặc định trước khi tải lên
+DEFAULT_NORMALIZE_OPTIONS = {
+    "max_edge": 2560,       # Cạnh dài tối đa (pixel)
+    "format": "JPEG",       # "JPEG" (progressive) hoặc "WEBP"
+    "quality": 82,
+    "keep_original": False  # Lưu thêm bản gốc vào ARCHIVE_PREFIX
+}
+# Thư mục lưu bản gốc khi bật keep_original
+ARCHIVE_PREFIX = "originals"
+# Thư mục lưu ảnh không chuẩn hóa được (dùng nguyên file gốc, không có ảnh phái sinh)
+UNPROCESSED_PREFIX = "unprocessed"
+
+# Ảnh phái sinh tạo khi tải lên: thư mục -> cạnh dài tối đa (pixel)
+DERIVATIVE_SIZES = {
+    "thumbs": 400,     # Ô ảnh 200px trong gallery (màn hình mật độ cao)
+    "previews": 1280   # Xem trước cỡ vừa
+}
+DERIVATIVE_QUALITY = 75
+
+# URL công khai của ảnh lưu theo mã băm (ảnh đã chuẩn hóa)
+_CONTENT_ADDRESSED_URL = re.compile(
+    rf"^(?P<prefix>.*/{BUCKET_NAME}/)(?P<path>[0-9a-f]{{2}}/[0-9a-f]{{64}}\.(?:jpg|webp))(?P<query>\?.*)?$"
+)
+
+# Cho phép Image.open đọc trực tiếp ảnh HEIC/HEIF
+pillow_heif.register_heif_opener()
+
+# Các đường dẫn đã biết là có trên bucket (LRU, bỏ đường dẫn ít dùng nhất khi đầy)
+_known_paths = OrderedDict()
+_known_paths_lock = threading.Lock()
+
+
+def normalize_options(overrides=None):
+    """Cấu hình chuẩn hóa ảnh: giá trị mặc định, ghi đè bởi `overrides` (mục [images] của Secrets)"""
+    options = dict(DEFAULT_NORMALIZE_OPTIONS)
+    options.update(overrides or {})
+    options["format"] = str(options["format"]).upper()
+    options["max_edge"] = int(options["max_edge"])
+    options["quality"] = int(options["quality"])
+    options["keep_original"] = as_bool(options["keep_original"])
+    return options
+
+
+def as_bool(value):
+    """Giá trị bật/tắt từ Secrets: chuỗi "false"/"0"/"no"/"off"/"" là tắt"""
+    if isinstance(value, str):
+        return value.strip().lower() not in ("", "0", "false", "no", "off")
+    return bool(value)
+
+
+def encode_image(img, output_format, quality):
+    """Nén ảnh RGB thành JPEG progressive hoặc WebP, trả về (nội dung, phần mở rộng, content-type)"""
+    # Không truyền exif khi lưu để loại bỏ metadata, chỉ giữ ICC profile
+    save_kwargs = {"quality": int(quality)}
+    if img.info.get("icc_profile"):
+        save_kwargs["icc_profile"] = img.info["icc_profile"]
+
+    output = io.BytesIO()
+    if output_format == 'WEBP':
+        img.save(output, format='WEBP', method=4, **save_kwargs)
+        return output.getvalue(), 'webp', 'image/webp'
+    img.save(output, format='JPEG', optimize=True, progressive=True, **save_kwargs)
+    return output.getvalue(), 'jpg', 'image/jpeg'
+
+
+def prepare_image_bytes(file_name, data, options=None):
+    """Chuẩn hóa ảnh trước khi tải lên, trả về (nội dung, phần mở rộng, content-type, ảnh PIL).
+
+    Xoay ảnh theo EXIF, giới hạn cạnh dài, bỏ metadata và nén lại thành
+    JPEG progressive hoặc WebP theo `options`. Ảnh PIL là None khi không
+    xử lý được và phải dùng nguyên file gốc.
+    """
+    options = options or normalize_options()
+    max_edge = int(options["max_edge"])
+
+    try:
+        img = Image.open(io.BytesIO(data))
+        # Với JPEG: giải mã ở độ phân giải thấp hơn nếu ảnh lớn hơn nhiều so với max_edge
+        img.draft('RGB', (max_edge, max_edge))
+        img = ImageOps.exif_transpose(img)
+
+        # Chuyển về RGB, nền trắng cho ảnh có kênh trong suốt
+        if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+            img = img.convert('RGBA')
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img, mask=img.split()[3])
+            img = background
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        if max(img.size) > max_edge:
+            img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        file_content, file_ext, content_type = encode_image(img, options["format"], options["quality"])
+        return file_content, file_ext, content_type, img
+    except Exception as e:
+        # Nếu không thể xử lý ảnh, sử dụng file gốc
+        logger.warning("Không thể chuẩn hóa ảnh %s, sử dụng file gốc: %s", file_name, e)
+        file_ext = file_name.lower().split('.')[-1]
+        return data, file_ext, f"image/{file_ext if file_ext != 'jpg' else 'jpeg'}", None
+
+
+def content_address(file_content, file_ext):
+    """Đường dẫn lưu trữ theo mã băm SHA-256 của nội dung ảnh"""
+    digest = hashlib.sha256(file_content).hexdigest()
+    return f"{digest[:2]}/{digest}.{file_ext}"
+
+
+def _is_known(path):
+    with _known_paths_lock:
+        if path in _known_paths:
+            _known_paths.move_to_end(path)
+            return True
+        return False
+
+
+def _remember(path):
+    with _known_paths_lock:
+        _known_paths[path] = True
+        _known_paths.move_to_end(path)
+        while len(_known_paths) > KNOWN_PATHS_MAX_ENTRIES:
+            _known_paths.popitem(last=False)
+
+
+def is_duplicate_error(error):
+    """Lỗi của Storage khi đường dẫn đã có file (HTTP 409 hoặc lỗi "Duplicate" trong nội dung trả về)"""
+    if not isinstance(error, StorageException) or not error.args or not isinstance(error.args[0], dict):
+        return False
+    detail = error.args[0]
+    return str(detail.get("statusCode")) == "409" or detail.get("error") == "Duplicate"
+
+
+def object_exists(bucket, path):
+    """Kiểm tra file đã có trong bucket (có ghi nhớ trong tiến trình)"""
+    if _is_known(path):
+        return True
+    folder, name = path.rsplit('/', 1)
+    entries = bucket.list(folder, {"search": name, "limit": 1})
+    if any(entry.get("name") == name for entry in entries or []):
+        _remember(path)
+        return True
+    return False
+
+
+def upload_object(bucket, path, file_content, content_type, check_exists=True):
+    """Tải nội dung lên `path` nếu chưa có trên bucket.
+
+    `check_exists=False` khi người gọi vừa kiểm tra là chưa có: tải lên luôn, không hỏi lại bucket.
+    """
+    if check_exists and object_exists(bucket, path):
+        return
+    try:
+        bucket.upload(
+            path=path,
+            file=file_content,
+            file_options={"content-type": content_type}
+        )
+    except StorageException as e:
+        # Một request khác vừa tải lên cùng nội dung
+        if not is_duplicate_error(e):
+            raise
+    _remember(path)
+
+
+def upload_image_bytes(supabase, file_name, data, options=None):
+    """Chuẩn hóa và tải một ảnh lên Supabase Storage, trả về URL công khai.
+
+    Ảnh được lưu theo mã băm nội dung nên ảnh trùng chỉ được tải lên một lần.
+    Ảnh thu nhỏ và ảnh xem trước được lưu cùng đường dẫn trong các thư mục
+    của DERIVATIVE_SIZES (xem `derivative_url`).
+    """
+    options = options or normalize_options()
+    file_content, file_ext, content_type, img = prepare_image_bytes(file_name, data, options)
+    path = content_address(file_content, file_ext)
+    if img is None:
+        # Không có ảnh phái sinh: đặt ngoài dạng đường dẫn của derivative_url để gallery dùng URL gốc
+        path = f"{UNPROCESSED_PREFIX}/{path}"
+    bucket = supabase.storage.from_(BUCKET_NAME)
+
+    if not object_exists(bucket, path):
+        if img is not None:
+            # Tạo ảnh phái sinh trước ảnh chính để URL phái sinh luôn tồn tại khi có ảnh chính
+            for kind, size in DERIVATIVE_SIZES.items():
+                derivative = img.copy()
+                derivative.thumbnail((size, size), Image.LANCZOS)
+                derivative_content, _, _ = encode_image(derivative, options["format"], DERIVATIVE_QUALITY)
+                # Ảnh phái sinh cùng mã băm với ảnh chính: ảnh chính chưa có thì chúng cũng chưa có
+                upload_object(bucket, f"{kind}/{path}", derivative_content, content_type, check_exists=False)
+
+        upload_object(bucket, path, file_content, content_type, check_exists=False)
+
+    if options["keep_original"]:
+        # Lưu bản gốc chưa chuẩn hóa vào thư mục lưu trữ riêng
+        original_ext = file_name.lower().split('.')[-1]
+        upload_object(
+            bucket,
+            f"{ARCHIVE_PREFIX}/{content_address(data, original_ext)}",
+            data,
+            "application/octet-stream"
+        )
+
+    return bucket.get_public_url(path)
+
+
+def derivative_url(url, kind):
+    """URL ảnh phái sinh (`thumbs`/`previews`) của một ảnh.
+
+    Chỉ ảnh đã chuẩn hóa (lưu theo mã băm ở gốc bucket) mới có bản phái sinh; ảnh cũ
+    và ảnh trong UNPROCESSED_PREFIX giữ nguyên URL gốc.
+    """
+    match = _CONTENT_ADDRESSED_URL.match(url or "")
+    if not match:
+        return url
+    return f"{match.group('prefix')}{kind}/{match.group('path')}{match.group('query') or ''}"
+
+
+def thumbnail_url(url):
+    """URL ảnh thu nhỏ dùng cho gallery"""
+    return derivative_url(url, "thumbs")
+
+
+def upload_images_parallel(supabase, jobs, options=None, max_workers=MAX_UPLOAD_WORKERS, on_progress=None):
+    """Tải nhiều ảnh lên song song.
+
+    `jobs` là danh sách (tên file, nội dung bytes). Kết quả là danh sách
+    (url, lỗi) theo đúng thứ tự của `jobs`; ảnh lỗi không làm dừng các ảnh khác.
+    `on_progress(số ảnh xong, tổng số, vị trí, lỗi)` được gọi trên luồng gọi hàm.
+    """
+    results = [(None, None)] * len(jobs)
+    if not jobs:
+        return results
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as executor:
+        futures = {
+            executor.submit(upload_image_bytes, supabase, name, data, options): index
+            for index, (name, data) in enumerate(jobs)
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            index = futures[future]
+            try:
+                results[index] = (future.result(), None)
+            except Exception as e:
+                logger.warning("Lỗi khi tải ảnh %s lên: %s", jobs[index][0], e)
+                results[index] = (None, e)
+            if on_progress:
+                on_progress(done, len(jobs), index, results[index][1])
+
+    return results
@@ -0,0 +1,29 @@
+# --- Thông báo khi một khảo sát thay đổi để các bộ nhớ đệm xóa dữ liệu cũ ---
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_listeners = []
+
+
+def on_survey_changed(callback):
+    """Đăng ký hàm `callback(survey_id)` được gọi khi khảo sát được lưu hoặc xóa"""
+    with _lock:
+        if callback not in _listeners:
+            _listeners.append(callback)
+    return callback
+
+
+def notify_survey_changed(survey_id):
+    """Báo cho các bộ nhớ đệm rằng khảo sát `survey_id` đã thay đổi"""
+    if not survey_id:
+        return
+    with _lock:
+        listeners = list(_listeners)
+    for callback in listeners:
+        try:
+            callback(survey_id)
+        except Exception as e:
+            logger.warning("Lỗi khi xóa bộ nhớ đệm của khảo sát %s: %s", survey_id, e)
@@ -0,0 +1,57 @@
+# --- Phân trang theo keyset (created_at, id) cho danh sách khảo sát ---
+import streamlit as st
+
+# Số dòng mỗi trang có thể chọn và giá trị mặc định
+PAGE_SIZES = [10, 20, 50, 100]
+DEFAULT_PAGE_SIZE = 20
+
+
+def add_param(query, name, value):
+    # postgrest-py 0.13 chưa có or_() và chỉ thêm được mỗi cột một tham số order
+    query.params = query.params.add(name, value)
+    return query
+
+
+def escape_like(value):
+    """Cho ký tự đại diện của LIKE (%, _) trong chuỗi người dùng nhập được hiểu theo nghĩa đen"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def row_cursor(row):
+    """Vị trí của một dòng trong thứ tự (created_at, id) giảm dần"""
+    return row['created_at'], row['id']
+
+
+def fetch_page(query, cursor, page_size):
+    """Lấy một trang (mới nhất trước) sau vị trí `cursor`; trả về (danh sách dòng, còn trang sau hay không)"""
+    add_param(query, "order", "created_at.desc,id.desc")
+    if cursor:
+        created_at, row_id = cursor
+        add_param(query, "or", f'(created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{row_id}))')
+    # Lấy thêm một dòng để biết còn trang sau
+    rows = query.limit(page_size + 1).execute().data or []
+    return rows[:page_size], len(rows) > page_size
+
+
+def get_page_cursor(key, signature):
+    """Vị trí bắt đầu của trang hiện tại; quay về trang đầu khi bộ lọc/kích thước trang (`signature`) đổi"""
+    if st.session_state.get(f"{key}_signature") != signature:
+        st.session_state[f"{key}_signature"] = signature
+        st.session_state[f"{key}_cursors"] = [None]
+    return st.session_state[f"{key}_cursors"][-1]
+
+
+def show_page_controls(key, rows, has_next, cursor_of=row_cursor):
+    """Nút trang trước/trang sau cho danh sách đang phân trang; `cursor_of(row)` cho vị trí của dòng cuối trang"""
+    cursors = st.session_state[f"{key}_cursors"]
+    prev_col, page_col, next_col = st.columns([1, 2, 1])
+    with prev_col:
+        if st.button("◀ Trang trước", key=f"{key}_prev", disabled=len(cursors) <= 1):
+            cursors.pop()
+            st.rerun()
+    with page_col:
+        st.caption(f"Trang {len(cursors)}")
+    with next_col:
+        if st.button("Trang sau ▶", key=f"{key}_next", disabled=not has_next or not rows):
+            cursors.append(cursor_of(rows[-1]))
+            st.rerun()
@@ -0,0 +1,60 @@
+# --- Lưu panel notes theo lô và chỉ gửi phần thay đổi ---
+
+# Các cột nội dung (và vị trí) của panel note dùng để so sánh thay đổi
+NOTE_FIELDS = ("area", "device", "findings", "images", "position")
+
+
+def build_note_row(note, survey_id, user_id, position):
+    """Tạo bản ghi panel_notes từ dữ liệu note trên form; `position` là thứ tự của note trong khảo sát"""
+    return {
+        "id": note["id"],
+        "survey_id": survey_id,
+        "area": note["area"],
+        "device": note["device"],
+        "findings": note["findings"],
+        "images": note.get("images") or [],
+        "position": position,
+        "created_by": user_id
+    }
+
+
+def diff_panel_notes(existing_notes, note_rows):
+    """So sánh panel notes hiện có với dữ liệu mới.
+
+    Trả về (các bản ghi cần upsert, danh sách id cần xóa). Bản ghi được upsert
+    khi là note mới hoặc có ít nhất một cột trong NOTE_FIELDS thay đổi.
+    """
+    existing_by_id = {str(note["id"]): note for note in existing_notes}
+    new_ids = {str(row["id"]) for row in note_rows}
+
+    upserts = []
+    for row in note_rows:
+        old = existing_by_id.get(str(row["id"]))
+        if old is None or any((old.get(field) or None) != (row.get(field) or None) for field in NOTE_FIELDS):
+            upserts.append(row)
+
+    removed_ids = [note["id"] for note_id, note in existing_by_id.items() if note_id not in new_ids]
+    return upserts, removed_ids
+
+
+def save_panel_notes(supabase, survey_id, note_rows, is_new_survey):
+    """Lưu panel notes: một lệnh insert cho khảo sát mới, upsert + delete theo id khi chỉnh sửa"""
+    if is_new_survey:
+        if note_rows:
+            supabase.table('panel_notes').insert(note_rows).execute()
+        return
+
+    existing = supabase.table('panel_notes').select('id, created_by, ' + ', '.join(NOTE_FIELDS)).eq('survey_id', survey_id).execute()
+    upserts, removed_ids = diff_panel_notes(existing.data or [], note_rows)
+    # Note đã có giữ người tạo cũ (như hàm save_survey) khi người khác (admin) chỉnh sửa;
+    # gửi lại đúng giá trị cũ thay vì bỏ cột để mọi bản ghi của lệnh upsert cùng các cột
+    owners = {str(note["id"]): note.get("created_by") for note in existing.data or []}
+    upserts = [
+        dict(row, created_by=owners[str(row["id"])]) if owners.get(str(row["id"])) is not None else row
+        for row in upserts
+    ]
+
+    if upserts:
+        supabase.table('panel_notes').upsert(upserts).execute()
+    if removed_ids:
+        supabase.table('panel_notes').delete().in_('id', removed_ids).execute()
@@ -0,0 +1,63 @@
+# --- Bộ nhớ đệm ngắn hạn (TTL) cho kết quả truy vấn danh sách/tìm kiếm khảo sát ---
+import os
+import threading
+import time
+
+from utils.invalidation import on_survey_changed
+
+# Thời gian giữ kết quả (giây) và số kết quả tối đa (có thể đổi bằng biến môi trường)
+QUERY_CACHE_TTL = float(os.environ.get("GETNOTES_QUERY_CACHE_TTL", 60))
+QUERY_CACHE_MAX_ENTRIES = int(os.environ.get("GETNOTES_QUERY_CACHE_MAX_ENTRIES", 500))
+
+
+class QueryCache:
+    """Kết quả truy vấn theo khóa (người dùng, chế độ xem, bộ lọc, trang), hết hạn sau `ttl` giây"""
+
+    def __init__(self, ttl=QUERY_CACHE_TTL, max_entries=QUERY_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> (thời điểm hết hạn, kết quả)
+        self._generation = 0  # tăng mỗi lần clear()
+
+    def get_or_load(self, key, load):
+        """Kết quả còn hạn của `key`, hoặc gọi `load()` để truy vấn rồi lưu lại"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+            generation = self._generation
+
+        value = load()
+        with self._lock:
+            # Có khảo sát được lưu/xóa trong lúc truy vấn: kết quả có thể đã cũ, không lưu lại
+            if generation != self._generation:
+                return value
+            if len(self._entries) >= self.max_entries:
+                # Bỏ các kết quả đã hết hạn, nếu vẫn đầy thì xóa hết
+                self._entries = {k: e for k, e in self._entries.items() if e[0] > now}
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+            self._entries[key] = (now + self.ttl, value)
+        return value
+
+    def clear(self, survey_id=None):
+        """Xóa mọi kết quả (một khảo sát thay đổi có thể nằm trong bất kỳ danh sách nào)"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_query_cache():
+    """Bộ nhớ đệm truy vấn dùng chung của tiến trình, được xóa khi có khảo sát được lưu hoặc xóa"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = QueryCache()
+            on_survey_changed(_cache.clear)
+        return _cache
@@ -0,0 +1,82 @@
+# --- Bộ nhớ đệm (LRU, trong tiến trình) cho nội dung file báo cáo đã tạo ---
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from utils.invalidation import on_survey_changed
+from utils.report_engine import TEMPLATE_VERSION
+
+# Số báo cáo và tổng dung lượng tối đa được giữ lại (có thể đổi bằng biến môi trường)
+REPORT_CACHE_MAX_ENTRIES = int(os.environ.get("GETNOTES_REPORT_CACHE_MAX_ENTRIES", 32))
+REPORT_CACHE_MAX_BYTES = int(os.environ.get("GETNOTES_REPORT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+
+def report_cache_key(survey_data, fmt, exported_by=""):
+    """Khóa của báo cáo: hash nội dung khảo sát, panel notes, URL ảnh, phiên bản mẫu và định dạng.
+
+    Tên người xuất cũng được đưa vào khóa vì được in ở cuối báo cáo.
+    """
+    payload = json.dumps({
+        "survey": survey_data,
+        "template": TEMPLATE_VERSION,
+        "format": fmt,
+        "exported_by": exported_by
+    }, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ReportCache:
+    """Giữ nội dung các báo cáo tạo gần đây, loại bỏ báo cáo ít dùng nhất khi vượt giới hạn"""
+
+    def __init__(self, max_entries=REPORT_CACHE_MAX_ENTRIES, max_bytes=REPORT_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (survey_id, nội dung)
+        self._size = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, survey_id, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old[1])
+            # id dạng chuỗi: khớp dù nơi gọi truyền int, chuỗi hay UUID
+            self._entries[key] = (str(survey_id), data)
+            self._size += len(data)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                _, (_, removed) = self._entries.popitem(last=False)
+                self._size -= len(removed)
+
+    def invalidate(self, survey_id):
+        """Xóa mọi báo cáo của khảo sát `survey_id`"""
+        survey_id = str(survey_id)
+        with self._lock:
+            for key in [k for k, (sid, _) in self._entries.items() if sid == survey_id]:
+                _, removed = self._entries.pop(key)
+                self._size -= len(removed)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_report_cache():
+    """Bộ nhớ đệm báo cáo dùng chung của tiến trình"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ReportCache()
+            on_survey_changed(_cache.invalidate)
+        return _cache
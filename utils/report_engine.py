@@ -0,0 +1,327 @@
+# --- Tạo báo cáo khảo sát (PDF, Word) dùng chung cho các trang ---
+import io
+import datetime
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image as RLImage
+from docx import Document
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.shared import Inches, Pt
+
+from utils.export_image import resample_for_box
+from utils.fonts import get_report_fonts
+
+# Tăng khi thay đổi bố cục/nội dung báo cáo (dùng cho các bộ nhớ đệm báo cáo)
+TEMPLATE_VERSION = 2
+
+# Khung đặt ảnh trong PDF (point) và chiều rộng ảnh trong Word
+PDF_IMAGE_BOX = (400, 300)
+WORD_IMAGE_WIDTH = Inches(6)
+
+
+class SurveyReport:
+    """Dữ liệu chuẩn hóa của một báo cáo khảo sát, ảnh đã sẵn sàng để nhúng (ExportImage)"""
+
+    def __init__(self, header, detail, main_images=None, panel_notes=None, exported_by=""):
+        self.header = header
+        self.detail = detail
+        self.main_images = [img for img in (main_images or []) if img]
+        # Mỗi note: {"area", "device", "findings", "images": [ExportImage, ...]}
+        self.panel_notes = panel_notes or []
+        self.exported_by = exported_by
+        self._resampled = {}  # (id ảnh, khung) -> ảnh đã giảm độ phân giải
+
+    @classmethod
+    def from_survey_data(cls, survey_data, image_map=None, exported_by="", main_images=None):
+        """Tạo báo cáo từ dữ liệu khảo sát của các trang và dict url -> ExportImage.
+
+        `main_images` dùng cho ảnh chính chưa được tải lên (không có URL).
+        """
+        image_map = image_map or {}
+        if main_images is None:
+            main_images = [image_map.get(url) for url in survey_data.get('image_urls') or []]
+        panel_notes = [
+            {
+                "area": note['area'],
+                "device": note['device'],
+                "findings": note['findings'],
+                "images": [image_map.get(url) for url in note.get('images') or []]
+            }
+            for note in survey_data.get('panel_notes') or []
+        ]
+        return cls(survey_data['header'], survey_data['detail'], main_images, panel_notes, exported_by)
+
+    def resampled(self, image, box_width, box_height=None):
+        """Ảnh đã giảm độ phân giải cho khung đặt ảnh; mỗi (ảnh, khung) chỉ tính một lần cho báo cáo"""
+        key = (id(image), box_width, box_height)
+        if key not in self._resampled:
+            self._resampled[key] = resample_for_box(image, box_width, box_height)
+        return self._resampled[key]
+
+    def areas(self):
+        """Các khu vực khảo sát theo thứ tự xuất: phần chi tiết (kèm ảnh chính) rồi đến từng panel note.
+
+        Mỗi phần tử là (khu vực, thiết bị, mô tả, danh sách (số thứ tự ảnh, ảnh)).
+        """
+        # Phần chi tiết hoàn toàn trống (chỉ nhập panel notes) thì không in khu vực rỗng
+        if any(self.detail) or self.main_images or not self.panel_notes:
+            yield self.detail[0], self.detail[1], self.detail[2], list(enumerate(self.main_images))
+        for note in self.panel_notes:
+            # Giữ số thứ tự ảnh theo danh sách URL gốc, bỏ qua ảnh không tải được
+            images = [(idx, img) for idx, img in enumerate(note['images']) if img]
+            yield note['area'], note['device'], note['findings'], images
+
+
+# --- Đăng ký định dạng xuất ---
+REPORT_FORMATS = {}
+
+
+def register_format(name, extension, mime_type):
+    """Decorator đăng ký hàm tạo báo cáo `render(report) -> bytes` cho một định dạng"""
+    def decorator(render):
+        REPORT_FORMATS[name] = {
+            "render": render,
+            "extension": extension,
+            "mime_type": mime_type
+        }
+        return render
+    return decorator
+
+
+def render_report(report, fmt):
+    """Tạo nội dung file báo cáo theo định dạng `fmt` ("pdf", "docx", ...)"""
+    return REPORT_FORMATS[fmt]["render"](report)
+
+
+def report_file_name(header, fmt):
+    """Tên file tải xuống của báo cáo (theo thông tin công ty trong `header`)"""
+    company_name_safe = (header['company_name'] or '').replace(' ', '_')
+    date_str = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"bao_cao_khao_sat_{company_name_safe}_{date_str}.{REPORT_FORMATS[fmt]['extension']}"
+
+
+def export_footer_lines(report):
+    current_date = datetime.datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+    return [
+        f"Báo cáo được xuất ngày: {current_date}",
+        f"Người xuất báo cáo: {report.exported_by}"
+    ]
+
+
+def bullet_lines(text):
+    return [line for line in (text or '').split('\n') if line.strip()]
+
+
+# --- PDF: font, style và mẫu bảng được tạo một lần khi import ---
+PDF_FONT = get_report_fonts().normal
+_sample_styles = getSampleStyleSheet()
+
+PDF_TITLE_STYLE = ParagraphStyle(
+    'ReportTitle',
+    parent=_sample_styles['Heading1'],
+    fontName=PDF_FONT,
+    fontSize=16,
+    alignment=1,
+    spaceAfter=12
+)
+PDF_NORMAL_STYLE = ParagraphStyle(
+    'ReportNormal',
+    parent=_sample_styles['Normal'],
+    fontName=PDF_FONT,
+    fontSize=10,
+    spaceAfter=6
+)
+PDF_HEADING2_STYLE = ParagraphStyle('ReportHeading2', parent=_sample_styles['Heading2'], fontName=PDF_FONT)
+PDF_HEADING2_CENTER_STYLE = ParagraphStyle('ReportHeading2Center', parent=PDF_HEADING2_STYLE, alignment=1)
+PDF_HEADING3_CENTER_STYLE = ParagraphStyle(
+    'ReportHeading3Center',
+    parent=_sample_styles['Heading3'],
+    fontName=PDF_FONT,
+    alignment=1
+)
+
+PDF_HEADER_TABLE_STYLE = TableStyle([
+    ('FONT', (0, 0), (-1, -1), PDF_FONT, 10),
+    ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+])
+PDF_DETAIL_TABLE_STYLE = TableStyle([
+    ('FONT', (0, 0), (-1, -1), PDF_FONT, 10),
+    ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+])
+
+
+def pdf_paragraph(text, style):
+    return Paragraph(escape(text or ''), style)
+
+
+def iter_pdf_flowables(report):
+    """Sinh lần lượt các flowable của báo cáo PDF"""
+    # Tiêu đề báo cáo
+    yield pdf_paragraph("BÁO CÁO KHẢO SÁT ISO 50001:2018", PDF_TITLE_STYLE)
+    yield Spacer(1, 20)
+
+    # Thông tin công ty và khảo sát
+    header = report.header
+    table = Table([
+        ["Tên công ty:", header['company_name']],
+        ["Địa chỉ:", header['address']],
+        ["Số điện thoại:", header['phone']],
+        ["Ngày khảo sát:", header['survey_date']],
+    ], colWidths=[120, 300])
+    table.setStyle(PDF_HEADER_TABLE_STYLE)
+    yield table
+    yield Spacer(1, 10)
+
+    # Người tham gia
+    yield pdf_paragraph("Thành viên tham gia:", PDF_HEADING2_STYLE)
+    for p in bullet_lines(header['participants']):
+        yield pdf_paragraph(f"• {p}", PDF_NORMAL_STYLE)
+    yield Spacer(1, 10)
+
+    # Người khảo sát
+    yield pdf_paragraph("Người khảo sát:", PDF_HEADING2_STYLE)
+    for s in bullet_lines(header['surveyors']):
+        yield pdf_paragraph(f"• {s}", PDF_NORMAL_STYLE)
+    yield Spacer(1, 20)
+
+    # Các khu vực khảo sát
+    for area_idx, (area, device, findings, images) in enumerate(report.areas(), start=1):
+        yield pdf_paragraph(f"KHU VỰC KHẢO SÁT #{area_idx}", PDF_HEADING2_CENTER_STYLE)
+        yield Spacer(1, 10)
+
+        table = Table([
+            ["Khu vực:", area],
+            ["Thiết bị:", device],
+            ["Mô tả tổn thất/thông số kỹ thuật:", findings],
+        ], colWidths=[150, 270])
+        table.setStyle(PDF_DETAIL_TABLE_STYLE)
+        yield table
+        yield Spacer(1, 10)
+
+        if images:
+            yield pdf_paragraph(f"ẢNH KHẢO SÁT KHU VỰC #{area_idx}", PDF_HEADING3_CENTER_STYLE)
+            yield Spacer(1, 10)
+
+            for img_idx, img in images:
+                # Giảm độ phân giải theo DPI mục tiêu cho khung ảnh
+                img = report.resampled(img, *PDF_IMAGE_BOX)
+                yield pdf_paragraph(f"Hình {area_idx}.{img_idx+1}:", PDF_NORMAL_STYLE)
+
+                # Kích thước ảnh phù hợp (tối đa 400x300, giữ tỷ lệ)
+                ratio = min(PDF_IMAGE_BOX[0]/img.width, PDF_IMAGE_BOX[1]/img.height)
+                # Nhúng trực tiếp JPEG, không nén lại
+                yield RLImage(img.stream(), width=img.width*ratio, height=img.height*ratio)
+                yield Spacer(1, 10)
+
+        yield Spacer(1, 10)
+
+    # Thêm ngày xuất báo cáo
+    yield Spacer(1, 20)
+    for line in export_footer_lines(report):
+        yield pdf_paragraph(line, PDF_NORMAL_STYLE)
+
+
+@register_format("pdf", "pdf", "application/pdf")
+def render_pdf(report):
+    """Tạo file PDF từ báo cáo khảo sát"""
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    doc.build(list(iter_pdf_flowables(report)))
+    return buffer.getvalue()
+
+
+# --- Word: tài liệu mẫu (font mặc định) được tạo một lần khi import ---
+def build_word_template():
+    doc = Document()
+    style = doc.styles['Normal']
+    style.font.name = 'Times New Roman'
+    style.font.size = Pt(12)
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+WORD_TEMPLATE = build_word_template()
+
+
+def add_word_table(doc, rows):
+    table = doc.add_table(rows=len(rows), cols=2)
+    table.style = 'Table Grid'
+    for row, (label, value) in zip(table.rows, rows):
+        cells = row.cells
+        cells[0].text = label
+        cells[1].text = value or ''
+    return table
+
+
+@register_format("docx", "docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document")
+def render_docx(report):
+    """Tạo file Word từ báo cáo khảo sát"""
+    doc = Document(io.BytesIO(WORD_TEMPLATE))
+
+    # Tiêu đề
+    heading = doc.add_heading('BÁO CÁO KHẢO SÁT ISO 50001', level=1)
+    heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    # Thông tin công ty và khảo sát
+    header = report.header
+    add_word_table(doc, [
+        ('Tên công ty:', header['company_name']),
+        ('Địa chỉ:', header['address']),
+        ('Số điện thoại:', header['phone']),
+        ('Ngày khảo sát:', header['survey_date']),
+    ])
+    doc.add_paragraph('')
+
+    # Người tham gia
+    doc.add_heading('Thành viên tham gia:', level=2)
+    for p in bullet_lines(header['participants']):
+        doc.add_paragraph(f"• {p}", style='List Bullet')
+
+    # Người khảo sát
+    doc.add_heading('Người khảo sát:', level=2)
+    for s in bullet_lines(header['surveyors']):
+        doc.add_paragraph(f"• {s}", style='List Bullet')
+
+    doc.add_paragraph('')
+
+    # Các khu vực khảo sát
+    for area_idx, (area, device, findings, images) in enumerate(report.areas(), start=1):
+        heading = doc.add_heading(f'KHU VỰC KHẢO SÁT #{area_idx}', level=2)
+        heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+        add_word_table(doc, [
+            ('Khu vực:', area),
+            ('Thiết bị:', device),
+            ('Mô tả tổn thất/thông số kỹ thuật:', findings),
+        ])
+        doc.add_paragraph('')
+
+        if images:
+            heading = doc.add_heading(f'ẢNH KHẢO SÁT KHU VỰC #{area_idx}', level=3)
+            heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+            for img_idx, img in images:
+                # Giảm độ phân giải theo DPI mục tiêu cho ảnh rộng 6 inch
+                img = report.resampled(img, WORD_IMAGE_WIDTH.pt)
+                doc.add_paragraph(f"Hình {area_idx}.{img_idx+1}:")
+                doc.add_picture(img.stream(), width=WORD_IMAGE_WIDTH)
+                doc.add_paragraph('')
+
+        doc.add_paragraph('')
+
+    # Thêm ngày xuất báo cáo
+    doc.add_paragraph('')
+    for line in export_footer_lines(report):
+        doc.add_paragraph(line)
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
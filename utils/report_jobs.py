@@ -0,0 +1,402 @@
+# --- Hàng đợi xuất báo cáo chạy nền trên nhóm tiến trình (process pool) ---
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from utils.http_client import get_http_stats
+from utils.image_cache import download_images, prefetch_export_images, report_image_urls
+from utils.report_cache import get_report_cache, report_cache_key
+from utils.report_engine import REPORT_FORMATS, SurveyReport, render_report, report_file_name
+
+logger = logging.getLogger(__name__)
+
+# Số tiến trình tạo báo cáo (có thể đổi bằng biến môi trường)
+EXPORT_WORKERS = int(os.environ.get("GETNOTES_EXPORT_WORKERS", min(4, os.cpu_count() or 1)))
+# Thư mục chứa kết quả và tiến độ của các job
+JOBS_DIR = os.path.join(tempfile.gettempdir(), "getnotes_export_jobs")
+# Job đã kết thúc được giữ lại trong khoảng thời gian này (giây)
+JOB_TTL = 3600
+PROGRESS_FILE = "progress.json"
+# Tỷ lệ tiến độ dành cho việc tải ảnh, phần còn lại cho việc tạo file
+IMAGE_PROGRESS_SHARE = 0.6
+# Xuất nhiều báo cáo: tỷ lệ tiến độ dành cho việc tải ảnh và kích thước mỗi lần chép vào file ZIP
+BULK_IMAGE_PROGRESS_SHARE = 0.3
+ZIP_CHUNK_SIZE = 1024 * 1024
+
+
+# --- Chạy trong tiến trình con ---
+def write_progress(job_dir, progress, message):
+    path = os.path.join(job_dir, PROGRESS_FILE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"progress": progress, "message": message}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def log_http_stats():
+    # Số liệu tải ảnh của tiến trình con này (độ trễ, thử lại, kết nối được dùng lại)
+    stats = get_http_stats()
+    logger.info(
+        "Tải ảnh (tiến trình %s): %d request, %d thử lại, %d lỗi, độ trễ TB %.3fs / tối đa %.3fs, "
+        "%d kết nối mở, %d lần dùng lại kết nối",
+        os.getpid(), stats["requests"], stats["retries"], stats["failures"], stats["avg_latency"],
+        stats["max_latency"], stats["connections_opened"], stats["connections_reused"]
+    )
+
+
+def run_export_job(job_dir, survey_data, formats, exported_by, main_images=None, skip_urls=()):
+    """Tải ảnh, tạo báo cáo theo từng định dạng trong `formats` và ghi ra file trong `job_dir`.
+
+    Ảnh được tải và SurveyReport được tạo một lần, dùng chung cho mọi định dạng.
+    Ảnh trong `skip_urls` (đã tải lỗi trước đó) không được tải lại.
+    Trả về {"paths": {định dạng: đường dẫn file}, "warnings": [...]}.
+    """
+    def on_image_progress(done, total):
+        write_progress(job_dir, IMAGE_PROGRESS_SHARE * done / total, f"Đang tải ảnh ({done}/{total})...")
+
+    write_progress(job_dir, 0.0, "Đang tải ảnh...")
+    urls = report_image_urls(survey_data.get('image_urls'), survey_data.get('panel_notes'))
+    results = prefetch_export_images([url for url in urls if url not in skip_urls], on_progress=on_image_progress)
+    image_map = {url: img for url, (img, _) in results.items()}
+    warnings = [f"Lỗi khi tải ảnh từ URL: {error}" for _, (_, error) in results.items() if error]
+    log_http_stats()
+
+    report = SurveyReport.from_survey_data(survey_data, image_map, exported_by, main_images)
+    paths = {}
+    for done, fmt in enumerate(formats):
+        progress = IMAGE_PROGRESS_SHARE + (1 - IMAGE_PROGRESS_SHARE) * done / len(formats)
+        write_progress(job_dir, progress, f"Đang tạo báo cáo {fmt.upper()}...")
+        path = os.path.join(job_dir, f"report.{REPORT_FORMATS[fmt]['extension']}")
+        with open(path, "wb") as f:
+            f.write(render_report(report, fmt))
+        paths[fmt] = path
+    write_progress(job_dir, 1.0, "Hoàn tất")
+    return {"paths": paths, "warnings": warnings}
+
+
+def run_prefetch_job(urls):
+    """Tải trước ảnh vào bộ nhớ đệm trên đĩa (dùng chung giữa các tiến trình); trả về các URL lỗi và lỗi.
+
+    Chỉ tải về, không giải mã/giữ ảnh: các job tạo báo cáo tự chuẩn bị ảnh của khảo sát mình.
+    """
+    failed = download_images(urls)
+    log_http_stats()
+    return {url: f"Lỗi khi tải ảnh từ URL: {error}" for url, error in failed.items()}
+
+
+# --- Quản lý job trong tiến trình Streamlit ---
+class ExportJob:
+    def __init__(self, job_id, file_name, mime_type, directory, survey_id=None, cache_key=None):
+        self.id = job_id
+        self.file_name = file_name
+        self.mime_type = mime_type
+        self.directory = directory
+        self.survey_id = survey_id
+        self.cache_key = cache_key
+        self.created_at = time.time()
+        self.future = None
+        self.result = None  # Kết quả có sẵn (từ bộ nhớ đệm báo cáo)
+
+
+class ExportJobManager:
+    """Nhận job xuất báo cáo, chạy trên process pool và theo dõi trạng thái từng job"""
+
+    def __init__(self, max_workers=EXPORT_WORKERS, jobs_dir=JOBS_DIR):
+        self.max_workers = max(1, max_workers)
+        self.jobs_dir = jobs_dir
+        self._lock = threading.Lock()
+        self._executor = None
+        self._jobs = {}
+
+    def _get_executor(self):
+        if self._executor is None:
+            # "spawn": tiến trình con không thừa hưởng các luồng của Streamlit
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def _submit_to_pool(self, fn, *args):
+        with self._lock:
+            try:
+                return self._get_executor().submit(fn, *args)
+            except BrokenProcessPool:
+                # Một tiến trình con bị dừng đột ngột: tạo lại pool
+                logger.warning("Process pool xuất báo cáo bị hỏng, tạo lại")
+                self._executor = None
+                return self._get_executor().submit(fn, *args)
+
+    def _cleanup(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            finished = job.future is None or job.future.done()
+            if finished and now - job.created_at > JOB_TTL:
+                shutil.rmtree(job.directory, ignore_errors=True)
+                del self._jobs[job_id]
+
+    def submit(self, survey_data, fmt, exported_by, file_name, survey_id=None, cache_key=None, main_images=None):
+        """Tạo job xuất báo cáo, trả về id của job.
+
+        Nếu báo cáo đã có trong bộ nhớ đệm (`cache_key`), job hoàn tất ngay không cần tạo lại.
+        """
+        job_id = uuid.uuid4().hex
+        directory = os.path.join(self.jobs_dir, job_id)
+        os.makedirs(directory, exist_ok=True)
+        job = ExportJob(job_id, file_name, REPORT_FORMATS[fmt]["mime_type"], directory, survey_id, cache_key)
+
+        cached = get_report_cache().get(cache_key) if cache_key else None
+        if cached is not None:
+            path = os.path.join(directory, f"report.{REPORT_FORMATS[fmt]['extension']}")
+            with open(path, "wb") as f:
+                f.write(cached)
+            job.result = {"path": path, "warnings": []}
+        else:
+            future = self._submit_to_pool(run_export_job, directory, survey_data, [fmt], exported_by, main_images)
+            future.add_done_callback(lambda f: self._cache_result(survey_id, {fmt: cache_key}, f))
+            job.future = Future()
+            future.add_done_callback(lambda f: self._single_result(job.future, fmt, f))
+
+        with self._lock:
+            self._cleanup()
+            self._jobs[job_id] = job
+        return job_id
+
+    def _single_result(self, target, fmt, future):
+        # Kết quả của job một định dạng: {"path", "warnings"}
+        if future.exception() is not None:
+            target.set_exception(future.exception())
+        else:
+            result = future.result()
+            target.set_result({"path": result["paths"][fmt], "warnings": result["warnings"]})
+
+    def _cache_result(self, survey_id, cache_keys, future):
+        # Lưu các báo cáo vừa tạo vào bộ nhớ đệm để lần xuất sau dùng lại (`cache_keys`: định dạng -> khóa)
+        if future.cancelled() or future.exception() is not None:
+            return
+        for fmt, path in future.result()["paths"].items():
+            cache_key = cache_keys.get(fmt)
+            if not cache_key:
+                continue
+            try:
+                with open(path, "rb") as f:
+                    get_report_cache().put(survey_id, cache_key, f.read())
+            except OSError as e:
+                logger.warning("Không thể đọc báo cáo %s: %s", path, e)
+
+    def _start_coordinated(self, job, build, *args):
+        """Chạy `build(job, *args)` ở luồng điều phối; kết quả được đặt vào job.future"""
+        job.future = Future()
+        with self._lock:
+            self._cleanup()
+            self._jobs[job.id] = job
+
+        def run():
+            if not job.future.set_running_or_notify_cancel():
+                return
+            try:
+                job.future.set_result(build(job, *args))
+            except Exception as e:
+                logger.warning("Lỗi khi xuất báo cáo (job %s): %s", job.id, e)
+                job.future.set_exception(e)
+
+        threading.Thread(target=run, daemon=True).start()
+        return job.id
+
+    def _new_job_dir(self):
+        job_id = uuid.uuid4().hex
+        directory = os.path.join(self.jobs_dir, job_id)
+        os.makedirs(directory, exist_ok=True)
+        return job_id, directory
+
+    def submit_formats(self, survey_data, formats, exported_by, survey_id=None, main_images=None):
+        """Tạo job xuất một khảo sát theo nhiều định dạng, trả về id của job.
+
+        Ảnh chỉ được tải và chuẩn bị một lần trong một job; các định dạng được tạo lần lượt
+        từ cùng báo cáo đã dựng.
+        """
+        job_id, directory = self._new_job_dir()
+        job = ExportJob(job_id, None, None, directory, survey_id)
+        return self._start_coordinated(job, self._build_formats, survey_id, survey_data, formats, exported_by, main_images)
+
+    def submit_bulk(self, surveys, formats, exported_by, zip_name):
+        """Tạo job xuất báo cáo của nhiều khảo sát vào một file ZIP, trả về id của job.
+
+        `surveys` là danh sách (survey_id, survey_data); mỗi khảo sát được xuất theo
+        từng định dạng trong `formats`.
+        """
+        job_id, directory = self._new_job_dir()
+        job = ExportJob(job_id, zip_name, "application/zip", directory)
+        return self._start_coordinated(job, self._build_bulk, surveys, formats, exported_by)
+
+    def _render_all(self, job, surveys, formats, exported_by, main_images=None):
+        """Tạo báo cáo của từng khảo sát trên process pool (các khảo sát chạy song song).
+
+        Mỗi khảo sát là một job: ảnh được chuẩn bị và báo cáo được dựng một lần, rồi các
+        định dạng được tạo lần lượt từ cùng báo cáo. Khi có nhiều khảo sát, ảnh của tất cả
+        được tải trước một lần (ảnh dùng chung chỉ tải một lần).
+        Trả về (danh sách (tên file, đường dẫn, định dạng), cảnh báo).
+        """
+        single = len(surveys) == 1
+        warnings = []
+        skip_urls = frozenset()
+        if not single:
+            # Các job tạo báo cáo đọc ảnh từ bộ nhớ đệm trên đĩa đã được tải ở bước này
+            write_progress(job.directory, 0.0, "Đang tải ảnh...")
+            urls = []
+            for _, survey_data in surveys:
+                urls.extend(report_image_urls(survey_data.get('image_urls'), survey_data.get('panel_notes')))
+            failed = self._submit_to_pool(run_prefetch_job, list(dict.fromkeys(urls))).result()
+            warnings = list(failed.values())
+            skip_urls = frozenset(failed)
+
+        # Mỗi khảo sát một job trên process pool: ảnh được chuẩn bị và báo cáo được dựng một lần
+        # cho mọi định dạng còn thiếu trong bộ nhớ đệm báo cáo
+        total = len(surveys) * len(formats)
+        entries = [None] * total
+        names = set()
+        futures = {}
+        for survey_idx, (survey_id, survey_data) in enumerate(surveys):
+            pending = []  # (vị trí trong entries, tên file, định dạng) cần tạo
+            cache_keys = {}
+            # Một khảo sát: job ghi thẳng vào thư mục của job (kể cả tiến độ tải ảnh)
+            task_dir = job.directory if single else os.path.join(job.directory, str(survey_idx))
+            os.makedirs(task_dir, exist_ok=True)
+            for fmt_idx, fmt in enumerate(formats):
+                idx = survey_idx * len(formats) + fmt_idx
+                name = report_file_name(survey_data['header'], fmt)
+                base, ext = os.path.splitext(name)
+                counter = 2
+                while name in names:
+                    name = f"{base}_{counter}{ext}"
+                    counter += 1
+                names.add(name)
+
+                # Chỉ dùng bộ nhớ đệm báo cáo cho khảo sát đã lưu (có id) và ảnh lấy từ URL
+                cache_key = None
+                if survey_id is not None and main_images is None:
+                    cache_key = report_cache_key(survey_data, fmt, exported_by)
+                cached = get_report_cache().get(cache_key) if cache_key else None
+                if cached is not None:
+                    path = os.path.join(task_dir, f"report.{REPORT_FORMATS[fmt]['extension']}")
+                    with open(path, "wb") as f:
+                        f.write(cached)
+                    entries[idx] = (name, path, fmt)
+                else:
+                    pending.append((idx, name, fmt))
+                    cache_keys[fmt] = cache_key
+            if not pending:
+                continue
+
+            future = self._submit_to_pool(
+                run_export_job, task_dir, survey_data, [fmt for _, _, fmt in pending],
+                exported_by, main_images, skip_urls
+            )
+            future.add_done_callback(lambda f, sid=survey_id, keys=cache_keys: self._cache_result(sid, keys, f))
+            futures[future] = pending
+
+        done = total - sum(len(pending) for pending in futures.values())
+        for future in as_completed(futures):
+            pending = futures[future]
+            try:
+                paths = future.result()["paths"]
+                for idx, name, fmt in pending:
+                    entries[idx] = (name, paths[fmt], fmt)
+            except Exception as e:
+                for _, name, _ in pending:
+                    warnings.append(f"Không thể tạo báo cáo {name}: {e}")
+            done += len(pending)
+            progress = BULK_IMAGE_PROGRESS_SHARE + (1 - BULK_IMAGE_PROGRESS_SHARE) * done / total
+            write_progress(job.directory, progress, f"Đang tạo báo cáo ({done}/{total})...")
+
+        entries = [entry for entry in entries if entry]
+        if not entries:
+            raise RuntimeError("Không tạo được báo cáo nào")
+        return entries, warnings
+
+    def _build_formats(self, job, survey_id, survey_data, formats, exported_by, main_images):
+        entries, warnings = self._render_all(job, [(survey_id, survey_data)], formats, exported_by, main_images)
+        files = [
+            {"path": path, "file_name": name, "mime_type": REPORT_FORMATS[fmt]["mime_type"]}
+            for name, path, fmt in entries
+        ]
+        return {"files": files, "warnings": warnings}
+
+    def _build_bulk(self, job, surveys, formats, exported_by):
+        entries, warnings = self._render_all(job, surveys, formats, exported_by)
+
+        # PDF/DOCX đã được nén sẵn: chỉ lưu (ZIP_STORED), chép từng khối để không giữ cả file trong bộ nhớ
+        path = os.path.join(job.directory, job.file_name)
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as archive:
+            for name, report_path, _ in entries:
+                with open(report_path, "rb") as src, archive.open(name, "w", force_zip64=True) as dst:
+                    shutil.copyfileobj(src, dst, ZIP_CHUNK_SIZE)
+                # Các định dạng của một khảo sát nằm chung thư mục: chỉ xóa file đã chép
+                os.remove(report_path)
+        return {"path": path, "warnings": warnings}
+
+    def read_progress(self, job):
+        try:
+            with open(os.path.join(job.directory, PROGRESS_FILE), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"progress": 0.0, "message": "Đang chờ xử lý..."}
+
+    def status(self, job_id):
+        """Trạng thái job: dict với status (queued/running/done/failed), progress, message,
+        files (danh sách dict path, file_name, mime_type), warnings, error; None nếu không tìm thấy job"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return None
+
+        status = {
+            "status": "queued",
+            "progress": 0.0,
+            "message": "Đang chờ xử lý...",
+            "files": [],
+            "warnings": [],
+            "error": None
+        }
+        result = job.result
+        if result is None and job.future.done():
+            try:
+                result = job.future.result()
+            except Exception as e:
+                status.update(status="failed", error=str(e) or type(e).__name__)
+                return status
+        if result is not None:
+            files = result.get("files") or [
+                {"path": result["path"], "file_name": job.file_name, "mime_type": job.mime_type}
+            ]
+            status.update(status="done", progress=1.0, message="Hoàn tất", files=files, warnings=result["warnings"])
+            return status
+
+        progress = self.read_progress(job)
+        if job.future.running() or progress["progress"] > 0:
+            status["status"] = "running"
+        status.update(progress=progress["progress"], message=progress["message"])
+        return status
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_export_jobs():
+    """Bộ quản lý job xuất báo cáo dùng chung của tiến trình"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ExportJobManager()
+        return _manager
+
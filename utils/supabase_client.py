@@ -0,0 +1,124 @@
+# --- Quản lý kết nối Supabase dùng chung cho toàn bộ tiến trình ---
+import logging
+import threading
+
+import streamlit as st
+from supabase import create_client
+
+logger = logging.getLogger(__name__)
+
+# Chu kỳ kiểm tra kết nối chạy nền (giây)
+HEALTH_CHECK_TTL = 60
+# Thời gian chờ tối đa giữa các lần thử kết nối lại sau lỗi (giây)
+MAX_RECONNECT_DELAY = 300
+
+
+class SupabaseConnectionManager:
+    """Giữ một Supabase client cho mỗi tiến trình, kiểm tra kết nối ở luồng nền"""
+
+    def __init__(self, url, key, health_check_ttl=HEALTH_CHECK_TTL):
+        self.url = url
+        self.key = key
+        self.health_check_ttl = health_check_ttl
+        self._lock = threading.Lock()
+        self._client = None
+        self._healthy = None  # None = chưa kiểm tra lần nào
+        self._last_error = None
+        self._stop_event = threading.Event()
+        self._monitor = None
+
+    @property
+    def healthy(self):
+        return self._healthy
+
+    @property
+    def last_error(self):
+        return self._last_error
+
+    def get_client(self):
+        """Trả về client dùng chung, tạo mới nếu chưa có"""
+        with self._lock:
+            if self._client is None:
+                self._client = create_client(self.url, self.key)
+            client = self._client
+            if self._monitor is None or not self._monitor.is_alive():
+                self._monitor = threading.Thread(
+                    target=self._run_health_checks,
+                    name="supabase-health-check",
+                    daemon=True
+                )
+                self._monitor.start()
+        return client
+
+    def reconnect(self):
+        """Tạo lại client (dùng khi kiểm tra kết nối thất bại)"""
+        client = create_client(self.url, self.key)
+        with self._lock:
+            self._client = client
+        return client
+
+    def check_health(self):
+        """Gửi một truy vấn nhỏ để xác minh kết nối, tự kết nối lại nếu lỗi"""
+        with self._lock:
+            client = self._client
+        try:
+            if client is None:
+                client = self.reconnect()
+            client.table('surveys').select('id').limit(1).execute()
+            self._healthy = True
+            self._last_error = None
+        except Exception as e:
+            logger.warning("Kiểm tra kết nối Supabase thất bại: %s", e)
+            self._healthy = False
+            self._last_error = e
+            try:
+                self.reconnect()
+            except Exception as reconnect_error:
+                logger.warning("Không thể kết nối lại Supabase: %s", reconnect_error)
+        return self._healthy
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run_health_checks(self):
+        delay = 0
+        while not self._stop_event.wait(delay):
+            if self.check_health():
+                delay = self.health_check_ttl
+            else:
+                # Thử lại sớm hơn sau lỗi, giãn dần đến MAX_RECONNECT_DELAY
+                delay = min(max(delay * 2, 5), MAX_RECONNECT_DELAY)
+
+
+@st.cache_resource(show_spinner=False)
+def get_connection_manager(url, key):
+    """Một connection manager cho mỗi cặp (url, key) trong tiến trình"""
+    return SupabaseConnectionManager(url, key)
+
+
+def init_supabase():
+    """Lấy Supabase client dùng chung (không truy vấn kiểm tra mỗi lần rerun)"""
+    try:
+        if "supabase" not in st.secrets:
+            st.error("🔑 Không tìm thấy cấu hình Supabase!")
+            return None
+
+        url = st.secrets["supabase"]["url"]
+        key = st.secrets["supabase"]["key"]
+
+        if not url or not key:
+            st.error("🔑 URL hoặc key Supabase không hợp lệ!")
+            return None
+
+        manager = get_connection_manager(url, key)
+        client = manager.get_client()
+
+        # Lần kiểm tra nền gần nhất thất bại: client đang được kết nối lại
+        if manager.healthy is False:
+            st.warning(f"⚠️ Kết nối đến Supabase đang gặp sự cố, đang thử kết nối lại: {manager.last_error}")
+
+        return client
+
+    except Exception as e:
+        st.error(f"❌ Không thể kết nối đến Supabase: {e}")
+        return None
@@ -0,0 +1,71 @@
+# --- Bộ lọc kết hợp (ngày khảo sát, người tạo, công ty, có ảnh) cho danh sách khảo sát ---
+import unicodedata
+
+import streamlit as st
+
+from utils.pagination import escape_like
+from utils.query_cache import get_query_cache
+
+# Lựa chọn lọc theo ảnh -> giá trị của bộ lọc has_images
+IMAGE_FILTER_OPTIONS = {"Tất cả": None, "Có ảnh": True, "Không có ảnh": False}
+
+
+def unaccent(value):
+    """Bỏ dấu tiếng Việt giống f_unaccent trên máy chủ ("Đà Nẵng" -> "Da Nang")"""
+    value = unicodedata.normalize('NFD', value).replace('đ', 'd').replace('Đ', 'D')
+    return ''.join(ch for ch in value if not unicodedata.combining(ch))
+
+
+def get_creators(supabase):
+    """Danh sách (id, họ tên) người dùng để chọn người tạo"""
+    return get_query_cache().get_or_load(
+        ("creators",),
+        lambda: supabase.table('users').select('id, full_name').order('full_name').execute().data or []
+    )
+
+
+def show_survey_filters(supabase, key, can_filter_creator):
+    """Bộ lọc danh sách khảo sát; trả về tuple (ngày từ, ngày đến, người tạo, công ty, có ảnh).
+
+    Tuple dùng được làm khóa bộ nhớ đệm và chữ ký phân trang.
+    """
+    with st.expander("🔎 Bộ lọc", expanded=False):
+        col1, col2 = st.columns(2)
+        with col1:
+            company = st.text_input("Công ty:", key=f"{key}_filter_company").strip()
+            date_range = st.date_input("Ngày khảo sát (từ - đến):", value=(), key=f"{key}_filter_dates")
+        with col2:
+            created_by = None
+            if can_filter_creator:
+                creators = {row['id']: row['full_name'] for row in get_creators(supabase)}
+                created_by = st.selectbox(
+                    "Người tạo:",
+                    [None] + list(creators),
+                    format_func=lambda x: "Tất cả" if x is None else creators[x],
+                    key=f"{key}_filter_creator"
+                )
+            image_choice = st.radio("Ảnh:", list(IMAGE_FILTER_OPTIONS), horizontal=True, key=f"{key}_filter_images")
+
+    # Chỉ chọn một ngày: lọc đúng ngày đó
+    date_from = str(date_range[0]) if len(date_range) >= 1 else None
+    date_to = str(date_range[-1]) if len(date_range) >= 1 else None
+    return date_from, date_to, created_by, company or None, IMAGE_FILTER_OPTIONS[image_choice]
+
+
+def apply_survey_filters(query, filters):
+    """Thêm điều kiện của bộ lọc vào truy vấn survey_summary (một truy vấn duy nhất trên máy chủ)"""
+    date_from, date_to, created_by, company, has_images = filters
+    if date_from:
+        query = query.gte('survey_date', date_from)
+    if date_to:
+        query = query.lte('survey_date', date_to)
+    if created_by:
+        query = query.eq('created_by', created_by)
+    if company:
+        # So khớp trên company_name_unaccent (= f_unaccent(company_name)) để dùng chỉ mục trigram
+        query = query.ilike('company_name_unaccent', f"%{escape_like(unaccent(company))}%")
+    if has_images is True:
+        query = query.gt('image_count', 0)
+    elif has_images is False:
+        query = query.eq('image_count', 0)
+    return query
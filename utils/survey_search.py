@@ -0,0 +1,56 @@
+# --- Tìm kiếm toàn văn (không phân biệt dấu) trên khảo sát và panel notes ---
+import logging
+
+from postgrest.exceptions import APIError
+
+from utils.pagination import add_param, escape_like, fetch_page, row_cursor
+from utils.survey_store import RPC_NOT_FOUND_CODE
+
+logger = logging.getLogger(__name__)
+
+# Các cột của survey_summary được dò khi chưa có hàm search_surveys
+FALLBACK_SEARCH_FIELDS = ["company_name", "area", "device", "findings"]
+
+
+def search_cursor(row):
+    """Vị trí của một kết quả: (rank, id) khi tìm bằng RPC, (created_at, id) khi tìm bằng ilike"""
+    if row.get('rank') is not None:
+        return row['rank'], row['id']
+    return row_cursor(row)
+
+
+def search_surveys(supabase, term, summary_columns, created_by=None, cursor=None, page_size=20):
+    """Một trang kết quả tìm kiếm `term`, liên quan nhất trước; trả về (danh sách dòng, còn trang sau hay không).
+
+    Mỗi dòng có các cột của survey_summary cùng `rank` và đoạn trích `headline` (từ khóa trong «…»).
+    Nếu cơ sở dữ liệu chưa có hàm `search_surveys` thì quay về tìm ilike trên survey_summary.
+    """
+    params = {
+        "p_query": term,
+        "p_created_by": created_by,
+        # Lấy thêm một dòng để biết còn trang sau
+        "p_limit": page_size + 1
+    }
+    if cursor:
+        rank, params["p_after_id"] = cursor
+        # rank đã được làm tròn 6 chữ số trên máy chủ: gửi lại đúng giá trị đó dưới dạng chuỗi thập phân
+        params["p_after_rank"] = f"{rank:.6f}"
+    try:
+        rows = supabase.rpc('search_surveys', params).execute().data or []
+    except APIError as e:
+        if e.code != RPC_NOT_FOUND_CODE:
+            raise
+        logger.warning("Chưa có hàm search_surveys trên Supabase, tìm bằng ilike")
+        return search_surveys_ilike(supabase, term, summary_columns, created_by, cursor, page_size)
+    return rows[:page_size], len(rows) > page_size
+
+
+def search_surveys_ilike(supabase, term, summary_columns, created_by=None, cursor=None, page_size=20):
+    """Tìm `term` (phân biệt dấu) trong các trường của survey_summary, mới nhất trước"""
+    # Đặt giá trị trong ngoặc kép để dấu phẩy/ngoặc trong từ khóa không làm hỏng bộ lọc
+    pattern = '"*' + escape_like(term).replace('\\', '\\\\').replace('"', '\\"') + '*"'
+    query = supabase.table('survey_summary').select(summary_columns)
+    add_param(query, "or", "(" + ",".join(f"{field}.ilike.{pattern}" for field in FALLBACK_SEARCH_FIELDS) + ")")
+    if created_by:
+        query = query.eq('created_by', created_by)
+    return fetch_page(query, cursor, page_size)
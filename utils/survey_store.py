@@ -0,0 +1,169 @@
+# --- Truy cập dữ liệu khảo sát trên Supabase ---
+import copy
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from postgrest.exceptions import APIError
+
+from utils.invalidation import on_survey_changed
+from utils.panel_notes import build_note_row, save_panel_notes
+
+logger = logging.getLogger(__name__)
+
+# Mã lỗi PostgREST khi hàm RPC chưa tồn tại (chưa chạy migration)
+RPC_NOT_FOUND_CODE = "PGRST202"
+# Mã lỗi Postgres khi không đủ quyền (do hàm save_survey trả về)
+INSUFFICIENT_PRIVILEGE_CODE = "42501"
+# Thời gian giữ (giây) và số chi tiết khảo sát tối đa trong bộ nhớ đệm (có thể đổi bằng biến môi trường)
+SURVEY_DETAIL_CACHE_TTL = float(os.environ.get("GETNOTES_SURVEY_DETAIL_CACHE_TTL", 60))
+SURVEY_DETAIL_CACHE_MAX_ENTRIES = int(os.environ.get("GETNOTES_SURVEY_DETAIL_CACHE_MAX_ENTRIES", 64))
+# Khảo sát kèm panel notes theo thứ tự trong một request
+SURVEY_DETAIL_SELECT = '*, panel_notes(*)'
+
+
+class SurveyPermissionError(Exception):
+    """Người dùng không có quyền thao tác trên khảo sát"""
+
+
+def save_survey(supabase, user, survey_data, panel_notes, survey_id=None):
+    """Lưu khảo sát và panel notes bằng một lời gọi RPC `save_survey`, trả về id.
+
+    Nếu cơ sở dữ liệu chưa có hàm `save_survey` thì quay về cách lưu nhiều request.
+    """
+    payload = {
+        "survey_id": survey_id,
+        "user_id": user["id"],
+        "survey": survey_data,
+        "panel_notes": [
+            build_note_row(note, survey_id, user["id"], position)
+            for position, note in enumerate(panel_notes or [])
+        ]
+    }
+    try:
+        response = supabase.rpc('save_survey', {'payload': payload}).execute()
+    except APIError as e:
+        if e.code == INSUFFICIENT_PRIVILEGE_CODE:
+            raise SurveyPermissionError(e.message) from e
+        if e.code != RPC_NOT_FOUND_CODE:
+            raise
+        logger.warning("Chưa có hàm save_survey trên Supabase, lưu bằng nhiều request")
+        return save_survey_multi_request(supabase, user, survey_data, panel_notes, survey_id)
+
+    return response.data["id"] if response.data else None
+
+
+def save_survey_multi_request(supabase, user, survey_data, panel_notes, survey_id=None):
+    """Lưu khảo sát bằng các request PostgREST riêng lẻ (không có transaction)"""
+    if survey_id:
+        # Kiểm tra quyền nếu không phải admin
+        if user["role"] != "admin":
+            response = supabase.table('surveys').select('created_by').eq('id', survey_id).execute()
+            if not response.data or response.data[0]["created_by"] != user["id"]:
+                raise SurveyPermissionError("Bạn không có quyền chỉnh sửa khảo sát này!")
+
+        response = supabase.table('surveys').update(survey_data).eq('id', survey_id).execute()
+        is_new_survey = False
+    else:
+        # Người tạo chỉ được ghi khi thêm mới, chỉnh sửa không đổi chủ khảo sát
+        response = supabase.table('surveys').insert(dict(survey_data, created_by=user["id"])).execute()
+        is_new_survey = True
+
+    if not response.data:
+        return None
+
+    survey_id = response.data[0].get('id')
+    # Lưu các panel notes (chỉ gửi các note thêm/sửa/xóa khi chỉnh sửa)
+    note_rows = [
+        build_note_row(note, survey_id, user["id"], position)
+        for position, note in enumerate(panel_notes or [])
+    ]
+    save_panel_notes(supabase, survey_id, note_rows, is_new_survey)
+    return survey_id
+
+
+def fetch_surveys(supabase, survey_ids):
+    """Các khảo sát kèm `panel_notes` (theo position) trong một request, theo id"""
+    response = (
+        supabase.table('surveys')
+        .select(SURVEY_DETAIL_SELECT)
+        .in_('id', survey_ids)
+        .order('position', foreign_table='panel_notes')
+        .execute()
+    )
+    return {survey['id']: survey for survey in response.data or []}
+
+
+class SurveyDetailCache:
+    """Chi tiết khảo sát đã tải theo (người dùng, id, phiên bản), hết hạn sau `ttl` giây.
+
+    Phiên bản tăng mỗi khi khảo sát được lưu hoặc xóa trong tiến trình này; TTL giới hạn
+    thời gian dữ liệu cũ còn được dùng khi khảo sát bị sửa ở tiến trình/máy chủ khác.
+    """
+
+    def __init__(self, ttl=SURVEY_DETAIL_CACHE_TTL, max_entries=SURVEY_DETAIL_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._versions = {}  # id -> phiên bản
+        self._entries = OrderedDict()  # (người dùng, id, phiên bản) -> (thời điểm hết hạn, khảo sát)
+
+    def get_or_load(self, user_id, survey_id, load):
+        """Bản sao chi tiết của `survey_id` cho `user_id`, gọi `load()` nếu chưa có hoặc đã hết hạn"""
+        survey_id = str(survey_id)
+        now = time.monotonic()
+        with self._lock:
+            key = (user_id, survey_id, self._versions.get(survey_id, 0))
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                return copy.deepcopy(entry[1])
+
+        survey = load()
+        if survey is None:
+            return None
+        with self._lock:
+            # Khảo sát đã thay đổi trong lúc tải thì không lưu kết quả cũ
+            if key[2] == self._versions.get(survey_id, 0):
+                self._entries[key] = (now + self.ttl, survey)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        # Người gọi có thể sửa dữ liệu, không trả về bản trong bộ nhớ đệm
+        return copy.deepcopy(survey)
+
+    def invalidate(self, survey_id):
+        survey_id = str(survey_id)
+        with self._lock:
+            self._versions[survey_id] = self._versions.get(survey_id, 0) + 1
+            for key in [k for k in self._entries if k[1] == survey_id]:
+                del self._entries[key]
+
+
+_detail_cache = None
+_detail_cache_lock = threading.Lock()
+
+
+def get_survey_detail_cache():
+    """Bộ nhớ đệm chi tiết khảo sát dùng chung của tiến trình"""
+    global _detail_cache
+    with _detail_cache_lock:
+        if _detail_cache is None:
+            _detail_cache = SurveyDetailCache()
+            on_survey_changed(_detail_cache.invalidate)
+        return _detail_cache
+
+
+def fetch_survey(supabase, survey_id):
+    """Khảo sát `survey_id` kèm danh sách `panel_notes` theo thứ tự, đọc trực tiếp từ Supabase; None nếu không tồn tại"""
+    return next(iter(fetch_surveys(supabase, [survey_id]).values()), None)
+
+
+def load_survey(supabase, survey_id, user_id):
+    """Như fetch_survey nhưng dùng lại kết quả của `user_id` trong tối đa SURVEY_DETAIL_CACHE_TTL giây.
+
+    Chỉ dùng để xem/xuất; form chỉnh sửa luôn đọc bằng fetch_survey.
+    """
+    return get_survey_detail_cache().get_or_load(user_id, survey_id, lambda: fetch_survey(supabase, survey_id))